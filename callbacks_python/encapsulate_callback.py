@@ -1,36 +1,164 @@
 # This file is necessary when trying to interface C code with python callbacks to keep alive objects that hold python callbacks
+#
+# Each registration returns a CallbackHandle holding the ctypes trampoline given
+# to the C code. The trampoline is kept alive until the handle is released,
+# which must happen when the C code drops the callback (one shot callback
+# called, callbacks removed...). The C code may still be calling a callback
+# it has just dropped (the dispatch round that took it is in progress), so a
+# released trampoline is only freed once the Dispatcher of the C code tells
+# that all the rounds started before the release are finished. Without a
+# Dispatcher, a released trampoline is never freed.
 
 import ctypes
+from threading import Lock
 
 
-mapped_callbacks = {}
+CALLBACK_TYPE = ctypes.CFUNCTYPE(None)
+
+mutex = Lock()
+mapped_callbacks = {}       # index -> live CallbackHandle
+released_callbacks = []     # released CallbackHandle waiting to be freed
 counter = 0
 
 
-def call_and_delete(index, callback):
-    global mapped_callbacks
-    callback()
-    del mapped_callbacks[index]
+class Dispatcher:
+    """
+    Dispatch rounds of the C code calling the callbacks
+    started() returns the number of rounds started, read under the lock that
+    protects the callbacks of the C code; finished() the number of the last
+    finished round. The rounds must finish in order.
+    """
+    def __init__(self, started, finished):
+        self.started = lambda: int(started())
+        self.finished = lambda: int(finished())
 
-def encapsulate_callback(callback, one_shot=False):
-    global mapped_callbacks
-    global counter
 
-    counter += 1
-    local_index = counter
-    if one_shot:
-        lambda_remove_ref = lambda: call_and_delete(local_index, callback)
-        mapped_callbacks[counter] = ctypes.CFUNCTYPE(None)(lambda_remove_ref)
-    else:
-        mapped_callbacks[counter] = ctypes.CFUNCTYPE(None)(callback)
+class CallbackHandle:
+    """
+    A python callback registered for the C code
+    """
+    def __init__(self, index, callback, one_shot, dispatcher):
+        self.index = index
+        self.callback = callback
+        self.one_shot = one_shot
+        self.dispatcher = dispatcher
+        self.released = False
+        #last dispatch round which may call the callback after its release
+        self.round = None
+        if one_shot:
+            self.trampoline = CALLBACK_TYPE(self.private_call_and_release)
+        else:
+            self.trampoline = CALLBACK_TYPE(callback)
 
-    return mapped_callbacks[counter]
+    def private_call_and_release(self):
+        try:
+            self.callback()
+        finally:
+            self.release()
 
+    def release(self):
+        """
+        to be called when the C code does not hold the callback anymore
+        """
+        release(self)
 
-def clear_all():
-    global mapped_callbacks
+
+def private_reclaim():
+    """
+    frees the trampolines that the C code cannot call anymore; mutex must be
+    acquired
+    """
+    global released_callbacks
+    if not released_callbacks:
+        return
+    finished = {}
+    kept = []
+    for handle in released_callbacks:
+        dispatcher = handle.dispatcher
+        if dispatcher is None:
+            kept.append(handle)
+            continue
+        if not dispatcher in finished:
+            finished[dispatcher] = dispatcher.finished()
+        if finished[dispatcher] < handle.round:
+            kept.append(handle)
+    released_callbacks = kept
+
+def register_callback(callback, one_shot=False, dispatcher=None):
+    """
+    returns a CallbackHandle whose trampoline can be given to the C code
+    if one_shot is True, the handle is released after the first call
+    dispatcher is the Dispatcher of the C code calling the trampoline
+    """
     global counter
+    with mutex:
+        private_reclaim()
+        counter += 1
+        handle = CallbackHandle(counter, callback, one_shot, dispatcher)
+        mapped_callbacks[counter] = handle
+    return handle
+
+def release(handle):
+    """
+    to be called after the C code has dropped the callback
+    """
+    #read before the mutex: started() takes the lock of the C code
+    last_round = handle.dispatcher.started() if not handle.dispatcher is None else None
+    with mutex:
+        if handle.released:
+            return
+        handle.released = True
+        handle.round = last_round
+        del mapped_callbacks[handle.index]
+        private_reclaim()
+        released_callbacks.append(handle)
+
+def reclaim():
+    """
+    frees the released trampolines that the C code cannot call anymore
+    (also done by register_callback and release)
+    """
+    with mutex:
+        private_reclaim()
 
-    del mapped_callbacks
-    counter = 0
-    mapped_callbacks = {}
+def encapsulate_callback(callback, one_shot=False):
+    """
+    same as register_callback, but returns the trampoline directly
+    """
+    return register_callback(callback, one_shot).trampoline
+
+
+def live_count():
+    """
+    number of registered callbacks that have not been released
+    """
+    with mutex:
+        return len(mapped_callbacks)
+
+def pending_count():
+    """
+    number of released callbacks whose trampolines are not freed yet
+    """
+    with mutex:
+        private_reclaim()
+        return len(released_callbacks)
+
+
+def clear_all():
+    """
+    releases all the callbacks; the C code must not call them anymore
+    """
+    with mutex:
+        handles = list(mapped_callbacks.values())
+    rounds = {}
+    for handle in handles:
+        if not handle.dispatcher is None and not handle.dispatcher in rounds:
+            rounds[handle.dispatcher] = handle.dispatcher.started()
+    with mutex:
+        for handle in handles:
+            if handle.released:
+                continue
+            handle.released = True
+            handle.round = rounds.get(handle.dispatcher)
+            del mapped_callbacks[handle.index]
+            released_callbacks.append(handle)
@@ -12,18 +12,20 @@ def common_callback(index, time):
 	print("Callback with index", index, "reached after a", time, "seconds delay")
 
 def timer_launch(time, index, lib):
-	return lib.call_after_delay(ctypes.c_float(time), encapsulate_callback(lambda: common_callback(index, time), True))
+	return lib.timer_schedule(ctypes.c_double(time), ctypes.c_double(0), encapsulate_callback(lambda: common_callback(index, time), True))
 
-#lib = ctypes.cdll.LoadLibrary("/home/pi/robot-framework/callbacks_python/tests/timer_callbacks_test.so")
-lib = ctypes.cdll.LoadLibrary("./timer_callbacks_test.so")
+lib = ctypes.cdll.LoadLibrary("./libtimer_service.so")
 
 n_callbacks = 20
 
-for i in range(n_callbacks):
-	timer_launch(float(random.randint(10,1000)/50.0), i, lib)
+ids = [timer_launch(float(random.randint(10,1000)/50.0), i, lib) for i in range(n_callbacks)]
 
-while int(lib.empty_queue_callback()) == 0:
-	print(lib.done_callbacks())
+#the last timers are cancelled
+for id in ids[n_callbacks // 2:]:
+	lib.timer_cancel(ctypes.c_int(id))
+
+while int(lib.timer_pending()) > 0:
+	print(lib.timer_pending(), "timers pending")
 	time.sleep(0.5)
 
-lib.join()
+lib.timer_join()
@@ -0,0 +1,189 @@
+#include <condition_variable>
+#include <atomic>
+#include <functional>
+#include <iostream>
+#include <vector>
+#include <thread>
+#include <chrono>
+#include <mutex>
+#include <queue>
+#include <map>
+
+
+typedef void (*c_fct_ptr)(void);
+typedef std::chrono::steady_clock timer_clock;
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+	int timer_schedule(double delay, double period, c_fct_ptr callback);
+	int timer_cancel(int id);
+	int timer_pending();
+	void timer_join();
+	unsigned long long timer_rounds_started();
+	unsigned long long timer_rounds_finished();
+
+#ifdef __cplusplus
+}
+#endif
+
+
+struct Timer
+{
+	c_fct_ptr callback;
+	timer_clock::duration period; // zero for a one shot timer
+	timer_clock::time_point deadline;
+};
+
+struct HeapEntry
+{
+	timer_clock::time_point deadline;
+	int id;
+
+	bool operator>(const HeapEntry& other) const
+	{return deadline > other.deadline || (deadline == other.deadline && id > other.id);}
+};
+
+
+// The heap contains the deadlines of the timers. A cancelled timer is only
+// removed from the map; its heap entry is dropped when it reaches the top,
+// or when the heap is rebuilt because most of its entries are cancelled.
+bool is_running = false;
+std::mutex main_mutex;
+std::condition_variable condition;
+std::thread main_thread;
+int last_id = 0;
+std::map<int, Timer> timers;
+std::priority_queue<HeapEntry, std::vector<HeapEntry>, std::greater<HeapEntry> > heap;
+
+// A round takes the callback of an expired timer under main_mutex, then calls
+// it. A periodic timer cancelled during its round is still being called, so
+// the python side only frees its trampoline once all the rounds started before
+// the cancellation are finished (see encapsulate_callback.py).
+unsigned long long rounds_started = 0;              // under main_mutex
+std::atomic<unsigned long long> rounds_finished(0);
+
+
+void rebuild_heap()
+{
+	std::vector<HeapEntry> entries;
+	for(std::map<int, Timer>::iterator it = timers.begin(); it != timers.end(); it++)
+		entries.push_back(HeapEntry{it->second.deadline, it->first});
+	heap = std::priority_queue<HeapEntry, std::vector<HeapEntry>, std::greater<HeapEntry> >(
+		std::greater<HeapEntry>(), std::move(entries));
+}
+
+void run()
+{
+	std::cout<<"[+] Starting timer thread"<<std::endl;
+
+	std::unique_lock<std::mutex> lock(main_mutex);
+	while(is_running)
+	{
+		if(heap.empty())
+		{
+			condition.wait(lock);
+			continue;
+		}
+
+		HeapEntry next = heap.top();
+		std::map<int, Timer>::iterator it = timers.find(next.id);
+		if(it == timers.end() || it->second.deadline != next.deadline)
+		{
+			// cancelled
+			heap.pop();
+			continue;
+		}
+
+		if(timer_clock::now() < next.deadline)
+		{
+			// woken up by a new timer, a cancellation or the deadline
+			condition.wait_until(lock, next.deadline);
+			continue;
+		}
+
+		heap.pop();
+		c_fct_ptr callback = it->second.callback;
+		if(it->second.period != timer_clock::duration::zero())
+		{
+			// the next deadline does not depend on the duration of the callback
+			it->second.deadline += it->second.period;
+			heap.push(HeapEntry{it->second.deadline, next.id});
+		}
+		else
+			timers.erase(it);
+		unsigned long long round = ++rounds_started;
+
+		lock.unlock();
+		callback();
+		rounds_finished = round;
+		lock.lock();
+	}
+}
+
+int timer_schedule(double delay, double period, c_fct_ptr callback)
+{
+	std::lock_guard<std::mutex> lock(main_mutex);
+
+	if(!main_thread.joinable())
+	{
+		is_running = true;
+		main_thread = std::thread(run);
+	}
+
+	Timer timer;
+	timer.callback = callback;
+	timer.period = std::chrono::duration_cast<timer_clock::duration>(
+		std::chrono::duration<double>(period > 0 ? period : 0));
+	timer.deadline = timer_clock::now() + std::chrono::duration_cast<timer_clock::duration>(
+		std::chrono::duration<double>(delay > 0 ? delay : 0));
+
+	int id = ++last_id;
+	timers[id] = timer;
+	heap.push(HeapEntry{timer.deadline, id});
+	condition.notify_one();
+
+	return id;
+}
+
+int timer_cancel(int id)
+{
+	std::lock_guard<std::mutex> lock(main_mutex);
+
+	if(!timers.erase(id))
+		return 0;
+
+	if(heap.size() > 2 * timers.size() + 64)
+		rebuild_heap();
+	condition.notify_one();
+	return 1;
+}
+
+int timer_pending()
+{
+	std::lock_guard<std::mutex> lock(main_mutex);
+	return timers.size();
+}
+
+unsigned long long timer_rounds_started()
+{
+	std::lock_guard<std::mutex> lock(main_mutex);
+	return rounds_started;
+}
+
+unsigned long long timer_rounds_finished()
+{return rounds_finished;}
+
+void timer_join()
+{
+	std::cout<<"[...] Joining timer thread"<<std::endl;
+	{
+		std::lock_guard<std::mutex> lock(main_mutex);
+		is_running = false;
+		condition.notify_one();
+	}
+	if(main_thread.joinable())
+		main_thread.join();
+	std::cout<<"[+] Timer thread joined"<<std::endl;
+}
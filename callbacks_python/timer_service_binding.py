@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+# Native timer service: all the timers are handled by one C++ thread, which
+# sleeps until the next deadline (monotonic clock)
+
+
+import ctypes
+from threading import Lock
+from encapsulate_callback import register_callback, Dispatcher
+
+lib_timer = ctypes.cdll.LoadLibrary(LIBNAME)
+
+lib_timer.timer_schedule.restype = ctypes.c_int
+lib_timer.timer_cancel.restype = ctypes.c_int
+lib_timer.timer_pending.restype = ctypes.c_int
+lib_timer.timer_join.restype = None
+lib_timer.timer_rounds_started.restype = ctypes.c_ulonglong
+lib_timer.timer_rounds_finished.restype = ctypes.c_ulonglong
+
+#a cancelled periodic timer may still be running in the timer thread: its
+#callback is freed once the timer thread has returned from it
+dispatcher = Dispatcher(lib_timer.timer_rounds_started, lib_timer.timer_rounds_finished)
+
+
+class NativeTimer:
+    """
+    A callback scheduled by call_later, which can be cancelled
+    """
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self.id = None
+        self.cancelled = False
+        self.mutex = Lock()
+
+    def private_run(self):
+        if not self.cancelled:
+            self.function(*self.args)
+
+    def cancel(self):
+        with self.mutex:
+            if self.cancelled:
+                return
+            self.cancelled = True
+        if lib_timer.timer_cancel(ctypes.c_int(self.id)):
+            self.handle.release()
+
+
+def call_later(delay, function, args = (), period = None):
+    """
+    calls function(*args) after delay seconds, then every period seconds if
+    period is given, in the timer thread
+    """
+    assert (callable(function))
+
+    timer = NativeTimer(function, args)
+    #a one shot callback releases itself when it is called
+    timer.handle = register_callback(timer.private_run, one_shot = period is None,
+                                     dispatcher = dispatcher)
+    timer.id = int(lib_timer.timer_schedule(ctypes.c_double(delay),
+                                            ctypes.c_double(period or 0), timer.handle.trampoline))
+    return timer
+
+def pending():
+    """
+    number of timers that have not expired or been cancelled
+    """
+    return int(lib_timer.timer_pending())
+
+def join():
+    lib_timer.timer_join()
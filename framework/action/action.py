@@ -1,9 +1,18 @@
-from threading import Thread, Condition, Lock
-from AX12 import AX12
+from threading import Condition, Lock
 import time, json
-from typing import Iterable
 
-debug = True
+import clock
+import cancellation
+import lazy_import
+import tracing
+import trajectory
+import worker_pool
+
+#only used by the asyncio versions of exec, imported on their first call
+asyncio = lazy_import.LazyModule("asyncio")
+
+#prints the execution of the sequences; tracing.py records it with timings at a lower cost
+debug = False
 
 class Action:
     '''
@@ -21,20 +30,127 @@ class Action:
         # Conditional variable : an object that allows a thread to wait for an event
         # from another thread. Used to wait for actions to end.
         self.done_condvar = Condition()
+        # Set when the action is run by a Scheduler (see scheduler.py)
+        self.scheduler = None
+        # Used by the scheduler to continue a sequence once a waited action is over
+        self.resume = None
+        self.timeout_timer = None
+        # Functions called when the action is over or cancelled (used by exec_async)
+        self.end_listeners = []
+        # Cancellation token given to exec, see get_token
+        self.token = None
+        self.watched_token = None
+        self.token_hook = None
+        self.cancelled = False
 
     def private_callback(self):
         '''
         This function is called when the action is finished.
+        When the action is run by a scheduler, a callback coming from another
+        thread only posts a completion event to the scheduler thread.
         '''
+        if not (self.scheduler is None or self.scheduler.is_current_thread()):
+            self.scheduler.post(self.private_callback)
+            return
+
         self.done_condvar.acquire()
+        if self.cancelled:
+            #late callback of a cancelled (or timed out) action: its sequence
+            #has already been told by element_cancel
+            self.done_condvar.release()
+            return
         self.done = True
         self.done_condvar.notify()
+        self.private_unwatch_token()
+        if tracing.enabled:
+            tracing.record(tracing.END, self)
         if not self.callback is None:
             self.callback()
         if not self.parent_sequence is None:
             self.parent_sequence.element_callback()
         self.done_condvar.release()
 
+        self.private_notify_end()
+        if not self.scheduler is None:
+            self.scheduler.action_done(self)
+
+    def private_notify_end(self):
+        for listener in self.end_listeners:
+            listener()
+
+    def get_token(self) -> cancellation.CancellationToken:
+        '''
+        The cancellation token of the action: the one given to exec, or else the
+        one of its sequence, or else the root token (cancelled by Robot.stop).
+        '''
+        if not self.token is None:
+            return self.token
+        if not self.parent_sequence is None:
+            return self.parent_sequence.get_token()
+        return cancellation.get_root_token()
+
+    def private_begin(self) -> bool:
+        '''
+        Called when the action starts.
+        Returns False if its token is already cancelled, the action must not start.
+        '''
+        if not self.private_watch_token():
+            return False
+        if tracing.enabled:
+            tracing.record(tracing.START, self)
+        return True
+
+    def private_watch_token(self) -> bool:
+        '''
+        Registers the cancel hook of the action on its token until it is over.
+        Returns False if the token is already cancelled, the action must not start.
+        '''
+        token = self.get_token()
+        if not self.callback is None:
+            self.watched_token = token
+            self.token_hook = token.register(self.private_cancel_by_token)
+            return not self.token_hook is None
+        return not token.is_cancelled()
+
+    def private_unwatch_token(self):
+        if not self.watched_token is None:
+            self.watched_token.unregister(self.token_hook)
+            self.watched_token = None
+
+    def private_cancel_by_token(self):
+        if not (self.scheduler is None or self.scheduler.is_current_thread()):
+            self.scheduler.post(self.scheduler.cancel_action, (self,))
+            return
+        self.private_cancel()
+
+    def private_cancel(self) -> bool:
+        '''
+        Calls cancel_exec if the action is neither over nor already cancelled,
+        and wakes up the threads waiting for it.
+        '''
+        with self.done_condvar:
+            if self.done or self.cancelled:
+                return False
+            self.cancelled = True
+        self.private_unwatch_token()
+        if tracing.enabled:
+            tracing.record(tracing.CANCEL, self, self.get_token().reason)
+        try:
+            self.cancel_exec()
+        finally:
+            with self.done_condvar:
+                self.done_condvar.notify_all()
+        return True
+
+    def is_cancelled(self) -> bool:
+        return self.cancelled or self.get_token().is_cancelled()
+
+    def is_over(self) -> bool:
+        '''
+        True once the action is done or cancelled, or its token is cancelled
+        '''
+        return self.done or self.is_cancelled()
+
     def wait(self, timeout : float = None) -> 'Action':
         '''
         Sets the to_be_waited flag: action callbacks will be waited for before
@@ -47,27 +163,87 @@ class Action:
             self.timeout = timeout
         return self
 
-    def exec(self):
+    def exec(self, token : cancellation.CancellationToken = None):
+        '''
+        Executes the action; if the token is cancelled, the running actions of
+        the tree are cancelled and the pending ones are not started
+        '''
+        if not token is None:
+            self.token = token
+        if not self.private_begin():
+            return
+
         # Private exec is the function that will be executed
         self.private_exec()
 
         # Handle a blocking call ?
         if(self.to_be_waited):
             self.done_condvar.acquire()
-            if not self.done:
-                self.done_condvar.wait(self.timeout)
-                if not self.done:
+            if not self.is_over():
+                clock.get_clock().wait_for(self.done_condvar, self.is_over, self.timeout)
+                if not self.is_over():
                     print(self, "timed out.")
-                    self.cancel_exec()
+                    if tracing.enabled:
+                        tracing.record(tracing.TIMEOUT, self)
+                    self.private_cancel()
             self.done_condvar.release()
 
+    def __await__(self):
+        return self.exec_async().__await__()
+
+    async def exec_async(self):
+        '''
+        asyncio version of exec: "await action" executes the action and waits for
+        its end, or for its timeout. Actions without callback are not waited for.
+        The callback may come from any thread.
+        '''
+        if not self.private_begin():
+            return
+        if self.callback is None:
+            await self.private_exec_async()
+            return
+
+        loop = asyncio.get_event_loop()
+        over = loop.create_future()
+        def set_over():
+            if not over.done():
+                over.set_result(None)
+        listener = lambda : loop.call_soon_threadsafe(set_over)
+        self.end_listeners.append(listener)
+        try:
+            await self.private_exec_async()
+            if not self.is_over():
+                await asyncio.wait_for(over, self.timeout)
+        except asyncio.TimeoutError:
+            print(self, "timed out.")
+            if tracing.enabled:
+                tracing.record(tracing.TIMEOUT, self)
+            self.private_cancel()
+        finally:
+            self.end_listeners.remove(listener)
+
+    async def private_exec_async(self):
+        '''
+        Starts the action without blocking the event loop.
+        Overriden by actions that contain other actions.
+        '''
+        self.private_exec()
+
     def private_exec(self):
         #to be overriden
         return None
 
+    def private_schedule(self):
+        '''
+        Called by the scheduler thread to start the action. It must not block.
+        Overriden by actions that contain other actions.
+        '''
+        self.private_exec()
+
     def cancel_exec(self):
         if(not (self.callback is None or self.parent_sequence is None)):
             self.parent_sequence.element_cancel()
+        self.private_notify_end()
 
 class Sequence(Action):
     '''
@@ -79,6 +255,10 @@ class Sequence(Action):
         self.current_action_idx = 0
         self.nb_callbacks = 0
         self.name = name
+        # If True, the sequence is cancelled as soon as one of its actions is
+        self.abort_if_fail = abort_if_fail
+        # Token of the actions of the sequence, child of the token of the sequence
+        self.child_token = None
         # A lock preventing a simultaneous construction and execution of the sequence
         self.mutex = Lock()
 
@@ -116,9 +296,15 @@ class Sequence(Action):
         Allows to count the number of callbacks left.
         '''
         self.mutex.acquire()
+        if self.is_cancelled():
+            self.mutex.release()
+            return
         self.nb_callbacks -= 1
-        print("Callback received in sequence", self.name, ",", \
-                self.nb_callbacks, "expected callbacks left")
+        if debug:
+            print("Callback received in sequence", self.name, ",", \
+                    self.nb_callbacks, "expected callbacks left")
+        if tracing.enabled:
+            tracing.record(tracing.CALLBACK, self, self.nb_callbacks)
         # If all expected callbacks have been received, call the sequence callback
         no_callbacks_left = self.nb_callbacks == 0
         self.mutex.release()
@@ -132,17 +318,73 @@ class Sequence(Action):
         in a timeout situation.
         '''
         self.mutex.acquire()
+        if self.is_cancelled():
+            self.mutex.release()
+            return
         self.nb_callbacks -= 1
-        print("Element execution canceled in sequence", self.name, ",", \
-                self.nb_callbacks, "expected callbacks left")
+        if debug:
+            print("Element execution canceled in sequence", self.name, ",", \
+                    self.nb_callbacks, "expected callbacks left")
         # If all expected callbacks have been received, call the sequence callback
         no_callbacks_left = self.nb_callbacks == 0
         self.mutex.release()
         if no_callbacks_left:
             self.private_callback()
-        #FIXME: abort_if_fail??
-        elif abort_if_fail:
-            self.cancel_exec()
+        elif self.abort_if_fail:
+            print(self, "aborted.")
+            self.private_cancel()
+
+    def get_token(self) -> cancellation.CancellationToken:
+        if not self.child_token is None:
+            return self.child_token
+        return Action.get_token(self)
+
+    def private_watch_token(self) -> bool:
+        '''
+        The actions of the sequence use a child token, so that the sequence can
+        be cancelled alone. The token of the sequence only wakes up the threads
+        waiting for it, its actions cancel themselves.
+        '''
+        token = Action.get_token(self)
+        self.watched_token = token
+        self.token_hook = token.register(self.private_wake_up)
+        if self.token_hook is None:
+            return False
+        self.child_token = token.child()
+        return True
+
+    def private_unwatch_token(self):
+        Action.private_unwatch_token(self)
+        if not self.child_token is None:
+            self.child_token.detach()
+
+    def private_wake_up(self):
+        with self.done_condvar:
+            self.done_condvar.notify_all()
+        self.private_notify_end()
+
+    def cancel_exec(self):
+        '''
+        Cancels the running actions of the sequence and does not start the next ones.
+        '''
+        with self.mutex:
+            self.cancelled = True
+        if not self.child_token is None:
+            self.child_token.cancel(str(self) + " cancelled")
+        Action.cancel_exec(self)
+        self.private_wake_up()
+
+    def private_next_action(self) -> Action:
+        '''
+        Returns the next action to start, or None if the sequence is over or cancelled.
+        '''
+        self.mutex.acquire()
+        action = None
+        if self.current_action_idx < len(self.action_list) and not self.is_cancelled():
+            action = self.action_list[self.current_action_idx]
+            self.current_action_idx += 1
+        self.mutex.release()
+        return action
 
 
     def private_exec(self):
@@ -150,22 +392,64 @@ class Sequence(Action):
         Is called by the Action.exec() function. Executes the actions of all elements of
         the sequence.
         '''
-        while self.current_action_idx < len(self.action_list):
+        while True:
+            action = self.private_next_action()
+            if action is None:
+                return
             if debug:
-                print("Executing action number", self.current_action_idx, \
+                print("Executing action number", self.current_action_idx - 1, \
                        "in sequence", self.name)
-            self.mutex.acquire()
-            action = self.action_list[self.current_action_idx]
-            self.current_action_idx += 1
-            self.mutex.release()
             action.exec()
 
-    def add_path(self, robot, path = [], movement_timeout : int = None, filename = None):
+    def private_schedule(self):
+        self.private_step()
+
+    def private_step(self):
+        '''
+        Scheduler version of private_exec: starts the actions of the sequence
+        until one of them has to be waited for. The scheduler calls this
+        function again when this action is over.
+        '''
+        while True:
+            action = self.private_next_action()
+            if action is None:
+                return
+            if debug:
+                print("Scheduling action number", self.current_action_idx - 1, \
+                       "in sequence", self.name)
+            if not self.scheduler.start_action(action, self.private_step):
+                return
+
+    async def private_exec_async(self):
+        '''
+        asyncio version of private_exec: actions to be waited for are awaited,
+        the other ones run in their own task.
+        '''
+        while True:
+            action = self.private_next_action()
+            if action is None:
+                return
+            if action.to_be_waited:
+                await action.exec_async()
+            else:
+                asyncio.ensure_future(action.exec_async())
+
+    def add_path(self, robot, path = [], movement_timeout : int = None, filename = None,
+                 planner = None, opponents = [], smooth : bool = False,
+                 corner_radius : float = trajectory.CORNER_RADIUS):
         """
         Defines a list of MoveToAction to follow a list of points [(x0, y0), (x1, y1), ...]
         The path is either passed as a list of points or as a json file if filename is specified.
         These actions are added to the sequence.
         The orientation at the end of each position is not specified.
+        If a path_planning.PathPlanner (or a path_table.PathTable) is given, the
+        points are reached by going around the obstacles (and the opponents
+        positions); a PlanPathAction is added, which plans the path when it is
+        executed, from the position of the robot at this moment. opponents is
+        a list of positions, or a function returning it when the path is planned.
+        If smooth is True, a single FollowPathAction is added instead: the
+        points are queued at once and the robot does not stop between them
+        (see trajectory.py); movement_timeout is then given for each point.
         """
 
         def json_to_python(filename, color):
@@ -181,8 +465,173 @@ class Sequence(Action):
         if(not filename is None):
             path = json_to_python(filename, robot.color)
 
-        for x, y in path:
-            self.add_action(MoveToAction(robot, x, y).wait(movement_timeout))
+        if(not planner is None):
+            self.add_action(PlanPathAction(robot, planner, path, opponents, movement_timeout,
+                                           smooth, corner_radius).wait())
+            return
+
+        for action in path_actions(robot, path, movement_timeout, smooth, corner_radius):
+            self.add_action(action)
+
+def path_actions(robot, path, movement_timeout : int = None, smooth : bool = False,
+                 corner_radius : float = trajectory.CORNER_RADIUS) -> list:
+    """
+    Returns the actions following the path, see Sequence.add_path
+    """
+    if smooth:
+        timeout = None if movement_timeout is None else movement_timeout * len(path)
+        return [FollowPathAction(robot, path, corner_radius).wait(timeout)]
+    return [MoveToAction(robot, x, y).wait(movement_timeout) for x, y in path]
+
+def plan_path(planner, start, points, opponents = []) -> list:
+    """
+    Returns the waypoints going through all the points from start, computed by planner.
+    The points that cannot be reached are skipped.
+    """
+    path = []
+    for point in points:
+        leg = planner.plan(start, point, opponents)
+        if leg is None:
+            print("[-] No path found from", start, "to", point)
+            continue
+        path += leg
+        start = point
+    return path
+
+class Parallel(Sequence):
+    '''
+    A group of actions that are all started at the same time.
+    The block is over when n_callbacks of its actions are over (all of them by
+    default, 1 to wait for any of them), or when max_delay seconds have elapsed.
+    The actions that are still running at this moment are cancelled.
+    '''
+    def __init__(self,
+                 name : str = None,
+                 callback : callable = lambda : None,
+                 n_callbacks : int = None,
+                 max_delay : float = None):
+        Sequence.__init__(self, name, callback)
+        self.n_callbacks = n_callbacks
+        self.max_delay = max_delay
+        self.nb_received = 0
+        self.nb_canceled = 0
+        self.finished = False
+        self.cancel_timer = None
+
+    def __str__(self) -> str:
+        if not self.name is None:
+            return "Parallel " + self.name
+        else:
+            return "Unnamed parallel"
+
+    def expected_callbacks(self) -> int:
+        if self.n_callbacks is None:
+            return self.nb_callbacks
+        return min(self.n_callbacks, self.nb_callbacks)
+
+    def element_callback(self):
+        '''
+        Called whenever an action of the block executes its callback.
+        '''
+        self.mutex.acquire()
+        if self.finished or self.is_cancelled():
+            self.mutex.release()
+            return
+        self.nb_received += 1
+        if debug:
+            print("Callback received in parallel", self.name, ",", \
+                    self.nb_received, "/", self.expected_callbacks())
+        if tracing.enabled:
+            tracing.record(tracing.CALLBACK, self, self.nb_received)
+        self.finished = self.nb_received >= self.expected_callbacks()
+        finished = self.finished
+        self.mutex.release()
+        if finished:
+            self.private_finish()
+
+    def element_cancel(self):
+        '''
+        Called when an action of the block cancels its execution.
+        The block is over if the expected number of callbacks cannot be reached anymore.
+        '''
+        self.mutex.acquire()
+        if self.finished or self.is_cancelled():
+            self.mutex.release()
+            return
+        self.nb_canceled += 1
+        self.finished = self.nb_callbacks - self.nb_canceled < self.expected_callbacks()
+        finished = self.finished
+        self.mutex.release()
+        if finished:
+            self.private_finish()
+
+    def private_timeout(self):
+        self.mutex.acquire()
+        finished = self.finished or self.cancelled
+        self.finished = True
+        self.mutex.release()
+        if not finished:
+            print(self, "timed out.")
+            if tracing.enabled:
+                tracing.record(tracing.TIMEOUT, self)
+            self.private_finish()
+
+    def private_finish(self):
+        '''
+        Cancels the actions that are still running and calls the callback of the block.
+        '''
+        if not self.cancel_timer is None:
+            self.cancel_timer()
+            self.cancel_timer = None
+        for action in self.action_list:
+            if not action.callback is None:
+                action.private_cancel()
+        self.private_callback()
+
+    def private_start(self, start_action : callable):
+        self.mutex.acquire()
+        if self.is_cancelled():
+            self.mutex.release()
+            return
+        actions = self.action_list[self.current_action_idx:]
+        self.current_action_idx = len(self.action_list)
+        self.finished = self.expected_callbacks() == 0
+        finished = self.finished
+        self.mutex.release()
+
+        for action in actions:
+            start_action(action)
+        if finished:
+            self.private_finish()
+
+    def private_exec(self):
+        '''
+        Is called by the Action.exec() function. Starts all the actions of the block.
+        Actions that have to be waited for are executed in a thread of the worker pool.
+        '''
+        if not self.max_delay is None:
+            timer = clock.get_clock().call_later(self.max_delay, self.private_timeout)
+            self.cancel_timer = timer.cancel
+
+        def start_action(action):
+            if action.to_be_waited:
+                worker_pool.submit(action.exec)
+            else:
+                action.exec()
+        self.private_start(start_action)
+
+    def private_schedule(self):
+        if not self.max_delay is None:
+            timer = self.scheduler.call_later(self.max_delay, self.private_timeout)
+            self.cancel_timer = lambda : self.scheduler.cancel_timer(timer)
+        self.private_start(self.scheduler.start_action)
+
+    async def private_exec_async(self):
+        loop = asyncio.get_event_loop()
+        if not self.max_delay is None:
+            timer = loop.call_later(self.max_delay, self.private_timeout)
+            self.cancel_timer = lambda : loop.call_soon_threadsafe(timer.cancel)
+        self.private_start(lambda action : asyncio.ensure_future(action.exec_async()))
 
 class Function(Action):
     '''
@@ -207,11 +656,34 @@ class Function(Action):
 
 class ThreadedFunction(Function):
     '''
-    A function call in a new thread
+    A function call in a thread of the worker pool (see worker_pool.py).
+    The action is over when the function returns; it can be executed again.
     '''
-    def __init__(self, function, args = [], callback : callable = lambda : None):
-        self.thread = Thread(target = function, args = args)
-        Function.__init__(self, lambda : self.thread.start(), [], callback)
+    def __init__(self, function, args = [], callback : callable = lambda : None,
+                 priority : int = worker_pool.PRIORITY_NORMAL):
+        self.target = function
+        self.target_args = list(args)
+        self.priority = priority
+        self.job = None
+        Function.__init__(self, self.private_submit, [], callback)
+
+    def private_submit(self, callback = None):
+        self.done = False
+        self.cancelled = False
+        self.job = worker_pool.submit(self.private_run, (callback,), self.priority)
+
+    def private_run(self, callback):
+        #the exception is printed by the worker pool, the sequence goes on
+        try:
+            self.target(*self.target_args)
+        finally:
+            if not callback is None:
+                callback()
+
+    def cancel_exec(self):
+        if not self.job is None:
+            self.job.cancel()
+        Function.cancel_exec(self)
 
 class ConditionalAction(Action):
     '''
@@ -251,8 +723,13 @@ class ConditionalAction(Action):
                 private_callback()
 
 class Mission():
-    #TODO: docstring
-    #TODO: wip
+    '''
+    A set of actions the robot can perform to earn points.
+    position is the place (x, y) where the mission starts, estimated_time and
+    timeout are durations in seconds, min_date and max_date are the bounds (in
+    seconds since the beginning of the match) of the execution of the mission.
+    max_date may be None.
+    '''
     def __init__(self, sequence : Sequence, position, estimated_points : int, estimated_time : int, timeout : int, min_date : int, max_date):
         self.sequence = sequence
         self.position = position
@@ -262,13 +739,36 @@ class Mission():
         self.min_date = min_date
         self.max_date = max_date
 
-    def exec(self):
+    def exec(self, t_0 : float = None) -> bool:
+        '''
+        Executes the mission and waits for its end.
+        If t_0 (the clock time of the beginning of the match) is given, the
+        mission does not start before its min_date.
+        Returns False if the mission timed out.
+        '''
+        if not t_0 is None:
+            wait_min_date(self, t_0)
+        self.sequence.wait(self.timeout)
         self.sequence.exec()
+        return self.sequence.done
+
+def wait_min_date(mission, t_0 : float):
+    '''
+    Waits (on the clock of the framework) until the min_date of the mission,
+    t_0 being the clock time of the beginning of the match.
+    '''
+    if not mission.min_date:
+        return
+    delay = t_0 + mission.min_date - clock.get_clock().time()
+    if delay > 0:
+        clock.get_clock().sleep(delay)
 
 class TrueMission(Sequence):
-    #Idem
+    '''
+    A mission which is also the sequence of its actions (see Mission).
+    '''
     def __init__(self, position, estimated_points : int, estimated_time : int, timeout : int, min_date : int, max_date, name : str = None, callback : callable = lambda : None, abort_if_fail : bool = False):
-        Sequence.__init__(name, callback, abort_if_fail)
+        Sequence.__init__(self, name, callback, abort_if_fail)
         self.position = position
         self.estimated_points = estimated_points
         self.estimated_time = estimated_time
@@ -282,8 +782,9 @@ class MissionStrategy:
     It has to be overriden in order to define the eval function.
     '''
 
-    def __init__(self, mission_list : Iterable, robot : Robot):
-        self.mission_list = mission_list
+    def __init__(self, mission_list : 'Iterable', robot : 'Robot'):
+        self.mission_list = list(mission_list)
+        self.robot = robot
 
     def eval(self, mission) -> int:
         '''
@@ -298,14 +799,38 @@ class MissionStrategy:
         This function returns the mission with the highest evaluation.
         '''
 
-        mission_eval = [ (mission, eval(mission)) for mission in self.mission_list]
+        mission_eval = [ (mission, self.eval(mission)) for mission in self.mission_list]
         if(len(mission_eval) == 0): return None
 
-        sorted_missions = sorted(mission_eval, key=lambda mission: mission[2], reverse=True)
+        sorted_missions = sorted(mission_eval, key=lambda mission: mission[1], reverse=True)
 
         return sorted_missions[0][0]
 
-    def execute_best_mission(self) -> None:
+    def execute_best_mission(self) -> Mission:
+        '''
+        Executes the best mission, waits for its end and removes it from the
+        mission list. Returns the executed mission, None if there is none left.
+        The mission is not started before its min_date (in seconds since
+        robot.t_0).
+        '''
+        mission = self.best_mission()
+        if mission is None:
+            return None
+        self.mission_list.remove(mission)
+        if isinstance(mission, Mission):
+            success = mission.exec(self.robot.t_0)
+        else:
+            wait_min_date(mission, self.robot.t_0)
+            mission.wait(mission.timeout)
+            mission.exec()
+            success = mission.done
+        self.mission_over(mission, success)
+        return mission
+
+    def mission_over(self, mission, success : bool) -> None:
+        '''
+        Called after the execution of a mission, success is False if it timed out.
+        '''
         pass
 
 ####### EXAMPLES
@@ -325,12 +850,75 @@ class MoveToAction(Function):
         Function.__init__(self, robot.moveTo, [x, y, angle])
 
 
+class FollowPathAction(Function):
+    '''
+    Action going through a list of points [(x0, y0), ...] without stopping
+    between them (see Robot.follow_path)
+    '''
+    def __init__(self, \
+                 robot, \
+                 points : list, \
+                 corner_radius : float = trajectory.CORNER_RADIUS):
+        Function.__init__(self, lambda points, callback: robot.follow_path(points, callback, corner_radius),
+                          [list(points)])
+        self.robot = robot
+
+    def cancel_exec(self):
+        #the robot stops, the points that are not reached yet are forgotten
+        self.robot.cancel_motion()
+        Action.cancel_exec(self)
+
+
+class PlanPathAction(Function):
+    '''
+    Action planning the path through a list of points [(x0, y0), ...] when it
+    is executed, from the current pose of the robot and the positions of the
+    opponents at this moment (opponents is a list, or a function returning it).
+    The actions following the path (see path_actions) are inserted in the
+    sequence right after this one.
+    '''
+    def __init__(self, \
+                 robot, \
+                 planner, \
+                 points : list, \
+                 opponents = [], \
+                 movement_timeout : int = None, \
+                 smooth : bool = False, \
+                 corner_radius : float = trajectory.CORNER_RADIUS):
+        Function.__init__(self, self.private_plan, [])
+        self.robot = robot
+        self.planner = planner
+        self.points = list(points)
+        self.opponents = opponents
+        self.movement_timeout = movement_timeout
+        self.smooth = smooth
+        self.corner_radius = corner_radius
+
+    def __str__(self):
+        return "Path planning"
+
+    def private_plan(self, callback):
+        opponents = self.opponents() if callable(self.opponents) else self.opponents
+        start = self.robot.get_pose(max_age=0).position()
+        path = plan_path(self.planner, start, self.points, opponents)
+        sequence = self.parent_sequence
+        actions = path_actions(self.robot, path, self.movement_timeout, self.smooth,
+                               self.corner_radius)
+        #inserted before the callback, so that the sequence waits for them
+        position = sequence.current_action_idx
+        for action in actions:
+            sequence.add_action(action, position)
+            position += 1
+        callback()
+
+
 class AX12MoveAction(Function):
     '''
-    Move action of an AX12
+    Move action of an AX12 (libAX12 is not imported: any object providing
+    move and turn works, like simulation.SimulatedAX12)
     '''
     def __init__(self, \
-                 ax12 : AX12, \
+                 ax12 : 'AX12', \
                  position : int,
                  cancel_position : int = None):
         Function.__init__(self, ax12.move, [position])
@@ -0,0 +1,185 @@
+import math
+
+from action import MissionStrategy, Mission
+import clock
+
+MATCH_DURATION = 90         #s
+ROBOT_SPEED = 300           #mm/s, mean speed used to estimate travel times
+TURN_DURATION = 0.5         #s, mean duration of the turns of a travel
+
+#maximal number of explored mission orders in a planning
+#bounds the planning time (a few milliseconds on the Raspberry Pi)
+MAX_EXPLORED_NODES = 300
+
+
+def euclidean_travel_time(origin, destination):
+    '''
+    Default estimation of the duration (in seconds) of a travel between two
+    positions (x, y) in mm.
+    '''
+    distance = math.hypot(destination[0] - origin[0], destination[1] - origin[1])
+    if distance == 0:
+        return 0.
+    return distance / ROBOT_SPEED + TURN_DURATION
+
+
+class MissionPlanner(MissionStrategy):
+    '''
+    Mission strategy choosing the order of the missions that maximises the
+    expected points within the remaining match time.
+    The planning takes into account the travel time from the current position
+    of the robot, the estimated time of the missions and their min_date and
+    max_date (a mission is not started before its min_date, see
+    MissionStrategy.execute_best_mission). It is computed again when a mission
+    is over, failed or timed out.
+
+    travel_time(origin, destination) estimates the duration of a travel between
+    two positions (x, y); by default the distance is divided by a mean speed.
+    The travel_time method of a path_table.PathTable gives the durations of the
+    precomputed paths between the mission positions.
+    '''
+    def __init__(self,
+                 mission_list,
+                 robot,
+                 match_duration : float = MATCH_DURATION,
+                 travel_time : callable = euclidean_travel_time,
+                 max_explored_nodes : int = MAX_EXPLORED_NODES):
+        MissionStrategy.__init__(self, mission_list, robot)
+        self.match_duration = match_duration
+        self.travel_time = travel_time
+        self.max_explored_nodes = max_explored_nodes
+        self.plan = []
+        self.explored_nodes = 0
+        self.travel_time_cache = {}
+
+    def match_time(self) -> float:
+        '''
+        Time elapsed since the beginning of the match (the construction of the robot).
+        '''
+        return clock.get_clock().time() - self.robot.t_0
+
+    def robot_position(self) -> tuple:
+        return self.robot.get_pose().position()
+
+    def private_travel_time(self, origin, mission) -> float:
+        key = (origin, id(mission))
+        if not key in self.travel_time_cache:
+            self.travel_time_cache[key] = self.travel_time(origin, mission.position[:2])
+        return self.travel_time_cache[key]
+
+    def private_schedule(self, position, date, mission):
+        '''
+        Returns the date at which the mission would be over if it were started
+        after a travel from position, None if it cannot be done in time.
+        '''
+        start = max(date + self.private_travel_time(position, mission), mission.min_date or 0)
+        end = start + mission.estimated_time
+        max_date = self.match_duration if mission.max_date is None \
+                   else min(mission.max_date, self.match_duration)
+        if end > max_date:
+            return None
+        return end
+
+    def private_evaluate(self, position, date, order) -> int:
+        '''
+        Returns the points of a mission order, None if it is not feasible.
+        '''
+        points = 0
+        for mission in order:
+            date = self.private_schedule(position, date, mission)
+            if date is None:
+                return None
+            position = tuple(mission.position[:2])
+            points += mission.estimated_points
+        return points
+
+    def compute_plan(self, position : tuple = None, date : float = None) -> list:
+        '''
+        Computes the best order of the missions from position at date (by
+        default the current position of the robot and the current match time),
+        by a branch and bound search. The previous plan is used as the first
+        solution, so that a replanning after a mission is fast.
+        '''
+        position = self.robot_position() if position is None else tuple(position)
+        date = self.match_time() if date is None else date
+        missions = list(self.mission_list)
+
+        # Only the travel times between the positions of the remaining
+        # missions are kept: the positions of the robot change at each planning
+        positions = set(tuple(mission.position[:2]) for mission in missions)
+        ids = set(id(mission) for mission in missions)
+        self.travel_time_cache = {key: value for key, value in self.travel_time_cache.items()
+                                  if key[0] in positions and key[1] in ids}
+
+        best = {'points': 0, 'order': []}
+        previous = [mission for mission in self.plan if mission in missions]
+        previous_points = self.private_evaluate(position, date, previous)
+        if previous_points is not None:
+            best = {'points': previous_points, 'order': previous}
+
+        self.explored_nodes = 0
+
+        def explore(position, date, points, order, remaining):
+            if points > best['points']:
+                best['points'] = points
+                best['order'] = list(order)
+            if self.explored_nodes >= self.max_explored_nodes:
+                return
+
+            children = []
+            for mission in remaining:
+                end = self.private_schedule(position, date, mission)
+                if end is not None:
+                    children.append((end, mission))
+            # Upper bound: every feasible mission is done
+            if points + sum(mission.estimated_points for _, mission in children) <= best['points']:
+                return
+            # Most profitable missions first, so that good solutions are found early
+            children.sort(key=lambda child: mission_rate(child[1], child[0] - date), reverse=True)
+
+            for end, mission in children:
+                self.explored_nodes += 1
+                order.append(mission)
+                remaining.remove(mission)
+                explore(tuple(mission.position[:2]), end, points + mission.estimated_points,
+                        order, remaining)
+                remaining.append(mission)
+                order.pop()
+
+        explore(position, date, 0, [], missions)
+        self.plan = best['order']
+        return self.plan
+
+    def eval(self, mission) -> int:
+        '''
+        The earlier a mission is in the plan, the better its evaluation.
+        '''
+        if not mission in self.plan:
+            return 0
+        return len(self.plan) - self.plan.index(mission)
+
+    def best_mission(self) -> Mission:
+        self.compute_plan()
+        if not self.plan:
+            return None
+        return self.plan[0]
+
+    def mission_over(self, mission, success : bool):
+        # A failed mission is not tried again, the plan is computed again
+        # by the next call to best_mission
+        if mission in self.plan:
+            self.plan.remove(mission)
+
+    def run(self):
+        '''
+        Executes missions until none can be done in the remaining time.
+        '''
+        while not self.execute_best_mission() is None:
+            pass
+
+
+def mission_rate(mission, duration) -> float:
+    '''
+    Points per second of a mission, including the travel to the mission.
+    '''
+    return mission.estimated_points / max(duration, 1e-3)
@@ -0,0 +1,236 @@
+"""
+Precomputed paths between the named mission positions.
+The paths and travel times between every pair of positions are computed
+offline for each colour by a PathPlanner and stored in a binary file, which
+is memory-mapped at startup: nothing is planned or parsed before a leg is
+actually needed.
+
+    python3 path_table.py positions.json obstacles.json paths.ptbl
+
+positions.json: {"green": {"name": {"x": 300, "y": 500}, ...}, "orange": {...}}
+obstacles.json: [[{"x": 1000, "y": 0}, {"x": 1100, "y": 0}, ...], ...]
+
+File layout (little endian):
+    header      magic, version, number of colours, number of positions, robot radius
+    names       colours names (16 bytes each), positions names (32 bytes each)
+    offsets     offset of the block of each colour
+    for each colour:
+        positions   (x, y) int16
+        times       float32 matrix, inf if there is no path
+        legs        uint32 index of the first point of each leg in points (n * n + 1)
+        points      (x, y) int16
+"""
+
+import json
+import math
+import mmap
+import struct
+import sys
+
+from mission_planner import ROBOT_SPEED, TURN_DURATION, euclidean_travel_time
+from path_planning import PathPlanner, ROBOT_RADIUS, OPPONENT_RADIUS, distance_to_segment
+
+MAGIC = b'PTBL'
+VERSION = 1
+HEADER = struct.Struct('<4sHHHH')
+COLOR_NAME = struct.Struct('<16s')
+POSITION_NAME = struct.Struct('<32s')
+OFFSET = struct.Struct('<I')
+POINT = struct.Struct('<hh')
+TIME = struct.Struct('<f')
+
+POSITION_TOLERANCE = 20     #mm, a point closer than this to a named position is this position
+
+
+def path_travel_time(start, path, speed=ROBOT_SPEED, turn_duration=TURN_DURATION) -> float:
+    """
+    duration of a travel along path, one turn before each straight line
+    """
+    duration = 0.
+    for point in path:
+        duration += math.hypot(point[0] - start[0], point[1] - start[1]) / speed + turn_duration
+        start = point
+    return duration
+
+
+def build_path_table(filename, positions, planner, speed=ROBOT_SPEED, turn_duration=TURN_DURATION):
+    """
+    Computes the paths between all the positions with planner and writes them in filename.
+    positions is a dict {color: {name: (x, y)}}, with the same names for every colour.
+    """
+    colors = sorted(positions)
+    names = sorted(positions[colors[0]])
+    for color in colors:
+        if sorted(positions[color]) != names:
+            raise ValueError("the colours do not have the same positions")
+
+    blocks = []
+    for color in colors:
+        points = [tuple(positions[color][name]) for name in names]
+        times = []
+        legs = [0]
+        path_points = []
+        for origin in points:
+            for destination in points:
+                path = [] if origin == destination else planner.plan(origin, destination)
+                if path is None:
+                    times.append(float('inf'))
+                else:
+                    times.append(path_travel_time(origin, path, speed, turn_duration))
+                    path_points += path
+                legs.append(len(path_points))
+        blocks.append(b''.join([b''.join(POINT.pack(*point) for point in points),
+                                b''.join(TIME.pack(time) for time in times),
+                                b''.join(OFFSET.pack(leg) for leg in legs),
+                                b''.join(POINT.pack(*point) for point in path_points)]))
+
+    data = [HEADER.pack(MAGIC, VERSION, len(colors), len(names), int(planner.robot_radius))]
+    data += [COLOR_NAME.pack(color.encode()) for color in colors]
+    data += [POSITION_NAME.pack(name.encode()) for name in names]
+    offset = sum(len(part) for part in data) + OFFSET.size * len(colors)
+    for block in blocks:
+        data.append(OFFSET.pack(offset))
+        offset += len(block)
+    data += blocks
+
+    with open(filename, "wb") as f:
+        f.write(b''.join(data))
+
+
+class PathTable:
+    """
+    Paths of one colour of a file written by build_path_table.
+    It has the plan method of PathPlanner, so it can be given to Sequence.add_path,
+    and a travel_time method that can be given to MissionPlanner, which only
+    reads the table.
+    A cached leg is used when its ends are named positions and no opponent is
+    close to it; otherwise the leg is planned by planner (if any).
+    """
+    def __init__(self, filename, color, planner : PathPlanner = None):
+        self.planner = planner
+        with open(filename, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, n_colors, n_positions, self.robot_radius = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a path table".format(filename))
+        offset = HEADER.size
+        colors = []
+        for i in range(n_colors):
+            colors.append(COLOR_NAME.unpack_from(self.data, offset)[0].rstrip(b'\0').decode())
+            offset += COLOR_NAME.size
+        self.names = []
+        for i in range(n_positions):
+            self.names.append(POSITION_NAME.unpack_from(self.data, offset)[0].rstrip(b'\0').decode())
+            offset += POSITION_NAME.size
+        if not color in colors:
+            raise ValueError("no path for the colour {}".format(color))
+
+        self.n = n_positions
+        self.positions_offset = OFFSET.unpack_from(self.data, offset + colors.index(color) * OFFSET.size)[0]
+        self.times_offset = self.positions_offset + POINT.size * self.n
+        self.legs_offset = self.times_offset + TIME.size * self.n * self.n
+        self.points_offset = self.legs_offset + OFFSET.size * (self.n * self.n + 1)
+        self.positions = [POINT.unpack_from(self.data, self.positions_offset + POINT.size * i)
+                          for i in range(self.n)]
+
+    def close(self):
+        self.data.close()
+
+    def position(self, name) -> tuple:
+        return self.positions[self.names.index(name)]
+
+    def index_of(self, point):
+        """
+        index of the named position at point, None if there is none
+        """
+        for i, (x, y) in enumerate(self.positions):
+            if abs(x - point[0]) <= POSITION_TOLERANCE and abs(y - point[1]) <= POSITION_TOLERANCE:
+                return i
+        return None
+
+    def private_time(self, i, j) -> float:
+        return TIME.unpack_from(self.data, self.times_offset + TIME.size * (i * self.n + j))[0]
+
+    def private_leg(self, i, j) -> list:
+        k = i * self.n + j
+        first, last = struct.unpack_from('<II', self.data, self.legs_offset + OFFSET.size * k)
+        return [POINT.unpack_from(self.data, self.points_offset + POINT.size * p)
+                for p in range(first, last)]
+
+    def leg(self, origin, destination) -> list:
+        """
+        cached path between two named positions (names or points), None if there is none
+        """
+        i = self.names.index(origin) if isinstance(origin, str) else self.index_of(origin)
+        j = self.names.index(destination) if isinstance(destination, str) else self.index_of(destination)
+        if i is None or j is None or self.private_time(i, j) == float('inf'):
+            return None
+        return self.private_leg(i, j)
+
+    def private_is_clear(self, start, path, opponents, opponent_radius):
+        radius = opponent_radius + self.robot_radius
+        for point in path:
+            for opponent in opponents:
+                if distance_to_segment(opponent[0], opponent[1], start, point) < radius:
+                    return False
+            start = point
+        return True
+
+    def plan(self, start, goal, opponents=[], opponent_radius=OPPONENT_RADIUS):
+        """
+        same as PathPlanner.plan
+        """
+        path = self.leg(start, goal)
+        if not path is None and self.private_is_clear(start, path, opponents, opponent_radius):
+            #the cached leg ends at the named position, not exactly at goal
+            return path[:-1] + [tuple(goal)] if path else path
+        if self.planner is None:
+            return None
+        return self.planner.plan(start, goal, opponents, opponent_radius)
+
+    def nearest(self, point) -> int:
+        """
+        index of the named position closest to point
+        """
+        return min(range(self.n), key=lambda i: math.hypot(self.positions[i][0] - point[0],
+                                                           self.positions[i][1] - point[1]))
+
+    def travel_time(self, origin, destination) -> float:
+        """
+        estimated duration of the travel between two points, in seconds
+        nothing is planned: a point which is not a named position goes
+        straight to (or comes straight from) the closest named position
+        """
+        i = self.index_of(origin)
+        j = self.index_of(destination)
+        if not i is None and not j is None:
+            return self.private_time(i, j)
+        if self.n == 0:
+            return euclidean_travel_time(origin, destination)
+        k = self.nearest(origin) if i is None else i
+        l = self.nearest(destination) if j is None else j
+        if k == l:
+            return euclidean_travel_time(origin, destination)
+        duration = self.private_time(k, l)
+        if i is None:
+            duration += euclidean_travel_time(origin, self.positions[k])
+        if j is None:
+            duration += euclidean_travel_time(self.positions[l], destination)
+        return duration
+
+def load_points(filename):
+    with open(filename, "r") as f:
+        return json.loads(f.read())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4:
+        print("usage: {} positions.json obstacles.json output".format(sys.argv[0]))
+        sys.exit(1)
+    positions = {color: {name: (p['x'], p['y']) for name, p in points.items()}
+                 for color, points in load_points(sys.argv[1]).items()}
+    obstacles = [[(p['x'], p['y']) for p in polygon] for polygon in load_points(sys.argv[2])]
+    build_path_table(sys.argv[3], positions, PathPlanner(obstacles))
+    print("[+] Paths between {} positions written in {}".format(
+        len(next(iter(positions.values()))), sys.argv[3]))
@@ -0,0 +1,177 @@
+from threading import Thread, Condition, current_thread
+from collections import deque
+import traceback
+
+import clock
+import tracing
+
+
+class Scheduler:
+    '''
+    Runs a whole Action tree as a state machine on a single thread.
+    Callbacks coming from other threads (hardware, ctypes, timers...) only post
+    a completion event; the scheduler thread then advances the sequences.
+    Whatever the depth of the tree, only one thread is used.
+
+    With a virtual clock (see clock.py), no thread is used: the events are
+    executed by the thread driving the clock.
+
+    Usage:
+        scheduler = Scheduler()
+        scheduler.exec(main_sequence)
+    '''
+    def __init__(self):
+        self.clock = clock.get_clock()
+        self.events = deque()
+        self.condvar = Condition()
+        self.is_running = False
+        self.thread = None
+
+    def start(self) -> 'Scheduler':
+        '''
+        Starts the scheduler thread if it is not already running.
+        '''
+        with self.condvar:
+            if self.is_running or self.clock.is_virtual:
+                return self
+            self.is_running = True
+            self.thread = Thread(target=self.run, name="action-scheduler")
+            self.thread.daemon = True
+            self.thread.start()
+        return self
+
+    def stop(self):
+        '''
+        Stops the scheduler thread. Pending events are dropped.
+        '''
+        with self.condvar:
+            self.is_running = False
+            self.condvar.notify()
+
+    def join(self):
+        self.stop()
+        if self.thread is not None and self.thread is not current_thread():
+            self.thread.join()
+
+    def is_current_thread(self) -> bool:
+        # With a virtual clock, the events are executed by the thread driving the clock
+        if self.clock.is_virtual:
+            return self.clock.is_driver()
+        return current_thread() is self.thread
+
+    def post(self, function : callable, args : tuple = ()):
+        '''
+        Asks the scheduler thread to call function(*args) as soon as possible.
+        Can be called from any thread.
+        '''
+        if self.clock.is_virtual:
+            self.clock.call_later(0, function, args)
+            return
+        with self.condvar:
+            self.events.append((function, args))
+            self.condvar.notify()
+
+    def call_later(self, delay : float, function : callable, args : tuple = ()) -> clock.ClockTimer:
+        '''
+        Calls function(*args) on the scheduler thread after delay seconds.
+        Returns a timer that can be given to cancel_timer.
+        '''
+        return self.clock.call_later(delay, self.post, (function, args))
+
+    def cancel_timer(self, timer : clock.ClockTimer):
+        timer.cancel()
+
+    def exec(self, action, token = None):
+        '''
+        Executes an action (usually the root sequence) on the scheduler.
+        As for Action.exec, the call only blocks if action.wait() has been set.
+        token is the cancellation token of the action (the root token by default).
+        '''
+        if not token is None:
+            action.token = token
+        self.start()
+        self.post(self.start_action, (action,))
+
+        if action.to_be_waited:
+            # The timeout itself is handled by the scheduler thread
+            action.done_condvar.acquire()
+            self.clock.wait_for(action.done_condvar, action.is_over, action.timeout)
+            action.done_condvar.release()
+
+    def start_action(self, action, resume : callable = None) -> bool:
+        '''
+        Starts an action on the scheduler thread.
+        Returns False if the action has to be waited for; in this case resume
+        is called once the action is over or has timed out.
+        '''
+        action.scheduler = self
+        if not action.private_begin():
+            return True
+        action.private_schedule()
+        if not action.to_be_waited or action.done or action.cancelled:
+            return True
+
+        action.resume = resume
+        if action.timeout is not None:
+            action.timeout_timer = self.call_later(action.timeout, self.private_timeout, (action,))
+        return False
+
+    def action_done(self, action):
+        '''
+        Called by Action.private_callback on the scheduler thread.
+        '''
+        if action.timeout_timer is not None:
+            self.cancel_timer(action.timeout_timer)
+            action.timeout_timer = None
+        self.private_resume(action)
+
+    def private_timeout(self, action):
+        action.timeout_timer = None
+        if action.done:
+            return
+        print(action, "timed out.")
+        if tracing.enabled:
+            tracing.record(tracing.TIMEOUT, action)
+        self.cancel_action(action)
+
+    def cancel_action(self, action):
+        '''
+        Cancels an action on the scheduler thread, and resumes the sequence waiting for it.
+        '''
+        if action.timeout_timer is not None:
+            self.cancel_timer(action.timeout_timer)
+            action.timeout_timer = None
+        try:
+            action.private_cancel()
+        finally:
+            # Wake up a thread waiting in Scheduler.exec
+            action.done_condvar.acquire()
+            action.done_condvar.notify_all()
+            action.done_condvar.release()
+            self.private_resume(action)
+
+    def private_resume(self, action):
+        resume, action.resume = action.resume, None
+        if resume is not None:
+            resume()
+
+    def private_next_events(self) -> deque:
+        '''
+        Waits for events and returns the events to process.
+        '''
+        with self.condvar:
+            while self.is_running:
+                if self.events:
+                    events, self.events = self.events, deque()
+                    return events
+                self.condvar.wait()
+            return deque()
+
+    def run(self):
+        while self.is_running:
+            for function, args in self.private_next_events():
+                try:
+                    function(*args)
+                except Exception:
+                    print("[-] Exception in scheduled action")
+                    traceback.print_exc()
@@ -0,0 +1,371 @@
+"""
+Benchmarks of the framework on the simulated robot (no I2C, AX12 nor GPIO
+needed), compared to stored baselines:
+
+    python3 match_benchmarks.py                     # compares to baselines.json
+    python3 match_benchmarks.py --save              # replaces the baselines
+    python3 match_benchmarks.py --gpio-lib ../../rpi_gpio/libGPIO_sim.so \\
+                                --timer-lib ../../callbacks_python/libtimer_service.so
+
+The GPIO and native timer benchmarks need the libraries built by "make sim" in
+rpi_gpio and "make" in callbacks_python (or the installed gpio and
+timer_service modules); they are skipped otherwise.
+A metric is a regression if it is more than tolerance times worse than its
+baseline. Only the medians and the 90th percentiles of the latencies are
+checked (the medians only for the timer jitter): the other percentiles and the
+maxima are printed, but they depend on the load of the machine more than on the
+code. The exit status is 1 if there is a regression.
+--save records the median of BASELINE_RUNS runs, so that the baselines are not
+the result of a lucky (or unlucky) run.
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+import types
+
+FRAMEWORK = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOT = os.path.dirname(FRAMEWORK)
+sys.path[:0] = [os.path.join(FRAMEWORK, 'robot'), os.path.join(FRAMEWORK, 'action'),
+                os.path.join(ROOT, 'callbacks_python')]
+
+import action
+from action import Sequence, Function
+from scheduler import Scheduler
+import clock
+import worker_pool
+from robot import Robot
+from simulation import SimulatedBackend
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+#a metric can be this many times worse than its baseline (timings are noisy),
+#the 90th percentiles even more
+DEFAULT_TOLERANCE = 1.
+TAIL_TOLERANCE = 3.
+#each benchmark is run several times, the best result is kept
+DEFAULT_REPEAT = 3
+#number of runs whose median is saved as baseline
+BASELINE_RUNS = 5
+
+SEQUENCE_SIZES = [10, 100, 1000, 10000]
+LATENCY_SAMPLES = 200
+OBSTACLE_SAMPLES = 100
+GPIO_SAMPLES = 200
+TIMER_SAMPLES = 1000
+TIMER_PERIOD = 0.002        #s
+#delay before the first deadline, so that no timer expires while the next
+#ones are scheduled
+TIMER_LEAD = 0.2            #s
+MEMORY_ACTIONS = 10000
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+def latency_metrics(name, samples):
+    """
+    median, 90th and 99th percentiles (us) of samples in seconds
+    """
+    return {name + '.median_us': statistics.median(samples) * 1e6,
+            name + '.p90_us': percentile(samples, .9) * 1e6,
+            name + '.p99_us': percentile(samples, .99) * 1e6}
+
+@contextlib.contextmanager
+def quiet():
+    #the framework prints on the hot path: the prints are kept, not their output
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+@contextlib.contextmanager
+def using_clock(new_clock):
+    old_clock = clock.get_clock()
+    clock.set_clock(new_clock)
+    try:
+        yield new_clock
+    finally:
+        clock.set_clock(old_clock)
+
+def load_binding(name, binding, library):
+    """
+    imports a ctypes binding (rpi_gpio/python_binding.py...) as module name,
+    with its LIBNAME replaced by library, as "make install" does
+    """
+    module = types.ModuleType(name)
+    with open(binding) as f:
+        source = f.read().replace("LIBNAME", repr(os.path.abspath(library)))
+    exec(compile(source, binding, 'exec'), module.__dict__)
+    sys.modules[name] = module
+    return module
+
+def import_native(name, binding, library):
+    if not library is None:
+        return load_binding(name, binding, library)
+    try:
+        return __import__(name)
+    except (ImportError, OSError):
+        return None
+
+
+def bench_sequence_step():
+    """
+    time per action of a sequence of actions calling their callback immediately
+    """
+    metrics = {}
+    for mode in ['thread', 'scheduler']:
+        for n in SEQUENCE_SIZES:
+            sequence = Sequence("bench")
+            sequence.add_actions([Function(lambda cb: cb()).wait() for i in range(n)])
+            sequence.wait()
+            start = time.perf_counter()
+            if mode == 'thread':
+                sequence.exec()
+            else:
+                scheduler = Scheduler()
+                scheduler.exec(sequence)
+                scheduler.join()
+            duration = time.perf_counter() - start
+            metrics['sequence_step.{}.{}_us'.format(mode, n)] = duration / n * 1e6
+    return metrics
+
+def bench_callback_latency():
+    """
+    delay between a callback coming from another thread and the start of the
+    next action of the sequence
+    """
+    metrics = {}
+    for mode in ['thread', 'scheduler']:
+        fired = []
+        started = []
+        def fire(callback):
+            fired.append(time.perf_counter())
+            callback()
+        def step(callback):
+            started.append(time.perf_counter())
+            worker_pool.submit(fire, (callback,))
+
+        sequence = Sequence("latency")
+        sequence.add_actions([Function(step).wait() for i in range(LATENCY_SAMPLES + 1)])
+        sequence.wait()
+        if mode == 'thread':
+            sequence.exec()
+        else:
+            scheduler = Scheduler()
+            scheduler.exec(sequence)
+            scheduler.join()
+        samples = [started[i + 1] - fired[i] for i in range(LATENCY_SAMPLES)]
+        metrics.update(latency_metrics('callback_latency.' + mode, samples))
+    return metrics
+
+def bench_obstacle_stop():
+    """
+    delay between the edge of a front sensor and the stop order of the robot,
+    through the collision pipeline
+    """
+    samples = []
+    with using_clock(clock.VirtualClock()) as virtual_clock, quiet():
+        backend = SimulatedBackend(x=500, y=1000)
+        robot = Robot(debug=False, backend=backend)
+        stops = []
+        stop_motion = robot.stop_motion
+        def timed_stop_motion():
+            stops.append(time.perf_counter())
+            stop_motion()
+        robot.stop_motion = timed_stop_motion
+        robot.start_collision_events(4, 5, gpio=backend.gpio)
+
+        for i in range(OBSTACLE_SAMPLES):
+            backend.motion.setPosition(500, 1000)
+            backend.motion.set_heading(0)
+            robot.moveTo(2000, 1000)
+            virtual_clock.advance(1.)
+            del stops[:]
+            start = time.perf_counter()
+            backend.gpio.digital_write(4, 1)
+            if stops:
+                samples.append(stops[0] - start)
+            backend.gpio.digital_write(4, 0)
+            virtual_clock.run()
+        robot.stop_collision_sensors()
+    if not samples:
+        return {}
+    return latency_metrics('obstacle_stop', samples)
+
+def bench_gpio_edge(gpio):
+    """
+    delay between the change of a simulated pin and the call of its callback
+    """
+    if gpio is None:
+        print("[i] gpio module not found, GPIO benchmark skipped")
+        return {}
+    if not 'simulated' in gpio.backend_name():
+        print("[i] gpio module is not the simulated one, GPIO benchmark skipped")
+        return {}
+
+    pin = 17
+    gpio.init()
+    gpio.set_pin_mode(pin, gpio.INPUT)
+    called = threading.Event()
+    dates = []
+    def on_change():
+        dates.append(time.perf_counter())
+        called.set()
+    gpio.assign_callback_on_gpio_change(pin, on_change)
+
+    samples = []
+    for i in range(GPIO_SAMPLES):
+        called.clear()
+        start = time.perf_counter()
+        gpio.simulated_chip_set_value(pin, (i + 1) % 2)
+        if called.wait(1.):
+            samples.append(dates[-1] - start)
+    gpio.remove_callbacks_on_gpio(pin)
+    gpio.join()
+    if not samples:
+        return {}
+    return latency_metrics('gpio_edge', samples)
+
+def bench_timer_jitter(timer_clock, name):
+    """
+    delay between the deadline of a timer and its call
+    """
+    samples = []
+    over = threading.Event()
+    def timeout(timer):
+        samples.append(timer_clock.time() - timer[0].deadline)
+        if len(samples) == TIMER_SAMPLES:
+            over.set()
+
+    for i in range(TIMER_SAMPLES):
+        timer = []
+        timer.append(timer_clock.call_later(TIMER_LEAD + i * TIMER_PERIOD, timeout, (timer,)))
+    over.wait(TIMER_LEAD + TIMER_SAMPLES * TIMER_PERIOD + 5.)
+    if not samples:
+        return {}
+    metrics = latency_metrics('timer_jitter.' + name, samples)
+    metrics['timer_jitter.{}.max_us'.format(name)] = max(samples) * 1e6
+    return metrics
+
+def bench_memory_per_action():
+    """
+    memory allocated per action of a sequence
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    sequence = Sequence("memory")
+    sequence.add_actions([Function(lambda cb: cb()).wait() for i in range(MEMORY_ACTIONS)])
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return {'memory_per_action_bytes': allocated / MEMORY_ACTIONS}
+
+
+def run_once(gpio, timer_service) -> dict:
+    metrics = {}
+    with quiet():
+        metrics.update(bench_sequence_step())
+        metrics.update(bench_callback_latency())
+    metrics.update(bench_obstacle_stop())
+    metrics.update(bench_gpio_edge(gpio))
+    metrics.update(bench_timer_jitter(clock.Clock(), 'python'))
+    if not timer_service is None:
+        metrics.update(bench_timer_jitter(clock.NativeClock(), 'native'))
+    metrics.update(bench_memory_per_action())
+    return metrics
+
+def run(gpio_lib = None, timer_lib = None, repeat = DEFAULT_REPEAT) -> dict:
+    """
+    returns the best value of each metric over repeat runs
+    """
+    action.debug = False
+    gpio = import_native('gpio', os.path.join(ROOT, 'rpi_gpio', 'python_binding.py'), gpio_lib)
+    timer_service = import_native('timer_service',
+                                  os.path.join(ROOT, 'callbacks_python', 'timer_service_binding.py'),
+                                  timer_lib)
+    if timer_service is None:
+        print("[i] timer_service module not found, native timer benchmark skipped")
+
+    metrics = {}
+    for i in range(repeat):
+        for name, value in run_once(gpio, timer_service).items():
+            metrics[name] = min(value, metrics.get(name, value))
+    if not timer_service is None:
+        timer_service.join()
+    return metrics
+
+def is_checked(name) -> bool:
+    """
+    False for the metrics printed but not compared to their baselines
+    """
+    if '.p99_' in name or '.max_' in name:
+        return False
+    #the timer jitter above the median is the scheduling of the OS
+    return not (name.startswith('timer_jitter.') and '.p90_' in name)
+
+def compare(metrics, baselines, tolerance, tail_tolerance) -> list:
+    """
+    prints the metrics and returns the names of those that regressed
+    all the metrics are better when lower
+    """
+    regressions = []
+    for name in sorted(metrics):
+        value = metrics[name]
+        line = "{:45} {:12.2f}".format(name, value)
+        if name in baselines:
+            baseline = baselines[name]
+            line += "   baseline {:12.2f}".format(baseline)
+            is_tail = '.p90_' in name
+            if not is_checked(name):
+                line += "   (not checked)"
+            elif value > baseline * (1 + (tail_tolerance if is_tail else tolerance)):
+                line += "   [!] REGRESSION"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the framework on the simulated robot")
+    parser.add_argument('--baselines', default=BASELINES)
+    parser.add_argument('--save', action='store_true', help="stores the results as baselines")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--tail-tolerance', type=float, default=TAIL_TOLERANCE)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--baseline-runs', type=int, default=BASELINE_RUNS,
+                        help="number of runs whose median is saved by --save")
+    parser.add_argument('--gpio-lib', help="libGPIO_sim.so built by make sim in rpi_gpio")
+    parser.add_argument('--timer-lib', help="libtimer_service.so built in callbacks_python")
+    args = parser.parse_args()
+
+    if args.save:
+        runs = [run(args.gpio_lib, args.timer_lib, args.repeat) for i in range(args.baseline_runs)]
+        metrics = {name: statistics.median(result[name] for result in runs if name in result)
+                   for name in runs[0]}
+        with open(args.baselines, "w") as f:
+            json.dump(metrics, f, indent=4, sort_keys=True)
+        compare(metrics, {}, args.tolerance, args.tail_tolerance)
+        print("[+] Baselines saved in", args.baselines)
+        sys.exit(0)
+
+    metrics = run(args.gpio_lib, args.timer_lib, args.repeat)
+    baselines = {}
+    if os.path.isfile(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+    else:
+        print("[-] No baselines in", args.baselines)
+    regressions = compare(metrics, baselines, args.tolerance, args.tail_tolerance)
+    if regressions:
+        print("[-]", len(regressions), "regression(s):", ", ".join(regressions))
+        sys.exit(1)
+    print("[+] No regression")
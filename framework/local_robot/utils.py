@@ -1,8 +1,7 @@
 
 #Temporary AX12 and Moving_Interface classes
 
-from threading import Thread
-import time
+import clock
 
 
 class AX12:
@@ -13,10 +12,10 @@ class AX12:
     def move_to(self, position=(0,0), callback=None):
         print("[!!] We are moving in AX12 "+str(self.id)+" to "+str(position)+" (to be replaced with interface code)")
         self.callback = callback
-        t = Thread(target=lambda: self.run()).start()
+        #no thread waits for the end of the move
+        clock.get_clock().call_later(2.5, self.private_done)
 
-    def run(self):
-        time.sleep(2.5)
+    def private_done(self):
         if self.callback is not None:
             self.callback()
 
@@ -1,55 +1,39 @@
 #import the library
 
-from robot import Robot
+from action import Sequence, Parallel, Function, AX12MoveAction
 from AX12 import AX12
 
-# ---------------------------   ROBOT CONSTRUCTION   --------------------------#
-#creates the robot skeleton
-r = Robot()
-
-#adds motors to the robot skeleton
-r.add_object(AX12(130), "motor_1")
-r.add_object(AX12(121), "motor_2")
+# ---------------------------   MOTORS   --------------------------------------#
+motor_1 = AX12(130)
+motor_2 = AX12(121)
 
 
 # -------------------------   SEQUENCE DEFINITION ----------------------------#
-#TODO: cant find add_parallel / add_sequence?
-
-#TODO: implement add_parallel
-#TODO: implement add_sequence
 
 #defines a sequence of actions
 #note that the sequence is only defined and not run (for the moment)
-r.add_sequence("seq_1")
+seq_1 = Sequence("seq_1")
 
 #first block of actions; all actions of a block are performed simultaneously
-r.add_parallel(r.motor_1.move, [100])
-r.add_parallel(r.motor_2.move, [150])
-#the "wait" defines the end of the block
-#and it waits :
-# 	until max_delay seconds are elapsed
-# 	OR until n_callbacks actions of this block are done
-r.wait(max_delay=3, n_callbacks=2)
-
+#the block is over :
+# 	when max_delay seconds are elapsed
+# 	OR when n_callbacks actions of this block are done
+#the actions that are not over are then cancelled (and go to their cancel position)
+block_1 = Parallel("block_1", n_callbacks=2, max_delay=3)
+block_1.add_actions([AX12MoveAction(motor_1, 100, 0),
+                     AX12MoveAction(motor_2, 150, 0)])
 
 #second block of actions; this block will be run AFTER the first one
-r.add_parallel(r.motor_1.turn, [100], False)
-r.wait(max_delay=5, n_callbacks=1)
+block_2 = Parallel("block_2", n_callbacks=1, max_delay=5)
+block_2.add_action(Function(motor_1.turn, [100], None))
 
-r.add_parallel(r.motor_1.turn, [0], False)
-r.wait()
-#you MUST specify where the definition of the sequence ends
-# so the following line means "end of seq_1 definition"
-r.sequence_done()
+seq_1.add_actions([block_1.wait(),
+                   block_2.wait(),
+                   Function(motor_1.turn, [0], None)])
 
 
 # --------------------- RUNNING ! ------------------------------------------#
 
-# We run the sequence we defined above
-r.start_sequence("seq_1")
-
-# We wait the end of the sequence execution
-r.wait_sequence()
-
-#close the thread
-r.stop()
+# We run the sequence we defined above and wait for the end of its execution
+seq_1.wait()
+seq_1.exec()
@@ -0,0 +1,138 @@
+"""
+Cooperative cancellation of the actions.
+A CancellationToken is shared by a whole action tree: the running actions
+register their cancel hook on it, the sequences check it before starting their
+next action. Cancelling the token calls all the hooks in parallel (on the worker
+pool) and waits for them at most CANCEL_TIMEOUT seconds.
+
+By default, the actions use the root token, which is cancelled by Robot.stop:
+
+    get_root_token().cancel("end of match")
+"""
+
+from threading import Condition, Lock
+
+import worker_pool
+
+#maximal delay (s) given to the cancel hooks by cancel
+CANCEL_TIMEOUT = 0.5
+
+
+class CancellationToken:
+    """
+    Cancelled once; a child token is cancelled with its parent
+    """
+    def __init__(self, parent : 'CancellationToken' = None):
+        self.cancelled = False
+        self.reason = None
+        self.mutex = Lock()
+        self.hooks = {}
+        self.hook_counter = 0
+        self.children = []
+        self.parent = parent
+        if not parent is None:
+            with parent.mutex:
+                if parent.cancelled:
+                    self.cancelled = True
+                    self.reason = parent.reason
+                else:
+                    parent.children.append(self)
+
+    def register(self, hook : callable):
+        """
+        hook is called when the token is cancelled
+        returns an index for unregister, or None if the token is already cancelled
+        """
+        with self.mutex:
+            if self.cancelled:
+                return None
+            self.hook_counter += 1
+            self.hooks[self.hook_counter] = hook
+            return self.hook_counter
+
+    def unregister(self, index):
+        if index is None:
+            return
+        with self.mutex:
+            self.hooks.pop(index, None)
+
+    def child(self) -> 'CancellationToken':
+        return CancellationToken(self)
+
+    def detach(self):
+        """
+        the token is not cancelled with its parent anymore
+        to be called once it is not used, so that the parent does not keep it
+        """
+        if self.parent is None:
+            return
+        with self.parent.mutex:
+            if self in self.parent.children:
+                self.parent.children.remove(self)
+        self.parent = None
+
+    def private_collect(self, reason, hooks):
+        """
+        cancels the token and its children, and appends their hooks to hooks
+        """
+        with self.mutex:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            self.reason = reason
+            hooks += self.hooks.values()
+            self.hooks = {}
+            children, self.children = self.children, []
+        for child in children:
+            child.private_collect(reason, hooks)
+
+    def cancel(self, reason : str = None, timeout : float = CANCEL_TIMEOUT) -> bool:
+        """
+        calls all the hooks of the token and of its children in parallel
+        returns False if some of them are not over after timeout seconds
+        """
+        hooks = []
+        self.private_collect(reason, hooks)
+        if not hooks:
+            return True
+
+        condvar = Condition()
+        running = [len(hooks)]
+        def run_hook(hook):
+            try:
+                hook()
+            finally:
+                with condvar:
+                    running[0] -= 1
+                    condvar.notify_all()
+
+        for hook in hooks:
+            worker_pool.submit(run_hook, (hook,), worker_pool.PRIORITY_HIGH)
+
+        with condvar:
+            over = condvar.wait_for(lambda: running[0] == 0, timeout)
+        if not over:
+            print("[-] Cancel hooks still running after", timeout, "s")
+        return over
+
+    def is_cancelled(self) -> bool:
+        return self.cancelled
+
+
+root_token = None
+root_token_mutex = Lock()
+
+def get_root_token() -> CancellationToken:
+    global root_token
+    with root_token_mutex:
+        if root_token is None:
+            root_token = CancellationToken()
+        return root_token
+
+def set_root_token(token : CancellationToken):
+    """
+    replaces the root token, for instance to execute actions again once it has
+    been cancelled
+    """
+    global root_token
+    root_token = token
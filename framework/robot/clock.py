@@ -0,0 +1,233 @@
+"""
+Clock shared by the whole framework.
+Every timeout, delay or period should go through get_clock() instead of
+calling time.time() or time.sleep() directly, so that the real time clock can be
+replaced by a VirtualClock, which runs a full match in a few milliseconds:
+
+    set_clock(VirtualClock())
+    ...
+    get_clock().run()   # executes all the scheduled events, in time order
+"""
+
+from threading import Thread, Condition, current_thread
+import heapq
+import time
+import traceback
+
+#with a virtual clock, delay in real time between two checks of a condition
+#that can only be changed by another thread
+REAL_TIME_POLL = 0.01
+
+
+class ClockTimer:
+    """
+    A function call scheduled with Clock.call_later
+    """
+    def __init__(self, deadline, function, args):
+        self.deadline = deadline
+        self.function = function
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def private_run(self):
+        if self.cancelled:
+            return
+        try:
+            self.function(*self.args)
+        except Exception:
+            print("[-] Exception in timer callback")
+            traceback.print_exc()
+
+
+class Clock:
+    """
+    Real time clock. All the timers are handled by a single thread.
+    """
+    is_virtual = False
+
+    def __init__(self):
+        self.timers = []
+        self.timer_counter = 0
+        self.condvar = Condition()
+        self.thread = None
+
+    def time(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, delay : float):
+        time.sleep(max(delay, 0))
+
+    def call_later(self, delay : float, function : callable, args : tuple = ()) -> ClockTimer:
+        """
+        calls function(*args) after delay seconds, in the timer thread
+        the timer can be cancelled with timer.cancel()
+        """
+        timer = ClockTimer(self.time() + delay, function, args)
+        with self.condvar:
+            self.timer_counter += 1
+            heapq.heappush(self.timers, (timer.deadline, self.timer_counter, timer))
+            if self.thread is None:
+                self.thread = Thread(target=self.private_run, name="clock-timers")
+                self.thread.daemon = True
+                self.thread.start()
+            self.condvar.notify()
+        return timer
+
+    def wait_for(self, condvar : Condition, predicate : callable, timeout : float = None) -> bool:
+        """
+        same as condvar.wait_for(predicate, timeout); condvar must be acquired
+        """
+        return condvar.wait_for(predicate, timeout)
+
+    def private_run(self):
+        while True:
+            with self.condvar:
+                while not self.timers or self.timers[0][0] > self.time():
+                    self.condvar.wait(self.timers[0][0] - self.time() if self.timers else None)
+                timer = heapq.heappop(self.timers)[2]
+            timer.private_run()
+
+
+class NativeClockTimer(ClockTimer):
+    def cancel(self):
+        ClockTimer.cancel(self)
+        self.native_timer.cancel()
+
+
+class NativeClock(Clock):
+    """
+    Real time clock whose timers are handled by the native timer service
+    (callbacks_python/timer_service.cpp) instead of a python thread
+    """
+    def __init__(self):
+        Clock.__init__(self)
+        import timer_service
+        self.timer_service = timer_service
+
+    def call_later(self, delay : float, function : callable, args : tuple = ()) -> ClockTimer:
+        timer = NativeClockTimer(self.time() + delay, function, args)
+        timer.native_timer = self.timer_service.call_later(max(delay, 0), timer.private_run)
+        return timer
+
+
+class VirtualClock(Clock):
+    """
+    Discrete-event clock: the time does not flow by itself, it jumps from an
+    event to the next one when the clock is driven by run, advance, sleep or
+    wait_for. The scheduled functions are called by the thread driving the clock.
+    The driver is the thread that created the clock. In the other threads,
+    sleep and wait_for do not drive the clock, they wait for the driver to make
+    the time flow.
+    """
+    is_virtual = True
+
+    def __init__(self, start : float = 0.):
+        Clock.__init__(self)
+        self.now = start
+        self.driver = current_thread()
+        # Notified whenever the time changes
+        self.lock = Condition()
+
+    def time(self) -> float:
+        return self.now
+
+    def call_later(self, delay : float, function : callable, args : tuple = ()) -> ClockTimer:
+        with self.lock:
+            timer = ClockTimer(self.now + max(delay, 0), function, args)
+            self.timer_counter += 1
+            heapq.heappush(self.timers, (timer.deadline, self.timer_counter, timer))
+        return timer
+
+    def step(self, deadline : float = None) -> bool:
+        """
+        executes the next event if it happens before deadline
+        returns False if there is no such event
+        """
+        with self.lock:
+            if not self.timers or (deadline is not None and self.timers[0][0] > deadline):
+                return False
+            timer = heapq.heappop(self.timers)[2]
+            self.private_set_time(timer.deadline)
+        timer.private_run()
+        return True
+
+    def private_set_time(self, now : float):
+        """
+        must be called with lock acquired
+        """
+        if now > self.now:
+            self.now = now
+            self.lock.notify_all()
+
+    def is_driver(self) -> bool:
+        return current_thread() is self.driver
+
+    def run_until(self, deadline : float):
+        while self.step(deadline):
+            pass
+        with self.lock:
+            self.private_set_time(deadline)
+
+    def advance(self, delay : float):
+        self.run_until(self.now + delay)
+
+    def run(self):
+        """
+        executes events until none is left
+        """
+        while self.step():
+            pass
+
+    def sleep(self, delay : float):
+        if self.is_driver():
+            self.advance(delay)
+            return
+        with self.lock:
+            deadline = self.now + delay
+            while self.now < deadline:
+                self.lock.wait(REAL_TIME_POLL)
+
+    def wait_for(self, condvar : Condition, predicate : callable, timeout : float = None) -> bool:
+        deadline = None if timeout is None else self.now + timeout
+        if not self.is_driver():
+            while not predicate():
+                if deadline is not None and self.now >= deadline:
+                    return predicate()
+                condvar.wait(REAL_TIME_POLL)
+            return True
+
+        while not predicate():
+            condvar.release()
+            try:
+                progressed = self.step(deadline)
+            finally:
+                condvar.acquire()
+            if progressed:
+                continue
+            if deadline is not None:
+                with self.lock:
+                    self.private_set_time(deadline)
+                return predicate()
+            #nothing is scheduled: only another thread can change the condition
+            condvar.wait(REAL_TIME_POLL)
+        return True
+
+
+default_clock = None
+
+def get_clock() -> Clock:
+    global default_clock
+    if default_clock is None:
+        default_clock = Clock()
+    return default_clock
+
+def set_clock(clock : Clock):
+    """
+    replaces the clock used by the framework
+    must be called before constructing robots and actions
+    """
+    global default_clock
+    default_clock = clock
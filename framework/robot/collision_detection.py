@@ -1,67 +1,206 @@
+from threading import Lock
 import time, math
-import motion
+
+import clock
 
 #all distances are in mm
 TABLE_DIMENSION     = [3000, 2000]
 NO_SENSOR_DISTANCE  = 300
 SENSOR_RANGE        = 200
+OPPONENT_RADIUS     = 200
 
 #all durations are in seconds
 SENSOR_MANAGER_PERIOD = 0.05
 DELAY_BEFORE_BYPASSING_OBSTACLE = 2
 
+#detours around obstacles (see get_intermediate_goal)
+DETOUR_LENGTH = 400         #mm, distance between the center of the obstacle and the detour point
+DETOUR_EDGE_MARGIN = 200    #mm, minimal distance between the detour point and the edges
+
+#resolution of the near-edge mask of ObstaclePipeline
+EDGE_MASK_RESOLUTION = 50   #mm
+EDGE_MASK_SECTORS = 36      #heading sectors of 10 degrees
+
 def closest_distance_to_edge(x, y):
     return min([x, y, TABLE_DIMENSION[0] - x, TABLE_DIMENSION[1] - y])
 
-def get_intermediate_goal(robot, front_obstacle, rear_obstacle):
+def get_intermediate_goal(robot, rear_obstacle=False, pose=None):
     """
         computes a new point to reach before going to the final goal
-        the idea is to avoid an obstacle
-        front obstacle, rear_obstacle == booleans
+        the idea is to avoid an obstacle: the point is on the side of the
+        obstacle, DETOUR_LENGTH away from it
+        returns None if both sides are too close from the edges
+        pose is the pose of the robot (robot.get_pose() by default)
     """
-    DETOUR_LENGTH = 200 #mm
-    x = robot.get_pos_X()
-    y = robot.get_pos_Y()
-    theta = robot.get_heading() * math.pi / 180.
+    if pose is None:
+        pose = robot.get_pose()
+    theta = pose.heading * math.pi / 180.
+    if rear_obstacle:
+        theta += math.pi
 
-    p_left_x    = x + DETOUR_LENGTH * math.cos(theta - math.pi / 2.)
-    p_left_y    = y + DETOUR_LENGTH * math.sin(theta - math.pi / 2.)
-    p_right_x   = x + DETOUR_LENGTH * math.cos(theta + math.pi / 2.)
-    p_right_y   = y + DETOUR_LENGTH * math.sin(theta + math.pi / 2.)
+    ahead_x, ahead_y = get_obstacle_position(robot, rear_obstacle, pose)
+
+    p_left_x    = ahead_x + DETOUR_LENGTH * math.cos(theta - math.pi / 2.)
+    p_left_y    = ahead_y + DETOUR_LENGTH * math.sin(theta - math.pi / 2.)
+    p_right_x   = ahead_x + DETOUR_LENGTH * math.cos(theta + math.pi / 2.)
+    p_right_y   = ahead_y + DETOUR_LENGTH * math.sin(theta + math.pi / 2.)
 
     #we go as far from edges as possible
-    if (closest_distance_to_edge(p_left_x, p_left_y)
-            > closest_distance_to_edge(p_right_x, p_right_y)):
+    left = closest_distance_to_edge(p_left_x, p_left_y)
+    right = closest_distance_to_edge(p_right_x, p_right_y)
+    if max(left, right) < DETOUR_EDGE_MARGIN:
+        return None
+    if left > right:
         return (int(p_left_x), int(p_left_y))
     return (int(p_right_x), int(p_right_y))
 
 
+def get_obstacle_position(robot, rear_obstacle=False, pose=None):
+    """
+        estimated position of the center of an obstacle seen by a sensor
+        (an opponent whose edge is at SENSOR_RANGE)
+    """
+    if pose is None:
+        pose = robot.get_pose()
+    theta = pose.heading * math.pi / 180.
+    distance = (SENSOR_RANGE + OPPONENT_RADIUS) * (-1 if rear_obstacle else 1)
+    return (pose.x + distance * math.cos(theta),
+            pose.y + distance * math.sin(theta))
+
+
+AVOIDANCE_STOP = "stop"
+AVOIDANCE_WAIT_THEN_BYPASS = "wait_then_bypass"
+AVOIDANCE_REROUTE = "reroute"
+avoidance_modes = [AVOIDANCE_STOP, AVOIDANCE_WAIT_THEN_BYPASS, AVOIDANCE_REROUTE]
+
+
+class AvoidancePolicy:
+    """
+    Reaction of the robot to an obstacle on its way:
+        AVOIDANCE_STOP: the robot stops and waits for the obstacle to go away
+        AVOIDANCE_WAIT_THEN_BYPASS: the robot stops, and goes around the
+            obstacle if it is still there after delay seconds
+        AVOIDANCE_REROUTE: the robot goes around the obstacle at once
+
+    The detour leads to the current goal of moveTo. It is computed by planner
+    (a path_planning.PathPlanner or a path_table.PathTable) if given, so that
+    it avoids the known obstacles; otherwise the robot goes to a point on the
+    side of the obstacle (see get_intermediate_goal).
+    The detour is inserted in the moveTo stack of the robot, so the orders
+    given before the obstacle and their callbacks are kept.
+    """
+    def __init__(self, mode : str = AVOIDANCE_STOP, delay : float = DELAY_BEFORE_BYPASSING_OBSTACLE,
+                 planner = None):
+        assert (mode in avoidance_modes)
+        self.mode = mode
+        self.delay = delay
+        self.planner = planner
+        self.timer = None
+        self.mutex = Lock()
+
+    def obstacle_detected(self, robot, rear : bool):
+        """
+        called when an obstacle is detected; stops the robot
+        """
+        robot.stop_motion()
+        if self.mode == AVOIDANCE_REROUTE:
+            if self.bypass(robot, rear):
+                return
+        if self.mode != AVOIDANCE_STOP:
+            self.private_start_timer(robot, rear)
+
+    def obstacle_gone(self, robot):
+        """
+        called when the obstacle that stopped the robot is not detected anymore
+        """
+        self.private_cancel_timer()
+        robot.resume_motion()
+
+    def cancel(self):
+        """
+        the robot does not go around the obstacle anymore (end of the match)
+        """
+        self.private_cancel_timer()
+
+    def private_start_timer(self, robot, rear):
+        with self.mutex:
+            if not self.timer is None:
+                self.timer.cancel()
+            self.timer = clock.get_clock().call_later(self.delay, self.private_timeout,
+                                                      (robot, rear))
+
+    def private_cancel_timer(self):
+        with self.mutex:
+            if not self.timer is None:
+                self.timer.cancel()
+                self.timer = None
+
+    def private_timeout(self, robot, rear):
+        with self.mutex:
+            self.timer = None
+        if not robot.obstacle_stop or robot.motion_disabled:
+            return
+        print("[i] Obstacle is still there, bypassing it")
+        if not self.bypass(robot, rear):
+            #no way around it for now, we try again later
+            self.private_start_timer(robot, rear)
+
+    def compute_detour(self, robot, rear : bool) -> list:
+        """
+        returns the list of points [(x0, y0), ...] to go through before the
+        current goal, None if there is no way around the obstacle
+        the detour leads to the goal given to moveTo, not to the points of a
+        previous detour
+        """
+        goal = robot.current_goal(include_detour=False)
+        if goal is None:
+            return None
+        pose = robot.get_pose()
+        if not self.planner is None:
+            path = self.planner.plan(pose.position(), (goal.x, goal.y),
+                                     [get_obstacle_position(robot, rear, pose)])
+            return None if path is None else path[:-1]
+        point = get_intermediate_goal(robot, rear, pose)
+        return None if point is None else [point]
+
+    def bypass(self, robot, rear : bool) -> bool:
+        """
+        sends the robot around the obstacle; returns False if it is not possible
+        """
+        detour = self.compute_detour(robot, rear)
+        if detour is None:
+            print("[-] No way around the obstacle")
+            return False
+        robot.splice_detour(detour)
+        return True
+
+
 def is_collision(robot, front_detection, rear_detection):
 
     #disable collision_detection when robot is turning
     if robot.turning:
         return False, False
 
-    x = robot.get_pos_X()
-    y = robot.get_pos_Y()
+    pose = robot.get_pose()
+    x = pose.x
+    y = pose.y
 
-    theta = robot.get_heading()
-    tmp = theta * math.pi / 180.
+    tmp = pose.heading * math.pi / 180.
 
     dx = SENSOR_RANGE * math.cos(tmp)
     dy = SENSOR_RANGE * math.sin(tmp)
 
     forward_obstacle = False
     backward_obstacle = False
-    direction = robot.getDirection()
+    direction = pose.direction
 
     #if the robot is close from an edge, the sensors are ignored
-    if (direction == motion.DIR_FORWARD and front_detection()
+    if (direction == robot.motion.DIR_FORWARD and front_detection()
         and closest_distance_to_edge(x + dx, y + dy) >= NO_SENSOR_DISTANCE):
         print("front obstacle detected at ", x + dx, y + dy, " ; (x, y) = ", x, y)
         forward_obstacle = True
 
-    if (direction == motion.DIR_BACKWARD and rear_detection()
+    if (direction == robot.motion.DIR_BACKWARD and rear_detection()
         and closest_distance_to_edge(x - dx, y - dy) >= NO_SENSOR_DISTANCE):
         print("rear obstacle detected at ", x - dx, y - dy, " ; (x, y) = ", x, y)
         backward_obstacle = True
@@ -75,49 +214,171 @@ def sensor_manager(robot, front_detection, rear_detection):
 
         this function assumes +x axis corresponds to heading 0 degree
         and +y axis corresponds to heading 90 degrees
+
+        the reaction to the obstacles is given by robot.avoidance (see AvoidancePolicy)
     """
 
-    must_resume = False
+    stopped_by_rear = False
 
     print("[i] collision detection started.")
 
     while robot.enable_collision_detection:
 
-        forward_obstacle, backward_obstacle = is_collision(robot,
-                                                front_detection, rear_detection)
-        if forward_obstacle or backward_obstacle:
-            if forward_obstacle: print("[!] obstacle detected forwards!")
-            if backward_obstacle: print("[!] obstacle detected backwards!")
-            robot.stop_motion()
-            must_resume = True
-            time.sleep(DELAY_BEFORE_BYPASSING_OBSTACLE)
+        if robot.obstacle_stop:
+            #the robot does not move anymore, so is_collision cannot be used
+            if not (rear_detection() if stopped_by_rear else front_detection()):
+                print("[i] Obstacle is gone! Resuming...")
+                robot.avoidance.obstacle_gone(robot)
+        else:
+            forward_obstacle, backward_obstacle = is_collision(robot,
+                                                    front_detection, rear_detection)
+            if forward_obstacle or backward_obstacle:
+                if forward_obstacle: print("[!] obstacle detected forwards!")
+                if backward_obstacle: print("[!] obstacle detected backwards!")
+                stopped_by_rear = backward_obstacle
+                robot.avoidance.obstacle_detected(robot, stopped_by_rear)
+
+        clock.get_clock().sleep(SENSOR_MANAGER_PERIOD)
 
-            ## -------------------- MEANS OUR STRATEGY IS STOP ------------###
-            #must be improved !!!!!!
-            continue
 
-            #check if obstacle is still there
-            forward_obstacle, backward_obstacle = is_collision(robot,
-                                                front_detection, rear_detection)
-            if not forward_obstacle and not backward_obstacle:
-                continue
-
-            x, y = get_intermediate_goal(robot, forward_obstacle,
-                                                backward_obstacle, erase=False)
-            robot.moveTo(x, y, final_heading=-1, callback=None)
-            robot.emergency_resume()
-
-        elif must_resume:
-            print("Obstacle is gone! Resuming...")
-            x = robot.get_pos_X()
-            y = robot.get_pos_Y()
-            theta = robot.get_heading()
-            tmp = theta * math.pi / 180.
-            dx = SENSOR_RANGE * math.cos(tmp)
-            dy = SENSOR_RANGE * math.sin(tmp)
-            print(robot.getDirection(), front_detection(), closest_distance_to_edge(x + dx, y + dy))
-
-            robot.resume_motion()
-            must_resume = False
-
-        time.sleep(SENSOR_MANAGER_PERIOD)
+def compute_edge_mask(resolution=EDGE_MASK_RESOLUTION, sectors=EDGE_MASK_SECTORS):
+    """
+    returns a bytearray giving, for each cell of the table and each heading
+    sector, 1 if a front sensor looking at this heading from this cell sees a
+    point farther than NO_SENSOR_DISTANCE from the edges (the sensor must not
+    be ignored), 0 otherwise
+    index: (sector * height + j) * width + i
+    """
+    width = int(math.ceil(TABLE_DIMENSION[0] / float(resolution)))
+    height = int(math.ceil(TABLE_DIMENSION[1] / float(resolution)))
+    mask = bytearray(width * height * sectors)
+    index = 0
+    for sector in range(sectors):
+        theta = (sector + .5) * 2 * math.pi / sectors
+        dx = SENSOR_RANGE * math.cos(theta)
+        dy = SENSOR_RANGE * math.sin(theta)
+        for j in range(height):
+            y = (j + .5) * resolution + dy
+            for i in range(width):
+                x = (i + .5) * resolution + dx
+                mask[index] = closest_distance_to_edge(x, y) >= NO_SENSOR_DISTANCE
+                index += 1
+    return mask
+
+
+class ObstaclePipeline:
+    """
+    Edge-triggered collision detection: the sensors are GPIOs whose edges are
+    pushed by the callbacks of the rpi_gpio module, and the robot is stopped
+    from the callback itself. There is no polling thread.
+    When a sensor becomes active, the robot is stopped if it is moving in the
+    direction of the sensor and if the sensor does not point near an edge of
+    the table (this is read in a precomputed mask, there is no trigonometry).
+    Then robot.avoidance decides how to go on (see AvoidancePolicy).
+    The decision does not read the motor board: the direction is the one of
+    the current order (robot.direction), the edge mask is read at the last
+    sampled pose.
+
+    gpio is the rpi_gpio module (gpio.py), or a simulation.SimulatedGPIO
+    active_level is the value of the pins when an obstacle is detected
+    """
+    def __init__(self, robot, front_pin : int, rear_pin : int, gpio, active_level : int = 1):
+        self.robot = robot
+        self.front_pin = front_pin
+        self.rear_pin = rear_pin
+        self.gpio = gpio
+        self.active_level = active_level
+
+        self.resolution = EDGE_MASK_RESOLUTION
+        self.sectors = EDGE_MASK_SECTORS
+        self.width = int(math.ceil(TABLE_DIMENSION[0] / float(self.resolution)))
+        self.height = int(math.ceil(TABLE_DIMENSION[1] / float(self.resolution)))
+        self.edge_mask = compute_edge_mask(self.resolution, self.sectors)
+
+        self.front_active = gpio.digital_read(front_pin) == active_level
+        self.rear_active = gpio.digital_read(rear_pin) == active_level
+        self.stopped_by_rear = False
+        self.enabled = False
+        self.mutex = Lock()
+
+    def start(self):
+        self.enabled = True
+        for pin in [self.front_pin, self.rear_pin]:
+            self.gpio.assign_callback_on_gpio_change(pin,
+                (lambda pin_copy: lambda: self.on_edge(pin_copy))(pin))
+        print("[i] collision detection started.")
+        self.check()
+
+    def stop(self):
+        self.enabled = False
+        for pin in [self.front_pin, self.rear_pin]:
+            self.gpio.remove_callbacks_on_gpio_change(pin)
+
+    def on_edge(self, pin):
+        """
+        called by the GPIO thread when the value of a sensor pin changes
+        """
+        active = self.gpio.digital_read(pin) == self.active_level
+        if pin == self.front_pin:
+            self.front_active = active
+        else:
+            self.rear_active = active
+        self.check()
+
+    def private_sees_obstacle(self, rear : bool, pose) -> bool:
+        """
+        True if the sensor is not pointing near an edge of the table
+        """
+        i = min(max(int(pose.x) // self.resolution, 0), self.width - 1)
+        j = min(max(int(pose.y) // self.resolution, 0), self.height - 1)
+        heading = pose.heading + (180 if rear else 0)
+        sector = int(heading * self.sectors // 360) % self.sectors
+        return self.edge_mask[(sector * self.height + j) * self.width + i] == 1
+
+    def check(self):
+        """
+        stops or resumes the robot according to the state of the sensors
+        called on each edge, and when the robot starts a translation
+        the mutex only protects the decision: the robot and its avoidance
+        policy are called without it
+        """
+        with self.mutex:
+            decision = self.private_decide()
+        if decision == 'gone':
+            print("[i] Obstacle is gone! Resuming...")
+            self.robot.avoidance.obstacle_gone(self.robot)
+        elif decision == 'detected':
+            print("[!] obstacle detected {}!".format("backwards" if self.stopped_by_rear else "forwards"))
+            self.robot.avoidance.obstacle_detected(self.robot, self.stopped_by_rear)
+
+    def private_decide(self) -> str:
+        """
+        returns 'gone' if the robot is to be resumed, 'detected' if it is to
+        be stopped (stopped_by_rear is then set), None otherwise
+        """
+        if not self.enabled:
+            return None
+        if self.robot.obstacle_stop:
+            if not (self.rear_active if self.stopped_by_rear else self.front_active):
+                return 'gone'
+            return None
+
+        #disable collision_detection when robot is turning
+        if self.robot.turning:
+            return None
+        direction = self.robot.direction
+        if direction is None:
+            return None
+        if direction == self.robot.motion.DIR_FORWARD and self.front_active:
+            rear = False
+        elif direction == self.robot.motion.DIR_BACKWARD and self.rear_active:
+            rear = True
+        else:
+            return None
+        #the position changes little between two samples: without any sample,
+        #the robot is stopped
+        pose = self.robot.pose_service.latest()
+        if pose is None or self.private_sees_obstacle(rear, pose):
+            self.stopped_by_rear = rear
+            return 'detected'
+        return None
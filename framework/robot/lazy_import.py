@@ -0,0 +1,52 @@
+"""
+Lazy loading of modules: a LazyModule is imported on its first attribute
+access, not when the module using it is imported. This is used for the native
+modules (motion, motordriver), which load their shared library when they are
+imported, and for the heavy modules used by few functions (asyncio), so that
+they do not delay the startup of the robot (see startup_profile.py).
+
+    motion = LazyModule("motion")
+    motion.moveTo(...)              # motion is imported here
+"""
+
+from threading import Lock
+import importlib.util
+import sys
+
+
+class LazyModule:
+    """
+    Stands for the module name until it is used
+    The attributes of the proxy itself start with private_, so that they do
+    not hide those of the module.
+    """
+    def __init__(self, name : str):
+        self.private_name = name
+        self.private_module = None
+        self.private_mutex = Lock()
+
+    def private_load(self):
+        with self.private_mutex:
+            if self.private_module is None:
+                #through __import__, so that startup_profile measures it
+                self.private_module = __import__(self.private_name)
+        return self.private_module
+
+    def __getattr__(self, attribute):
+        if attribute.startswith('__'):
+            raise AttributeError(attribute)
+        return getattr(self.private_load(), attribute)
+
+    def __dir__(self):
+        return dir(self.private_load())
+
+    def __repr__(self):
+        state = "loaded" if not self.private_module is None else "not loaded"
+        return "<lazy module '{}' ({})>".format(self.private_name, state)
+
+
+def is_available(name : str) -> bool:
+    """
+    True if the module can be imported; it is searched, not imported
+    """
+    return name in sys.modules or not importlib.util.find_spec(name) is None
@@ -0,0 +1,221 @@
+"""
+Path planning on the table.
+The table is discretised into an occupancy grid, computed once from the static
+obstacles (polygons), grown by the radius of the robot. Opponents are added at
+each query as discs. Paths are searched with A* on the grid, then smoothed by
+keeping only the waypoints needed to go around the obstacles in straight lines.
+The result can be given to Sequence.add_path.
+
+Distances are in mm, points are (x, y) tuples.
+"""
+
+import heapq
+import math
+
+from collision_detection import TABLE_DIMENSION, OPPONENT_RADIUS
+
+GRID_RESOLUTION = 50        #mm, size of a cell of the grid
+ROBOT_RADIUS = 150          #mm, distance between the robot center and the obstacles
+
+SQRT_2 = math.sqrt(2)
+
+
+def point_in_polygon(x, y, polygon):
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        xi, yi = polygon[i]
+        xj, yj = polygon[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def distance_to_segment(x, y, a, b):
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length = dx * dx + dy * dy
+    t = 0 if length == 0 else max(0, min(1, ((x - a[0]) * dx + (y - a[1]) * dy) / length))
+    return math.hypot(x - a[0] - t * dx, y - a[1] - t * dy)
+
+
+def distance_to_polygon(x, y, polygon):
+    """
+    0 if the point is inside the polygon
+    """
+    if point_in_polygon(x, y, polygon):
+        return 0
+    return min(distance_to_segment(x, y, polygon[i - 1], polygon[i])
+               for i in range(len(polygon)))
+
+
+class PathPlanner:
+    """
+    obstacles is a list of polygons [(x0, y0), (x1, y1), ...] that the robot
+    must avoid; the table edges are always obstacles.
+    """
+    def __init__(self, obstacles=[], resolution=GRID_RESOLUTION, robot_radius=ROBOT_RADIUS,
+                 table_dimension=TABLE_DIMENSION):
+        self.obstacles = [list(polygon) for polygon in obstacles]
+        self.resolution = resolution
+        self.robot_radius = robot_radius
+        self.width = int(math.ceil(table_dimension[0] / float(resolution)))
+        self.height = int(math.ceil(table_dimension[1] / float(resolution)))
+        self.table_dimension = table_dimension
+
+        # 8-connectivity: for each cell, the list of (neighbour, cost, corner cells)
+        # the corner cells must be free to go diagonally
+        self.adjacency = []
+        for j in range(self.height):
+            for i in range(self.width):
+                neighbours = []
+                for dx in (-1, 0, 1):
+                    for dy in (-1, 0, 1):
+                        if (dx or dy) and 0 <= i + dx < self.width and 0 <= j + dy < self.height:
+                            index = i + j * self.width
+                            neighbours.append((index + dx + dy * self.width,
+                                               SQRT_2 if dx and dy else 1.,
+                                               index + dx, index + dy * self.width))
+                self.adjacency.append(neighbours)
+
+        self.grid = bytearray(self.width * self.height)
+        for j in range(self.height):
+            for i in range(self.width):
+                x, y = self.cell_center(i, j)
+                if self.private_statically_blocked(x, y):
+                    self.grid[i + j * self.width] = 1
+
+    def private_statically_blocked(self, x, y):
+        if min(x, y, self.table_dimension[0] - x, self.table_dimension[1] - y) < self.robot_radius:
+            return True
+        return any(distance_to_polygon(x, y, polygon) < self.robot_radius
+                   for polygon in self.obstacles)
+
+    def cell_center(self, i, j):
+        return ((i + .5) * self.resolution, (j + .5) * self.resolution)
+
+    def cell_of(self, point):
+        i = min(max(int(point[0] // self.resolution), 0), self.width - 1)
+        j = min(max(int(point[1] // self.resolution), 0), self.height - 1)
+        return i, j
+
+    def private_dynamic_cells(self, opponents, opponent_radius):
+        """
+        returns the set of the indexes of the cells blocked by the opponents
+        """
+        blocked = set()
+        radius = opponent_radius + self.robot_radius
+        r_cells = int(math.ceil(radius / float(self.resolution)))
+        for opponent in opponents:
+            ci, cj = self.cell_of(opponent)
+            for j in range(max(cj - r_cells, 0), min(cj + r_cells + 1, self.height)):
+                for i in range(max(ci - r_cells, 0), min(ci + r_cells + 1, self.width)):
+                    x, y = self.cell_center(i, j)
+                    if math.hypot(x - opponent[0], y - opponent[1]) < radius:
+                        blocked.add(i + j * self.width)
+        return blocked
+
+    def is_free(self, point, opponents=[], opponent_radius=OPPONENT_RADIUS):
+        i, j = self.cell_of(point)
+        index = i + j * self.width
+        return not (self.grid[index] or index in self.private_dynamic_cells(opponents, opponent_radius))
+
+    def private_line_of_sight(self, a, b, blocked):
+        """
+        True if the segment [a, b] only crosses free cells
+        """
+        distance = math.hypot(b[0] - a[0], b[1] - a[1])
+        steps = int(distance / (self.resolution * .5)) + 1
+        for k in range(steps + 1):
+            t = k / float(steps)
+            i, j = self.cell_of((a[0] + t * (b[0] - a[0]), a[1] + t * (b[1] - a[1])))
+            if blocked[i + j * self.width]:
+                return False
+        return True
+
+    def plan(self, start, goal, opponents=[], opponent_radius=OPPONENT_RADIUS):
+        """
+        returns a list of waypoints [(x1, y1), ..., goal] going from start to
+        goal (start excluded), None if there is no path
+        opponents is a list of (x, y) positions of the opponents
+        """
+        si, sj = self.cell_of(start)
+        gi, gj = self.cell_of(goal)
+        start_index = si + sj * self.width
+        goal_index = gi + gj * self.width
+
+        blocked = bytearray(self.grid)
+        for index in self.private_dynamic_cells(opponents, opponent_radius):
+            blocked[index] = 1
+        # The robot can always leave its cell and reach the cell of its goal
+        blocked[start_index] = 0
+        blocked[goal_index] = 0
+
+        cells = self.private_a_star(start_index, goal_index, blocked)
+        if cells is None:
+            return None
+
+        # Smoothing: only the cells where the path turns are kept, then the robot
+        # goes straight as long as there is no obstacle
+        corners = [index for previous, index, following in zip(cells, cells[1:], cells[2:])
+                   if index - previous != following - index]
+        points = [tuple(start)] + [self.cell_center(index % self.width, index // self.width)
+                                   for index in corners] + [tuple(goal)]
+        path = []
+        current = points[0]
+        k = 1
+        while k < len(points):
+            last_visible = k
+            while last_visible + 1 < len(points) and \
+                    self.private_line_of_sight(current, points[last_visible + 1], blocked):
+                last_visible += 1
+            current = points[last_visible]
+            path.append((int(current[0]), int(current[1])))
+            k = last_visible + 1
+        return path
+
+    def private_a_star(self, start_index, goal_index, blocked):
+        width = self.width
+        gx, gy = goal_index % width, goal_index // width
+        adjacency = self.adjacency
+        diagonal = SQRT_2 - 1
+
+        costs = [float('inf')] * len(blocked)
+        costs[start_index] = 0.
+        parents = {start_index: None}
+        closed = bytearray(len(blocked))
+        queue = [(0., start_index)]
+        while queue:
+            _, index = heapq.heappop(queue)
+            if index == goal_index:
+                cells = []
+                while index is not None:
+                    cells.append(index)
+                    index = parents[index]
+                return cells[::-1]
+            if closed[index]:
+                continue
+            closed[index] = 1
+            cost = costs[index]
+            for neighbour, step, corner_1, corner_2 in adjacency[index]:
+                if blocked[neighbour] or closed[neighbour]:
+                    continue
+                # no corner cutting
+                if blocked[corner_1] or blocked[corner_2]:
+                    continue
+                new_cost = cost + step
+                if new_cost < costs[neighbour]:
+                    costs[neighbour] = new_cost
+                    parents[neighbour] = index
+                    dx = abs(neighbour % width - gx)
+                    dy = abs(neighbour // width - gy)
+                    heuristic = dy + diagonal * dx if dx < dy else dx + diagonal * dy
+                    heapq.heappush(queue, (new_cost + heuristic, neighbour))
+        return None
+
+    def path_length(self, start, path):
+        length = 0.
+        for point in path:
+            length += math.hypot(point[0] - start[0], point[1] - start[1])
+            start = point
+        return length
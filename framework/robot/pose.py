@@ -0,0 +1,188 @@
+"""
+Pose of the robot, sampled from the motor board.
+Reading the position, the heading and the direction of the robot are separate
+calls to the native modules (each one is an I2C transfer), so values read one
+after the other can come from different instants. The PoseService reads them
+once per sample into a Pose, and keeps the last samples in a ring buffer:
+
+    service = PoseService(robot.backend)
+    service.start()                 # samples every POSE_PERIOD seconds
+    pose = service.current()        # latest sample (sampled again if too old)
+    pose = service.at(t)            # pose at date t, interpolated
+"""
+
+from threading import Lock
+import math
+
+import clock
+from thread_easy_stop import Thread_Easy_Stop
+
+#delay (s) between two samples, and maximal age of the pose given by current
+POSE_PERIOD = 0.01
+#number of samples kept
+POSE_HISTORY = 256
+
+
+class Pose:
+    """
+    State of the robot at date t (clock time, in seconds)
+    Distances are in mm, the heading is in degrees and is 0 on the x axis.
+    direction is one of the DIR_ constants of motion, speed is in mm/s and
+    is negative when the robot goes backwards.
+    """
+    __slots__ = ['t', 'x', 'y', 'heading', 'direction', 'speed']
+
+    def __init__(self, t : float, x : float, y : float, heading : float,
+                 direction : int, speed : float = 0.):
+        self.t = t
+        self.x = x
+        self.y = y
+        self.heading = heading
+        self.direction = direction
+        self.speed = speed
+
+    def position(self) -> tuple:
+        return (self.x, self.y)
+
+    def __repr__(self):
+        return "Pose(t={:.3f}, x={:.1f}, y={:.1f}, heading={:.1f}, direction={}, speed={:.1f})".format(
+            self.t, self.x, self.y, self.heading, self.direction, self.speed)
+
+
+def interpolate_heading(h_0 : float, h_1 : float, ratio : float) -> float:
+    """
+    heading between h_0 and h_1 (degrees), going the shortest way
+    """
+    delta = (h_1 - h_0 + 180.) % 360. - 180.
+    return (h_0 + ratio * delta) % 360.
+
+
+class PoseService:
+    """
+    Samples the pose of the robot and keeps the POSE_HISTORY last samples.
+    backend provides the motion (direction) and motordriver (position and
+    heading) interfaces, as in Robot.
+    Without start, the pose is only sampled when current is called and the
+    latest sample is older than period.
+    """
+    def __init__(self, backend, period : float = POSE_PERIOD, history : int = POSE_HISTORY):
+        self.motion = backend.motion
+        self.motordriver = backend.motordriver
+        self.period = period
+        self.capacity = history
+        self.poses = [None] * history
+        #number of samples since the creation, the newest is at (count - 1) % capacity
+        self.count = 0
+        #the latest sample does not match the state of the robot anymore
+        self.stale = False
+        self.mutex = Lock()
+        self.thread = None
+
+    def sample(self) -> Pose:
+        """
+        reads the pose on the motor board and appends it to the history
+        """
+        x = self.motordriver.get_pos_X()
+        y = self.motordriver.get_pos_Y()
+        heading = self.motordriver.get_heading()
+        direction = self.motion.getDirection()
+        t = clock.get_clock().time()
+
+        with self.mutex:
+            previous = self.poses[(self.count - 1) % self.capacity] if self.count else None
+            speed = 0.
+            if not previous is None and t > previous.t and direction != self.motion.DIR_NONE:
+                speed = math.hypot(x - previous.x, y - previous.y) / (t - previous.t)
+                if direction == self.motion.DIR_BACKWARD:
+                    speed = -speed
+            pose = Pose(t, x, y, heading, direction, speed)
+            self.poses[self.count % self.capacity] = pose
+            self.count += 1
+            self.stale = False
+        return pose
+
+    def latest(self) -> Pose:
+        """
+        last sampled pose, None if there is none
+        """
+        with self.mutex:
+            return self.poses[(self.count - 1) % self.capacity] if self.count else None
+
+    def current(self, max_age : float = None) -> Pose:
+        """
+        latest pose, sampled again if it is older than max_age (period by
+        default); with max_age = 0, the pose is always sampled
+        """
+        max_age = self.period if max_age is None else max_age
+        pose = self.latest()
+        if pose is None or self.stale or clock.get_clock().time() - pose.t >= max_age:
+            pose = self.sample()
+        return pose
+
+    def invalidate(self):
+        """
+        the next call to current samples the pose again
+        to be called when the pose is changed by an order (setPosition,
+        moveTo...)
+        """
+        self.stale = True
+
+    def history(self) -> list:
+        """
+        kept poses, from the oldest to the newest
+        """
+        with self.mutex:
+            first = max(self.count - self.capacity, 0)
+            return [self.poses[i % self.capacity] for i in range(first, self.count)]
+
+    def at(self, t : float) -> Pose:
+        """
+        pose at date t, interpolated between the two samples around it
+        the oldest (newest) kept pose is returned if t is before (after) it,
+        None if there is no sample
+        """
+        with self.mutex:
+            first = max(self.count - self.capacity, 0)
+            if self.count == 0:
+                return None
+            get = lambda i: self.poses[i % self.capacity]
+            if t <= get(first).t:
+                return get(first)
+            if t >= get(self.count - 1).t:
+                return get(self.count - 1)
+            #binary search of the first sample after t
+            low, high = first, self.count - 1
+            while low < high:
+                middle = (low + high) // 2
+                if get(middle).t <= t:
+                    low = middle + 1
+                else:
+                    high = middle
+            before, after = get(low - 1), get(low)
+
+        ratio = (t - before.t) / (after.t - before.t)
+        return Pose(t,
+                    before.x + ratio * (after.x - before.x),
+                    before.y + ratio * (after.y - before.y),
+                    interpolate_heading(before.heading, after.heading, ratio),
+                    before.direction,
+                    before.speed + ratio * (after.speed - before.speed))
+
+    def start(self):
+        """
+        samples the pose every period seconds, in a thread
+        with a VirtualClock, it must be stopped before get_clock().run()
+        """
+        if not self.thread is None and self.thread.is_alive():
+            return
+        self.thread = Thread_Easy_Stop(self.private_tick, self.period)
+        self.thread.start()
+
+    def private_tick(self, elapsed) -> bool:
+        self.sample()
+        return True
+
+    def stop(self):
+        if not self.thread is None:
+            self.thread.stop()
+            self.thread.join()
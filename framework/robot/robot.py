@@ -1,16 +1,22 @@
-from threading import Thread, Lock
+from threading import Thread, Lock, RLock
+from collections import deque
 import types
 import time
 import math
 
-import json
-from os import listdir
-import os
-import signal
-
-import motion
-import motordriver
 import collision_detection
+import cancellation
+import clock
+import lazy_import
+import pose
+import tracing
+import trajectory
+
+#only used by the *_future methods, imported on their first call
+asyncio = lazy_import.LazyModule("asyncio")
+
+#these functions of motion change the pose of the robot (see pose.py)
+POSE_SETTERS = ["setPosition", "set_heading"]
 
 class Position:
     """
@@ -19,13 +25,15 @@ class Position:
     Distances are in mm.
     The heading angle is in degrees and is 0 on the x axis.
     Callback is a function called when the position is reached.
+    detour is True for the positions inserted by splice_detour.
     """
     def __init__(self, x : int = 0, y : int = 0, heading : int = 0, 
-            callback : callable = lambda: None):
+            callback : callable = lambda: None, detour : bool = False):
         self.x = x
         self.y = y
         self.heading = heading
         self.callback = callback
+        self.detour = detour
 
 class Distance:
     """
@@ -38,15 +46,33 @@ class Distance:
         self.dist = dist
         self.callback = callback
 
+class NativeBackend:
+    """
+    Default backend of Robot: the native motion and motordriver modules
+    driving the motor board
+    """
+    def __init__(self):
+        if not (lazy_import.is_available("motion") and lazy_import.is_available("motordriver")):
+            #off the robot: a backend must be given to Robot (see simulation.py)
+            raise ImportError("motion and motordriver modules are not installed, "
+                              "use a simulated backend (see simulation.py)")
+        #they load their library when imported: this is done at their first use
+        self.motion = lazy_import.LazyModule("motion")
+        self.motordriver = lazy_import.LazyModule("motordriver")
+
 class Robot:
     """
     Represents a robot on which we can add objects (like AX12 motors for example).
     To program actions on this robot, see action.py
     """
 
-    def __init__(self, debug=True, moving_interface=True):
+    def __init__(self, debug=True, moving_interface=True, backend=None):
         """
         Constructs a new Robot object, and launch the sequence thread
+
+        backend provides the motion and motordriver interfaces; by default
+        these are the native modules, simulation.SimulatedBackend can be used
+        to run the robot without hardware
         """
 
         self.debug = debug
@@ -57,24 +83,43 @@ class Robot:
         self.expected_callback_indexes = []
         self.current_callback_index = 0
 
-        self.t_0 = time.time()
+        self.t_0 = clock.get_clock().time()
 
         self.to_call_at_stop = None
 
+        #edge-triggered collision detection, see start_collision_events
+        self.obstacle_pipeline = None
+
         if moving_interface:
+            self.backend = NativeBackend() if backend is None else backend
+            self.motion = self.backend.motion
             self.moving_interface = True
             self.actual_path = None
 
-            #variables for moveTo
-            self.dest_position_stack = []
+            #variables for moveTo: the positions to reach, in order (the
+            #first one is the goal sent to motion) and the number of the
+            #goal sent to motion, whose callbacks are the only ones taken
+            #into account
+            self.motion_queue = deque()
+            self.motion_mutex = RLock()
+            self.leg = 0
+            #set by stop: no goal is sent to motion anymore
+            self.motion_disabled = False
 
             #variables for move
             self.goal_dist = []
-            self.load_moving_interface()
+
+            #position, heading and direction read together, see pose.py
+            self.pose_service = pose.PoseService(self.backend)
 
             self.turning = False
+            #direction (motion.DIR_*) of the translation of the current order,
+            #None when the robot is not moving; it is known without reading
+            #the motor board, for the obstacle pipeline
+            self.direction = None
 
             self.obstacle_stop = False
+            self.avoidance = collision_detection.AvoidancePolicy()
 
         else:
             self.moving_interface = False
@@ -83,54 +128,216 @@ class Robot:
         """
         loads functions from motion.py and motordriver.py
         so we can write for instance robot.moveTo(...)
-        It must be called by __init__
+        The functions are otherwise loaded one by one when they are used
+        (see __getattr__): this loads them all at once.
         """
         if not self.moving_interface:
             print("[-] Error: moving_interface is set to False; No functions are loaded")
             return
 
-        for module in [motion, motordriver]:
+        for module in [self.motion, self.backend.motordriver]:
             for module_attribute in dir(module):
-                attr = getattr(module, module_attribute)
-                if callable(attr):
-
-                    #these functions are already overriden, see below
-                    if attr.__name__ in ["moveTo", "turn", "move"]:
-                        continue
-
-                    #warning: functions in motion or motordriver does not
-                    #take robot in first argument
-                    #but when we write robot.function(foo), function gets
-                    #actually 2 arguments: robot and foo
-                    #so here we have to remove the first argument
-                    #a more precise adaptation should be done
-                    self.add_method((lambda attr_copy: (lambda *args: attr_copy(*args[1:])))(attr),
-                                    name=attr.__name__)
+                if not module_attribute.startswith('_'):
+                    getattr(self, module_attribute, None)
+
+    def __getattr__(self, name):
+        """
+        called when name is not an attribute of the robot: returns the function
+        name of motordriver or motion (in this order), which is then stored in
+        the robot, so that the next calls do not go through __getattr__
+        """
+        #moving_interface is not set yet during __init__
+        if name.startswith('_') or not self.__dict__.get('moving_interface', False):
+            raise AttributeError("'Robot' object has no attribute '{}'".format(name))
+
+        for module in [self.backend.motordriver, self.motion]:
+            attr = getattr(module, name, None)
+            if callable(attr):
+                break
+        else:
+            raise AttributeError("'Robot' object has no attribute '{}'".format(name))
+
+        #functions in motion or motordriver does not take robot in first
+        #argument: they are stored in the robot, not in its class
+        if name in POSE_SETTERS:
+            #the sampled pose is not valid anymore once the position is set
+            attr = (lambda setter: (lambda *args: self.private_set_pose(setter, args)))(attr)
+        setattr(self, name, attr)
+        return attr
+
+    def private_set_pose(self, setter, args):
+        result = setter(*args)
+        self.pose_service.invalidate()
+        return result
+
+    def get_pose(self, max_age : float = None) -> pose.Pose:
+        """
+        position, heading, direction and speed of the robot, sampled at the
+        same instant (see pose.PoseService)
+        max_age = 0 reads the motor board again, whatever the age of the pose
+        """
+        return self.pose_service.current(max_age)
+
+    def pose_at(self, t : float) -> pose.Pose:
+        """
+        pose of the robot at date t (clock time), interpolated from the
+        sampled poses
+        """
+        return self.pose_service.at(t)
 
     def stop_motion(self):
-        self.obstacle_stop = True
+        """
+        pauses the moveTo orders: the robot stops, the queue is kept
+        """
+        with self.motion_mutex:
+            self.obstacle_stop = True
+            #the callbacks of the interrupted goal are ignored
+            self.leg += 1
         self.move(1, erase = False)
+        self.pose_service.invalidate()
+
+    def cancel_motion(self):
+        """
+        forgets the moveTo orders and stops the robot where it is
+        """
+        with self.motion_mutex:
+            self.motion_queue.clear()
+            #the callbacks of the interrupted goal are ignored
+            self.leg += 1
+        self.move(1, erase = False)
+        self.pose_service.invalidate()
 
     def resume_motion(self):
-        self.obstacle_stop = False
-        if self.dest_position_stack:
-            next_position = self.dest_position_stack.pop()
-            self.moveTo(next_position.x, next_position.y, \
-                    next_position.heading, next_position.callback)
+        with self.motion_mutex:
+            if self.motion_disabled:
+                return
+            self.obstacle_stop = False
+        #the queue is kept as it is: the current goal is sent again
+        self.private_send_current_goal()
+
+    def current_goal(self, include_detour : bool = True):
+        """
+        returns the Position the robot is going to, None if there is none
+        if include_detour is False, the points of the detour (see
+        splice_detour) are skipped: the position is the one given to moveTo
+        """
+        with self.motion_mutex:
+            for goal in self.motion_queue:
+                if include_detour or not goal.detour:
+                    return goal
+            return None
+
+    def splice_detour(self, points):
+        """
+        goes through the points [(x0, y0), ...] before going on with the
+        current goal and the next ones (their callbacks are kept)
+        the points of a previous detour that are not reached yet are replaced
+        """
+        with self.motion_mutex:
+            while self.motion_queue and self.motion_queue[0].detour:
+                self.motion_queue.popleft()
+            for x, y in reversed(points):
+                self.motion_queue.appendleft(Position(x, y, -1, None, detour=True))
+            #the goal sent to motion is not the first one anymore
+            self.leg += 1
+        self.resume_motion()
+
+    def set_avoidance_policy(self, mode, delay=collision_detection.DELAY_BEFORE_BYPASSING_OBSTACLE,
+                             planner=None):
+        """
+        defines how the robot reacts to obstacles, see collision_detection.AvoidancePolicy
+        """
+        self.avoidance = collision_detection.AvoidancePolicy(mode, delay, planner)
+
+    def private_send_current_goal(self):
+        """
+        sends the first position of the queue to motion, unless the robot is
+        stopped by an obstacle or by stop
+        """
+        with self.motion_mutex:
+            if self.motion_disabled or self.obstacle_stop or not self.motion_queue:
+                return
+            goal = self.motion_queue[0]
+            self.leg += 1
+            leg = self.leg
+            self.turning = True
+            self.motion.set_after_first_turn_of_move_to_callback(lambda: self.set_turning(False))
+            self.motion.set_after_translation_of_move_to_callback(lambda: self.private_after_translation(leg))
+            self.motion.moveTo(goal.x, goal.y, goal.heading, lambda: self.private_moveTo_callback(leg))
+            #the motor board turns towards the goal, then goes forward
+            self.direction = self.motion.DIR_FORWARD
+            #the direction of the robot changes
+            self.pose_service.invalidate()
 
     def turn(self, heading, callback=lambda: None):
         self.turning = True
-        motion.turn(heading, callback=self.private_turn_callback)
+        self.turn_callback = callback
+        self.motion.turn(heading, callback=self.private_turn_callback)
+        self.pose_service.invalidate()
 
     def private_turn_callback(self):
         self.turning = False
+        if callable(self.turn_callback):
+            self.turn_callback()
+
+    def private_future(self, callback=None, loop=None):
+        """
+        returns an asyncio future and a callback resolving it
+        the callback can be called from any thread (typically the one of
+        motion's ctypes callbacks)
+        """
+        loop = asyncio.get_event_loop() if loop is None else loop
+        future = loop.create_future()
+
+        def resolve():
+            if not future.done():
+                future.set_result(None)
+
+        def future_callback():
+            if callable(callback):
+                callback()
+            loop.call_soon_threadsafe(resolve)
+
+        return future, future_callback
+
+    def moveTo_future(self, x_dest, y_dest, final_heading=-1, callback=None,
+                        erase=True, loop=None):
+        """
+        same thing as moveTo, but returns a future resolved when the position
+        is reached, so we can write: await robot.moveTo_future(x, y)
+        """
+        future, future_callback = self.private_future(callback, loop)
+        self.moveTo(x_dest, y_dest, final_heading, future_callback, erase)
+        return future
+
+    def move_future(self, goal_dist, callback=None, erase=True, loop=None):
+        """
+        same thing as move, but returns a future (see moveTo_future)
+        """
+        future, future_callback = self.private_future(callback, loop)
+        self.move(goal_dist, future_callback, erase)
+        return future
+
+    def turn_future(self, heading, callback=None, loop=None):
+        """
+        same thing as turn, but returns a future (see moveTo_future)
+        """
+        future, future_callback = self.private_future(callback, loop)
+        self.turn(heading, future_callback)
+        return future
 
     def set_turning(self, value):
         #value must be True or False
         self.turning = value
+        self.pose_service.invalidate()
+        #the sensors are taken into account again at the end of the turn
+        if not value and not self.obstacle_pipeline is None:
+            self.obstacle_pipeline.check()
 
     def erase_moveTo_stack(self):
-        self.dest_position_stack = []
+        with self.motion_mutex:
+            self.motion_queue.clear()
+            self.leg += 1
 
     def moveTo(self, x_dest, y_dest, final_heading=-1, callback=None,
                 erase=True):
@@ -140,41 +347,87 @@ class Robot:
         after an emergency stop
 
         If erase is set to True, all previous orders are forgotten
-        Otherwise, order is piled on a stack, so previous orders
-        will be executed afterwards
+        Otherwise, the order is queued: it is executed once the previous
+        orders are, without stopping in between if they have no final heading
         """
         if not self.moving_interface:
             print("[-] Error in Robot.moveTo; moving_interface is not enabled")
             return
-
-        if self.obstacle_stop:
-            self.dest_position_stack = [Position(x_dest, y_dest, final_heading, callback)] \
-                                       + self.dest_position_stack
+        if self.motion_disabled:
+            print("[-] Robot.moveTo ignored: the robot is stopped")
             return
 
         if self.debug:
-            print("[moveTo Python] from ", self.get_pos_X(), self.get_pos_Y(), "to", x_dest, y_dest, " ; time = ", time.time() - self.t_0)
-
-        if erase:
+            current = self.get_pose()
+            print("[moveTo Python] from ", current.x, current.y, "to", x_dest, y_dest, " ; time = ", current.t - self.t_0)
+        if tracing.enabled:
+            tracing.record("moveTo", "Robot", (x_dest, y_dest))
+
+        with self.motion_mutex:
+            if erase:
+                self.erase_moveTo_stack()
+            self.motion_queue.append(Position(x_dest, y_dest, final_heading, callback))
+            #otherwise it is sent when the previous goals are reached
+            if len(self.motion_queue) == 1:
+                self.private_send_current_goal()
+
+    def follow_path(self, points, callback=None, corner_radius=trajectory.CORNER_RADIUS,
+                    tolerance=trajectory.COLLINEAR_TOLERANCE) -> trajectory.Trajectory:
+        """
+        goes through the points [(x0, y0), ...] from the current position;
+        callback is called when the last one is reached
+        the previous orders are forgotten, and the sub-goals of the trajectory
+        (see trajectory.plan_trajectory) are all queued at once, so the robot
+        does not wait between them
+        returns the trajectory, whose duration is the expected one
+        """
+        current = self.get_pose()
+        path = trajectory.plan_trajectory(current.position(), current.heading, points,
+                                          tolerance, corner_radius)
+        if not path.points:
             self.erase_moveTo_stack()
+            if callable(callback):
+                callback()
+            return path
+        last = len(path.points) - 1
+        for i, (x, y) in enumerate(path.points):
+            self.moveTo(x, y, -1, callback if i == last else None, erase = i == 0)
+        return path
+
+    def private_after_translation(self, leg):
+        with self.motion_mutex:
+            if leg != self.leg:
+                return
+            goal = self.motion_queue[0]
+            #without final heading, the goal is reached at the end of the
+            #translation: the next one is sent at once, without waiting for
+            #the final callback of motion (the robot still stops at the
+            #corner, the motor board turns on the spot before each moveTo)
+            blend = goal.heading == -1 and len(self.motion_queue) > 1
+        if blend:
+            self.private_moveTo_callback(leg)
+        else:
+            self.set_turning(True)
 
-        self.dest_position_stack.append(Position(x_dest, y_dest, final_heading, callback))
-        self.turning = True
-        motion.set_after_first_turn_of_move_to_callback(lambda: self.set_turning(False))
-        motion.set_after_translation_of_move_to_callback(lambda: self.set_turning(True))
-        motion.moveTo(x_dest, y_dest, final_heading, self.private_moveTo_callback)
-
-    def private_moveTo_callback(self):
-        if self.dest_position_stack:
-            tmp = self.dest_position_stack.pop()
-            if callable(tmp.callback): tmp.callback()
+    def private_moveTo_callback(self, leg):
+        """
+        called when the goal number leg is reached
+        """
+        with self.motion_mutex:
+            if leg != self.leg:
+                #the goal has been replaced, interrupted or already reached
+                return
+            self.leg += 1
+            goal = self.motion_queue.popleft()
+            self.turning = False
+            self.direction = None
+            #the next goal is sent before the callback of this one is called
+            self.private_send_current_goal()
 
-        self.turning = False
-        #if stacks are not empty
-        if self.dest_position_stack:
-            time.sleep(.3)
-            tmp = self.dest_position_stack[-1]
-            motion.moveTo(tmp.x, tmp.y, tmp.heading, self.private_moveTo_callback)
+        if tracing.enabled:
+            tracing.record("moveTo done", "Robot")
+        if callable(goal.callback):
+            goal.callback()
 
     def move(self, goal_dist, callback=None, erase=True):
         """
@@ -184,10 +437,14 @@ class Robot:
             self.goal_dist = []
 
         self.goal_dist.append(Distance(goal_dist, callback))
-        motion.move(goal_dist, self.private_move_callback)
+        self.motion.move(goal_dist, self.private_move_callback)
+        self.direction = self.motion.DIR_FORWARD if goal_dist >= 0 else self.motion.DIR_BACKWARD
+        self.pose_service.invalidate()
 
     def private_move_callback(self):
         tmp = self.goal_dist.pop()
+        if not self.goal_dist:
+            self.direction = None
         if callable(tmp.callback): 
             tmp.callback()
 
@@ -220,8 +477,25 @@ class Robot:
         self.collision_thread.start()
 
 
+    def start_collision_events(self, front_pin, rear_pin, gpio=None, active_level=1):
+        """
+        same thing as start_collision_detection, but the sensors are GPIO pins
+        (BCM numbers) whose edges stop the robot as soon as they happen,
+        without any polling thread (see collision_detection.ObstaclePipeline)
+
+        gpio is the rpi_gpio module by default
+        active_level is the value of the pins when an obstacle is detected
+        """
+        if gpio is None:
+            import gpio
+        self.obstacle_pipeline = collision_detection.ObstaclePipeline(self, front_pin, rear_pin,
+                                                                      gpio, active_level)
+        self.obstacle_pipeline.start()
+
     def stop_collision_sensors(self):
         self.enable_collision_detection = False
+        if not self.obstacle_pipeline is None:
+            self.obstacle_pipeline.stop()
         print("[+] Stopping collision detection")
 
 
@@ -278,19 +552,33 @@ class Robot:
         if self.debug:
             print("[++] Unpausing thread")
 
-    def stop(self):
+    def stop(self, reason="robot stopped"):
+        """
+        Stops the robot, then cancels all the actions (see cancellation.py).
+        The process keeps running, for logging and cleanup.
+        """
         self.started = False
-        self.stop_collision_sensors()
+        #the motors are stopped first: cancelling the actions can take up to
+        #cancellation.CANCEL_TIMEOUT
         if self.moving_interface:
+            #nothing can send the robot moving again (callbacks, avoidance
+            #timer, actions being cancelled...)
+            with self.motion_mutex:
+                self.motion_disabled = True
+                self.erase_moveTo_stack()
             self.emergency_stop()
+            self.direction = None
+            self.avoidance.cancel()
+        cancellation.get_root_token().cancel(reason)
+        self.stop_collision_sensors()
+        if self.moving_interface:
+            self.pose_service.stop()
         if self.debug:
             print("[++][...] Stopping sequence thread")
 
         if callable(self.to_call_at_stop):
             self.to_call_at_stop()
-            time.sleep(.2) #make sure previous orders have been sent
-
-        os.kill(os.getpid(), signal.SIGKILL)
+            clock.get_clock().sleep(.2) #make sure previous orders have been sent
 
     def is_running(self):
         return self.started
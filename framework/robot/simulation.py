@@ -0,0 +1,405 @@
+"""
+Hardware-free stand-ins for the native motion and motordriver modules and for
+AX12 motors, so that robots and actions can run (and be benchmarked) off the robot.
+
+    robot = Robot(backend=SimulatedBackend(time_factor=20))
+    robot.add_object(robot.backend.ax12(141), "motor_1")
+
+The simulated time runs time_factor times faster than the time of the clock
+(see clock.py). With a VirtualClock, time_factor is useless and should be 1.
+Distances are in mm, angles in degrees (0 on the x axis, 90 on the y axis),
+durations in seconds.
+"""
+
+from threading import Lock
+import math
+
+import clock
+#speed profile of the motor board
+from trajectory import (MAX_SPEED, ACCELERATION, MAX_ANGULAR_SPEED, ANGULAR_ACCELERATION,
+                        normalize_angle, profile_duration, profile_position)
+
+DIR_NONE = 0
+DIR_FORWARD = 1
+DIR_BACKWARD = 2
+
+AX12_MAX_SPEED = 684            #degrees/s (114 rpm)
+
+
+class Segment:
+    """
+    An elementary movement of the base: a rotation or a translation.
+    end_callback is called when the segment is over.
+    """
+    def __init__(self, kind, amount, end_callback=None):
+        self.kind = kind
+        self.amount = amount
+        self.end_callback = end_callback
+
+
+class SimulatedMotion:
+    """
+    Kinematic simulation of the motor board, exposing the functions of the
+    native motion module (moveTo, move, turn, get_pos_X...).
+    The position and the heading are computed from the speed profile of the
+    current segment, the callbacks are called at the end of the movements.
+    """
+
+    DIR_NONE = DIR_NONE
+    DIR_FORWARD = DIR_FORWARD
+    DIR_BACKWARD = DIR_BACKWARD
+
+    def __init__(self, x=0, y=0, heading=0, time_factor=1.,
+                 max_speed=MAX_SPEED, acceleration=ACCELERATION,
+                 max_angular_speed=MAX_ANGULAR_SPEED,
+                 angular_acceleration=ANGULAR_ACCELERATION):
+        self.x = float(x)
+        self.y = float(y)
+        self.heading = float(heading)
+        self.time_factor = time_factor
+        self.max_speed = max_speed
+        self.acceleration = acceleration
+        self.max_angular_speed = max_angular_speed
+        self.angular_acceleration = angular_acceleration
+
+        self.clock = clock.get_clock()
+        self.t_0 = self.clock.time()
+        self.mutex = Lock()
+        self.segments = []
+        self.current_segment = None
+        self.segment_start = 0
+        self.segment_timer = None
+        self.stopped = False
+
+        self.after_first_turn_callback = None
+        self.after_translation_callback = None
+
+    def time(self):
+        """
+        simulated time, in seconds
+        """
+        return (self.clock.time() - self.t_0) * self.time_factor
+
+    def private_duration(self, segment):
+        if segment.kind == 'turn':
+            return profile_duration(segment.amount, self.max_angular_speed,
+                                    self.angular_acceleration)
+        return profile_duration(segment.amount, self.max_speed, self.acceleration)
+
+    def private_progress(self, segment, t):
+        if segment.kind == 'turn':
+            return profile_position(t, segment.amount, self.max_angular_speed,
+                                    self.angular_acceleration)
+        return profile_position(t, segment.amount, self.max_speed, self.acceleration)
+
+    def private_pose(self):
+        """
+        returns (x, y, heading) at the current simulated time
+        must be called with mutex acquired
+        """
+        segment = self.current_segment
+        if segment is None:
+            return self.x, self.y, self.heading
+        done = self.private_progress(segment, self.time() - self.segment_start)
+        if segment.kind == 'turn':
+            return self.x, self.y, normalize_angle(self.heading + done)
+        theta = self.heading * math.pi / 180.
+        return self.x + done * math.cos(theta), self.y + done * math.sin(theta), self.heading
+
+    def private_start(self, segments):
+        """
+        replaces the current movement by a list of segments
+        """
+        with self.mutex:
+            self.private_freeze()
+            self.segments = segments
+            if not self.stopped:
+                self.private_next_segment()
+
+    def private_freeze(self):
+        """
+        stops the current segment where it is
+        must be called with mutex acquired
+        """
+        segment = self.current_segment
+        if segment is not None:
+            done = self.private_progress(segment, self.time() - self.segment_start)
+            #what is left of the segment will be done at resume
+            self.segments.insert(0, Segment(segment.kind, segment.amount - done,
+                                            segment.end_callback))
+        self.x, self.y, self.heading = self.private_pose()
+        if self.segment_timer is not None:
+            self.segment_timer.cancel()
+            self.segment_timer = None
+        self.current_segment = None
+
+    def private_next_segment(self):
+        """
+        must be called with mutex acquired
+        """
+        if not self.segments:
+            return
+        self.current_segment = self.segments.pop(0)
+        self.segment_start = self.time()
+        duration = self.private_duration(self.current_segment)
+        self.segment_timer = self.clock.call_later(duration / self.time_factor,
+                                                   self.private_end_of_segment,
+                                                   (self.current_segment,))
+
+    def private_end_of_segment(self, segment):
+        with self.mutex:
+            if segment is not self.current_segment:
+                return
+            if segment.kind == 'turn':
+                self.heading = normalize_angle(self.heading + segment.amount)
+            else:
+                theta = self.heading * math.pi / 180.
+                self.x += segment.amount * math.cos(theta)
+                self.y += segment.amount * math.sin(theta)
+            self.current_segment = None
+            self.segment_timer = None
+            self.private_next_segment()
+        if callable(segment.end_callback):
+            segment.end_callback()
+
+    #functions of the motion module
+
+    def set_after_first_turn_of_move_to_callback(self, callback):
+        self.after_first_turn_callback = callback
+
+    def set_after_translation_of_move_to_callback(self, callback):
+        self.after_translation_callback = callback
+
+    def moveTo(self, x, y, final_heading=-1, callback=None):
+        with self.mutex:
+            x_0, y_0, heading = self.private_pose()
+        dx, dy = x - x_0, y - y_0
+        distance = math.sqrt(dx * dx + dy * dy)
+        direction = math.atan2(dy, dx) * 180. / math.pi if distance > 0 else heading
+        segments = [Segment('turn', normalize_angle(direction - heading),
+                            self.after_first_turn_callback),
+                    Segment('translate', distance, self.after_translation_callback)]
+        if final_heading != -1:
+            segments.append(Segment('turn', normalize_angle(final_heading - direction)))
+        segments[-1].end_callback = self.private_chain(segments[-1].end_callback, callback)
+        self.private_start(segments)
+
+    def move(self, distance, callback=None):
+        self.private_start([Segment('translate', distance, callback)])
+
+    def turn(self, heading, callback=None):
+        with self.mutex:
+            current_heading = self.private_pose()[2]
+        self.private_start([Segment('turn', normalize_angle(heading - current_heading),
+                                    callback)])
+
+    def private_chain(self, first, second):
+        def chained():
+            if callable(first):
+                first()
+            if callable(second):
+                second()
+        return chained
+
+    def emergency_stop(self):
+        with self.mutex:
+            self.stopped = True
+            self.private_freeze()
+
+    def emergency_resume(self):
+        with self.mutex:
+            self.stopped = False
+            if self.current_segment is None:
+                self.private_next_segment()
+
+    def get_pos_X(self):
+        with self.mutex:
+            return int(round(self.private_pose()[0]))
+
+    def get_pos_Y(self):
+        with self.mutex:
+            return int(round(self.private_pose()[1]))
+
+    def get_heading(self):
+        with self.mutex:
+            return self.private_pose()[2] % 360.
+
+    def getDirection(self):
+        with self.mutex:
+            segment = self.current_segment
+        if segment is None or segment.kind == 'turn' or segment.amount == 0:
+            return DIR_NONE
+        return DIR_FORWARD if segment.amount > 0 else DIR_BACKWARD
+
+    def setPosition(self, x, y):
+        with self.mutex:
+            self.private_freeze()
+            self.segments = []
+            self.x, self.y = float(x), float(y)
+
+    def set_heading(self, heading):
+        with self.mutex:
+            self.private_freeze()
+            self.segments = []
+            self.heading = normalize_angle(heading)
+
+
+class SimulatedMotorDriver:
+    """
+    Stand-in for the native motordriver module.
+    The odometry functions read the state of the simulated motion.
+    """
+    def __init__(self, motion):
+        self.motion = motion
+
+    def get_pos_X(self):
+        return self.motion.get_pos_X()
+
+    def get_pos_Y(self):
+        return self.motion.get_pos_Y()
+
+    def get_heading(self):
+        return self.motion.get_heading()
+
+
+class SimulatedAX12:
+    """
+    Stand-in for libAX12's AX12 class.
+    Positions are in degrees, speeds in percent of the maximal speed.
+    """
+    def __init__(self, id, time_factor=1., position=0):
+        self.id = id
+        self.time_factor = time_factor
+        self.position = position
+        self.goal = position
+        self.speed = 100
+        self.torque = 100
+        self.mode = 0
+        self.clock = clock.get_clock()
+        self.move_start = self.clock.time()
+        self.move_duration = 0
+        self.timer = None
+        self.mutex = Lock()
+
+    def private_position(self):
+        """
+        must be called with mutex acquired
+        """
+        elapsed = self.clock.time() - self.move_start
+        if self.move_duration <= 0 or elapsed >= self.move_duration:
+            return self.goal
+        return self.position + (self.goal - self.position) * elapsed / self.move_duration
+
+    def move(self, position, callback=None):
+        with self.mutex:
+            if self.timer is not None:
+                self.timer.cancel()
+            self.position = self.private_position()
+            self.goal = position
+            self.move_start = self.clock.time()
+            speed = AX12_MAX_SPEED * max(self.speed, 1) / 100.
+            self.move_duration = abs(self.goal - self.position) / speed / self.time_factor
+            self.timer = self.clock.call_later(self.move_duration, self.private_end_of_move,
+                                               (callback,))
+
+    def private_end_of_move(self, callback):
+        with self.mutex:
+            self.timer = None
+        if callable(callback):
+            callback()
+
+    def turn(self, speed):
+        with self.mutex:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.position = self.goal = self.private_position()
+            self.move_duration = 0
+
+    def get_position(self):
+        with self.mutex:
+            return self.private_position()
+
+    def set_speed(self, speed):
+        self.speed = speed
+
+    def set_torque(self, torque):
+        self.torque = torque
+
+    def set_mode(self, mode):
+        self.mode = mode
+
+
+class SimulatedGPIO:
+    """
+    Stand-in for the rpi_gpio module (gpio.py): the values of the pins are set
+    by digital_write, which calls the callbacks of the pin like the GPIO thread.
+    """
+    def __init__(self):
+        self.values = {}
+        self.callbacks = {}
+        self.mutex = Lock()
+
+    def digital_read(self, id):
+        return self.values.get(id, 0)
+
+    def digital_write(self, id, val):
+        with self.mutex:
+            old_value = self.values.get(id, 0)
+            self.values[id] = val
+            callbacks = self.callbacks.get(id, {})
+            if old_value == val:
+                return
+            to_call = callbacks.get('change', []) + callbacks.get('up' if val else 'down', [])
+            for kind in ['change', 'up' if val else 'down']:
+                callbacks[kind] = [(callback, one_shot) for callback, one_shot
+                                   in callbacks.get(kind, []) if not one_shot]
+        for callback, one_shot in to_call:
+            callback()
+
+    def private_assign(self, id, kind, callback, one_shot):
+        with self.mutex:
+            self.callbacks.setdefault(id, {}).setdefault(kind, []).append((callback, one_shot))
+
+    def assign_callback_on_gpio_change(self, id, callback, one_shot=False):
+        self.private_assign(id, 'change', callback, one_shot)
+
+    def assign_callback_on_gpio_down(self, id, callback, one_shot=False):
+        self.private_assign(id, 'down', callback, one_shot)
+
+    def assign_callback_on_gpio_up(self, id, callback, one_shot=False):
+        self.private_assign(id, 'up', callback, one_shot)
+
+    def remove_callbacks_on_gpio_change(self, id):
+        with self.mutex:
+            self.callbacks.get(id, {}).pop('change', None)
+
+    def remove_callbacks_on_gpio_down(self, id):
+        with self.mutex:
+            self.callbacks.get(id, {}).pop('down', None)
+
+    def remove_callbacks_on_gpio_up(self, id):
+        with self.mutex:
+            self.callbacks.get(id, {}).pop('up', None)
+
+    def remove_callbacks_on_gpio(self, id):
+        with self.mutex:
+            self.callbacks.pop(id, None)
+
+    def remove_all_callback(self):
+        with self.mutex:
+            self.callbacks = {}
+
+
+class SimulatedBackend:
+    """
+    Backend given to Robot instead of the native motion and motordriver modules.
+    """
+    def __init__(self, x=0, y=0, heading=0, time_factor=1., **motion_parameters):
+        self.time_factor = time_factor
+        self.motion = SimulatedMotion(x, y, heading, time_factor, **motion_parameters)
+        self.motordriver = SimulatedMotorDriver(self.motion)
+        self.gpio = SimulatedGPIO()
+
+    def ax12(self, id, position=0):
+        return SimulatedAX12(id, self.time_factor, position)
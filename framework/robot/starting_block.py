@@ -1,67 +1,74 @@
 from thread_easy_stop import Thread_Easy_Stop
+from threading import Condition
 import time
 
+import clock
+import worker_pool
+
 from sys import stdout
 
 def time_elapsed(delay, callback):
-    def run_step(t):
-        if t>delay:
-            callback()
-            return False
-        return True
-
-    thread = Thread_Easy_Stop(callback_in_loop=run_step).start()
+    return clock.get_clock().call_later(delay, callback)
 
 def manage_time_elapsed(robot):
-    print "[.] End of granted time, stopping robot"
-    robot.stop()
+    print("[.] End of granted time, stopping robot")
+    robot.stop("end of match")
     Thread_Easy_Stop.stop_all_threads()
 
 
 
 class Wait_Object:
+    """
+    Calls its callback as soon as it is stopped, in a thread of the worker pool:
+    stop is called by the GPIO thread for the jack events, which must not run
+    the sequence of the robot
+    """
 
     def __init__(self, callback = None, inter_delay = 0.05):
         self.callback = callback
-        self.delay = inter_delay
+        self.delay = inter_delay    #not used anymore, nothing is polled
         self.stopped = False
-        self.thread = Thread_Easy_Stop(callback_in_loop = lambda t: self.run_step(t))
-        self.thread.start()
+        self.called = False
+        self.condition = Condition()
 
     def set_callback(self, callback):
-        self.callback = callback
-
-    def run_step(self, t):
-        if not self.stopped:
-            return True
-        else:
-            if callable(self.callback):
-                self.callback()
-
-            return False
+        with self.condition:
+            self.callback = callback
+        self.private_call()
+
+    def private_call(self):
+        with self.condition:
+            if not self.stopped or self.called or not callable(self.callback):
+                return
+            self.called = True
+            callback = self.callback
+            self.condition.notify_all()
+        worker_pool.submit(callback)
 
     def stop(self):
-        self.stopped = True
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.private_call()
 
-    def join(self):
-        if self.thread is not None:
-            self.thread.join()
+    def join(self, timeout = None) -> bool:
+        with self.condition:
+            return clock.get_clock().wait_for(self.condition, lambda: self.stopped, timeout)
 
     def reset(self):
-        if self.stopped:
+        with self.condition:
             self.stopped = False
-            self.thread = Thread_Easy_Stop(callback_in_loop = lambda t: self.run_step(t))
-            self.thread.start()
+            self.called = False
 
 class ManageJack:
 
     def start(self):
-        print "[++++] Jack pulled! Actionning robot"
+        print("[++++] Jack pulled! Actionning robot")
         self.robot.start()
 
     def abort(self):
-        print "[----] Stopping robot because of jack"
-        self.robot.stop()
+        print("[----] Stopping robot because of jack")
+        self.robot.stop("jack pushed back")
 
     def __init__(self, robot):
         self.transitions = {'waiting':{'push':('ready', None)},
@@ -75,13 +82,13 @@ class ManageJack:
     def manage_event(self, pulled):
         if pulled:
             key = 'pull'
-            print "[+] Jack inserted! Waiting for the jack to be pulled"
+            print("[+] Jack inserted! Waiting for the jack to be pulled")
         else:
             key = 'push'
-            print "[+] Jack pulled!"
+            print("[+] Jack pulled!")
 
         if self.cur_state not in self.transitions:
-            print "[-] Inexisting transition for state "+self.cur_state
+            print("[-] Inexisting transition for state "+self.cur_state)
             return
 
         if key in self.transitions[self.cur_state]:
@@ -0,0 +1,144 @@
+"""
+Profile of the startup of the robot: time spent importing each module and in
+each step of the construction of the robot, to find what delays the moment the
+robot is ready for the jack after power-on.
+
+    import startup_profile
+    startup_profile.start()         # before the other imports
+    from robot import Robot
+    with startup_profile.step("robot"):
+        robot = Robot()
+    startup_profile.report()
+
+The imports are measured by wrapping builtins.__import__: the modules imported
+later (lazy imports, see lazy_import.py) are measured too, in the step where
+they happen.
+
+    python3 startup_profile.py [--native]
+
+profiles the imports of the framework and the construction of a robot, with the
+simulated backend unless --native is given.
+"""
+
+from threading import local
+import builtins
+import contextlib
+import sys
+import time
+
+#number of modules shown by report
+REPORT_LIMIT = 20
+
+original_import = None
+t_0 = None
+#name -> [total time, self time, step], the self time excludes the nested imports
+imports = {}
+#(name, duration)
+steps = []
+current_step = None
+#stacks of the time spent in the nested imports, one per thread
+import_stacks = local()
+
+
+def private_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level != 0 or name in sys.modules:
+        return original_import(name, globals, locals, fromlist, level)
+    if not hasattr(import_stacks, 'stack'):
+        import_stacks.stack = []
+    stack = import_stacks.stack
+    stack.append(0.)
+    start = time.perf_counter()
+    try:
+        return original_import(name, globals, locals, fromlist, level)
+    finally:
+        duration = time.perf_counter() - start
+        nested = stack.pop()
+        if stack:
+            stack[-1] += duration
+        if not name in imports:
+            imports[name] = [duration, duration - nested, current_step]
+
+
+def start():
+    """
+    starts measuring the imports
+    """
+    global original_import, t_0
+    if not original_import is None:
+        return
+    t_0 = time.perf_counter()
+    original_import = builtins.__import__
+    builtins.__import__ = private_import
+
+def stop():
+    global original_import
+    if original_import is None:
+        return
+    builtins.__import__ = original_import
+    original_import = None
+
+@contextlib.contextmanager
+def step(name : str):
+    """
+    measures the duration of the code in the with block
+    """
+    global current_step
+    previous, current_step = current_step, name
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        steps.append((name, time.perf_counter() - start))
+        current_step = previous
+
+def report(limit : int = REPORT_LIMIT, file = None):
+    """
+    prints the steps and the limit slowest imports (by self time)
+    """
+    file = sys.stdout if file is None else file
+    if not t_0 is None:
+        print("[i] Startup profile: {:.1f} ms since start".format((time.perf_counter() - t_0) * 1e3),
+              file=file)
+    if steps:
+        print("    {:40} {:>10}".format("step", "ms"), file=file)
+        for name, duration in steps:
+            print("    {:40} {:10.2f}".format(name, duration * 1e3), file=file)
+    if imports:
+        print("    {:40} {:>10} {:>10}  {}".format("module", "self ms", "total ms", "step"), file=file)
+        slowest = sorted(imports.items(), key=lambda item: item[1][1], reverse=True)
+        for name, (total, own, during) in slowest[:limit]:
+            print("    {:40} {:10.2f} {:10.2f}  {}".format(name, own * 1e3, total * 1e3,
+                                                         "import" if during is None else during),
+                  file=file)
+        print("    {} modules imported, {:.1f} ms".format(
+            len(imports), sum(own for total, own, during in imports.values()) * 1e3), file=file)
+
+
+if __name__ == "__main__":
+    start()
+    import os
+    here = os.path.dirname(os.path.abspath(__file__))
+    #in the source tree, the actions are in a sibling folder
+    sys.path[:0] = [here, os.path.join(os.path.dirname(here), 'action')]
+
+    with step("import robot"):
+        from robot import Robot
+    with step("import action"):
+        import action
+    with step("import starting_block"):
+        import starting_block
+
+    if '--native' in sys.argv:
+        with step("construct robot"):
+            robot = Robot(debug=False)
+    else:
+        with step("import simulation"):
+            from simulation import SimulatedBackend
+        with step("construct robot"):
+            robot = Robot(debug=False, backend=SimulatedBackend())
+    with step("first position read"):
+        robot.get_pos_X()
+    with step("first pose"):
+        robot.get_pose()
+    stop()
+    report()
@@ -1,42 +1,99 @@
-from threading import Thread
-import time
+from threading import Thread, Condition, Lock
 
+import clock
 
-class Thread_Easy_Stop(Thread):
+
+class Thread_Easy_Stop:
+    """
+    Calls callback_in_loop(elapsed time) every delay seconds in a thread, until
+    it returns False or stop is called.
+    The calls are scheduled on deadlines (start + k * delay), so the duration of
+    the callback does not make the period drift; missed periods are skipped.
+    stop and join do not wait for the end of the current period.
+
+    It keeps the API of the threading.Thread it used to derive from (start, run,
+    join, is_alive, name, daemon), but the thread is an attribute: restart
+    starts a new one, a Thread can only be started once. Like the threads of
+    the framework, it is a daemon thread unless daemon is set to False before
+    start.
+    """
 
     threads = []
+    threads_mutex = Lock()
 
-    def __init__(self, callback_in_loop, delay = 0.05):
+    def __init__(self, callback_in_loop, delay = 0.05, name = None):
+        self.name = name
+        self.daemon = True
         self.ended = False
         self.is_running = True
         self.delay = delay
         self.callback_in_loop = callback_in_loop
-        Thread.__init__(self)
-        Thread_Easy_Stop.threads.append(self)
+        self.condition = Condition()
+        self.thread = None
+
+    def start(self):
+        with Thread_Easy_Stop.threads_mutex:
+            Thread_Easy_Stop.threads.append(self)
+        self.thread = Thread(target=self.run, name=self.name)
+        self.thread.daemon = self.daemon
+        self.name = self.thread.name
+        self.thread.start()
 
     def run(self):
-        beg = time.time()
-        while self.is_running:
-            if not self.callback_in_loop(time.time() - beg):
+        try:
+            beg = clock.get_clock().time()
+            deadline = beg
+            while self.is_running:
+                if not self.callback_in_loop(clock.get_clock().time() - beg):
+                    break
+
+                now = clock.get_clock().time()
+                deadline += self.delay
+                if deadline < now:
+                    #the callback took longer than a period
+                    deadline += ((now - deadline) // self.delay + 1) * self.delay
+                if clock.get_clock().is_virtual:
+                    #the time only flows up to the scheduled events
+                    clock.get_clock().call_later(deadline - now, lambda: None)
+                with self.condition:
+                    clock.get_clock().wait_for(self.condition, lambda: not self.is_running,
+                                               deadline - now)
+        finally:
+            with self.condition:
                 self.is_running = False
-            time.sleep(self.delay)
-        self.ended = True
+                self.ended = True
+                self.condition.notify_all()
+            with Thread_Easy_Stop.threads_mutex:
+                if self in Thread_Easy_Stop.threads:
+                    Thread_Easy_Stop.threads.remove(self)
 
     def stop(self):
-        self.is_running = False
+        with self.condition:
+            self.is_running = False
+            self.condition.notify_all()
+
+    def join(self, timeout = None) -> bool:
+        """
+        returns False if the thread is still running after timeout seconds
+        """
+        if self.thread is None:
+            return True
+        with self.condition:
+            return clock.get_clock().wait_for(self.condition, lambda: self.ended, timeout)
 
-    def join(self):
-        while not self.ended:
-            time.sleep(self.delay)
+    def is_alive(self) -> bool:
+        return not self.thread is None and not self.ended
 
     def restart(self):
-        if not self.is_running:
+        if self.ended or self.thread is None:
             self.ended = False
             self.is_running = True
             self.start()
 
     @classmethod
     def stop_all_threads(cls):
-        for t in Thread_Easy_Stop.threads:
+        with cls.threads_mutex:
+            threads = list(cls.threads)
+        for t in threads:
             t.stop()
-        print "[+++] All remaining threads stopped"
+        print("[+++] All remaining threads stopped")
@@ -0,0 +1,136 @@
+"""
+Tracing of the execution of the actions.
+When tracing is enabled, the actions record their events (start, end,
+callback, timeout, cancel) in a ring buffer allocated once: the recording
+neither allocates a buffer nor writes a file. The buffer is exported as a
+Chrome trace (JSON), which can be opened in chrome://tracing or
+https://ui.perfetto.dev to see the timeline of the match.
+
+    tracing.enable()
+    ...
+    tracing.export_chrome_trace("match.json")
+
+When tracing is disabled, the cost of a trace point is the test of
+tracing.enabled.
+"""
+
+from threading import get_ident
+import itertools
+import json
+import os
+
+import clock
+
+#number of events kept, the oldest ones are overwritten
+TRACE_CAPACITY = 1 << 16
+
+START = 'start'
+END = 'end'
+CALLBACK = 'callback'
+TIMEOUT = 'timeout'
+CANCEL = 'cancel'
+
+enabled = False
+tracer = None
+
+
+class Tracer:
+    """
+    Ring buffer of events (date, kind, thread id, subject, detail)
+    The dates are given by the clock of the framework (see clock.py): under a
+    VirtualClock, the events of a same date are kept in their recording order.
+    The subject is usually an action, whose path in the action tree is
+    computed at export.
+    """
+    def __init__(self, capacity : int = TRACE_CAPACITY):
+        self.capacity = capacity
+        self.events = [None] * capacity
+        #next() on itertools.count is atomic in CPython: no lock is needed
+        self.counter = itertools.count()
+        self.t_0 = clock.get_clock().time()
+
+    def record(self, kind : str, subject, detail = None):
+        index = next(self.counter)
+        self.events[index % self.capacity] = (clock.get_clock().time(), kind, get_ident(),
+                                              subject, detail, index)
+
+    def snapshot(self) -> list:
+        """
+        recorded events, from the oldest to the newest
+        """
+        events = [event for event in self.events if not event is None]
+        events.sort(key=lambda event: (event[0], event[5]))
+        return [event[:5] for event in events]
+
+    def clear(self):
+        self.events = [None] * self.capacity
+
+
+def subject_path(subject) -> str:
+    """
+    "root/sequence/action" for an action, str(subject) otherwise
+    """
+    names = []
+    while not subject is None:
+        names.append(str(subject))
+        subject = getattr(subject, 'parent_sequence', None)
+    return "/".join(reversed(names))
+
+def chrome_trace_events(events, t_0) -> list:
+    """
+    converts events recorded by a Tracer to Chrome trace events: the actions
+    are asynchronous slices, from their start to their end or cancellation
+    """
+    pid = os.getpid()
+    trace = []
+    paths = {}
+    for date, kind, thread, subject, detail in events:
+        key = id(subject)
+        if not key in paths:
+            paths[key] = subject_path(subject)
+        event = {'name': paths[key], 'cat': 'action', 'pid': pid, 'tid': thread,
+                 'ts': (date - t_0) * 1e6}
+        if not detail is None:
+            event['args'] = {'detail': str(detail)}
+
+        waitable = not getattr(subject, 'callback', None) is None
+        if kind == START and waitable:
+            event.update(ph='b', id=key)
+        elif kind in (END, CANCEL) and waitable:
+            event.update(ph='e', id=key)
+            if kind == CANCEL:
+                event.setdefault('args', {})['cancelled'] = True
+        else:
+            event.update(ph='i', s='t', name=paths[key] + " " + kind)
+        trace.append(event)
+    return trace
+
+
+def enable(capacity : int = TRACE_CAPACITY) -> Tracer:
+    """
+    starts recording events, in a new buffer
+    """
+    global tracer, enabled
+    tracer = Tracer(capacity)
+    enabled = True
+    return tracer
+
+def disable():
+    """
+    stops recording events; the recorded ones can still be exported
+    """
+    global enabled
+    enabled = False
+
+def record(kind : str, subject, detail = None):
+    """
+    to be called only if enabled is True
+    """
+    tracer.record(kind, subject, detail)
+
+def export_chrome_trace(filename : str):
+    if tracer is None:
+        raise Exception("Tracing has never been enabled")
+    with open(filename, "w") as f:
+        json.dump({'traceEvents': chrome_trace_events(tracer.snapshot(), tracer.t_0),
+                   'displayTimeUnit': 'ms'}, f)
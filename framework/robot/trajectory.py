@@ -0,0 +1,227 @@
+"""
+Trajectories through a list of waypoints, and speed profiles of the motor board.
+The motor board executes a moveTo as a turn on the spot followed by a
+translation, both with a trapezoidal speed profile: every waypoint costs a
+stop. plan_trajectory reduces the number of stops before the waypoints are
+queued in the motion queue of the robot (see Robot.follow_path):
+    - the waypoints that are almost on the line between their neighbours are
+      removed (simplify)
+    - the corners can be replaced by circular arcs of a given radius, followed
+      as short chords (fillet), so that the robot turns by small angles; this
+      is off by default (CORNER_RADIUS is 0), corner_radius is a parameter of
+      plan_trajectory, Robot.follow_path and Sequence.add_path
+The Trajectory gives the speed profile of the motor board along the path:
+its duration and the expected state of the robot at any date.
+
+Distances are in mm, angles in degrees (0 on the x axis), durations in seconds.
+"""
+
+import math
+
+from path_planning import distance_to_segment
+
+#limits of the motor board (also used by simulation.py)
+MAX_SPEED = 500                 #mm/s
+ACCELERATION = 600              #mm/s^2
+MAX_ANGULAR_SPEED = 180         #degrees/s
+ANGULAR_ACCELERATION = 360      #degrees/s^2
+
+#waypoints closer than this to the line between their neighbours are removed
+COLLINEAR_TOLERANCE = 10        #mm
+#radius of the arcs replacing the corners, 0 to turn on the spot at the corners
+CORNER_RADIUS = 0               #mm
+#maximal heading change between two chords of an arc
+ARC_STEP_ANGLE = 15             #degrees
+
+
+def normalize_angle(angle):
+    """
+    returns the angle in ]-180, 180]
+    """
+    angle = math.fmod(angle, 360.)
+    if angle > 180.:
+        angle -= 360.
+    elif angle <= -180.:
+        angle += 360.
+    return angle
+
+
+def profile_duration(distance, max_speed, acceleration):
+    """
+    duration of a trapezoidal (or triangular) speed profile covering distance
+    """
+    distance = abs(distance)
+    if distance <= max_speed * max_speed / acceleration:
+        return 2. * math.sqrt(distance / acceleration)
+    return distance / max_speed + max_speed / acceleration
+
+
+def profile_position(t, distance, max_speed, acceleration):
+    """
+    distance covered after t seconds by the speed profile of profile_duration
+    """
+    sign = 1. if distance >= 0 else -1.
+    distance = abs(distance)
+    duration = profile_duration(distance, max_speed, acceleration)
+    if t >= duration:
+        return sign * distance
+    peak_speed = min(max_speed, math.sqrt(distance * acceleration))
+    t_acc = peak_speed / acceleration
+    if t < t_acc:
+        position = .5 * acceleration * t * t
+    elif t < duration - t_acc:
+        position = .5 * peak_speed * t_acc + peak_speed * (t - t_acc)
+    else:
+        position = distance - .5 * acceleration * (duration - t) ** 2
+    return sign * position
+
+
+def profile_speed(t, distance, max_speed, acceleration):
+    """
+    speed after t seconds on the speed profile of profile_duration
+    """
+    sign = 1. if distance >= 0 else -1.
+    distance = abs(distance)
+    duration = profile_duration(distance, max_speed, acceleration)
+    if t <= 0 or t >= duration:
+        return 0.
+    peak_speed = min(max_speed, math.sqrt(distance * acceleration))
+    return sign * min(acceleration * t, peak_speed, acceleration * (duration - t))
+
+
+def simplify(start, points, tolerance=COLLINEAR_TOLERANCE) -> list:
+    """
+    removes the points closer than tolerance to the segment joining the kept
+    points around them (Douglas-Peucker); the last point is always kept
+    start is the position of the robot, it is not in the returned list
+    """
+    path = [tuple(start)] + [tuple(point) for point in points]
+    if len(path) < 3:
+        return path[1:]
+    keep = [False] * len(path)
+    keep[0] = keep[-1] = True
+    ranges = [(0, len(path) - 1)]
+    while ranges:
+        first, last = ranges.pop()
+        farthest, distance = None, tolerance
+        for i in range(first + 1, last):
+            d = distance_to_segment(path[i][0], path[i][1], path[first], path[last])
+            if d > distance:
+                farthest, distance = i, d
+        if not farthest is None:
+            keep[farthest] = True
+            ranges.append((first, farthest))
+            ranges.append((farthest, last))
+    return [point for point, kept in zip(path, keep) if kept][1:]
+
+
+def fillet(start, points, radius=CORNER_RADIUS, step_angle=ARC_STEP_ANGLE) -> list:
+    """
+    replaces each corner of the path by an arc of the given radius, as chords
+    turning by at most step_angle degrees
+    a corner is kept if the arc does not fit in half of the segments around it
+    start is the position of the robot, it is not in the returned list
+    """
+    path = [tuple(start)] + [tuple(point) for point in points]
+    if radius <= 0 or len(path) < 3:
+        return path[1:]
+    result = []
+    for i in range(1, len(path) - 1):
+        a, b, c = path[i - 1], path[i], path[i + 1]
+        ab, bc = math.hypot(b[0] - a[0], b[1] - a[1]), math.hypot(c[0] - b[0], c[1] - b[1])
+        if ab == 0 or bc == 0:
+            result.append(b)
+            continue
+        u_1 = ((b[0] - a[0]) / ab, (b[1] - a[1]) / ab)
+        u_2 = ((c[0] - b[0]) / bc, (c[1] - b[1]) / bc)
+        turn = math.atan2(u_1[0] * u_2[1] - u_1[1] * u_2[0], u_1[0] * u_2[0] + u_1[1] * u_2[1])
+        #distance between the corner and the ends of the arc
+        tangent = radius * math.tan(abs(turn) / 2.)
+        if abs(turn) < 1e-6 or tangent > min(ab, bc) / 2.:
+            result.append(b)
+            continue
+        side = 1. if turn > 0 else -1.
+        t_1 = (b[0] - u_1[0] * tangent, b[1] - u_1[1] * tangent)
+        center = (t_1[0] - side * u_1[1] * radius, t_1[1] + side * u_1[0] * radius)
+        steps = int(math.ceil(abs(turn) * 180. / math.pi / step_angle))
+        alpha_0 = math.atan2(t_1[1] - center[1], t_1[0] - center[0])
+        result.append(t_1)
+        for k in range(1, steps + 1):
+            alpha = alpha_0 + turn * k / steps
+            result.append((center[0] + radius * math.cos(alpha),
+                           center[1] + radius * math.sin(alpha)))
+    result.append(path[-1])
+    return result
+
+
+class Trajectory:
+    """
+    Sub-goals (x, y) sent to moveTo one after the other from start, with the
+    speed profile of the motor board on each of them: a turn on the spot
+    towards the sub-goal, then a translation
+    """
+    def __init__(self, start, heading, points, max_speed=MAX_SPEED, acceleration=ACCELERATION,
+                 max_angular_speed=MAX_ANGULAR_SPEED, angular_acceleration=ANGULAR_ACCELERATION):
+        self.start = tuple(start)
+        self.heading = heading
+        self.points = [tuple(point) for point in points]
+        self.max_speed = max_speed
+        self.acceleration = acceleration
+        self.max_angular_speed = max_angular_speed
+        self.angular_acceleration = angular_acceleration
+
+        #for each sub-goal: (origin, heading, turn, length, date of departure)
+        self.legs = []
+        #date of arrival at each sub-goal, from the beginning of the trajectory
+        self.dates = []
+        self.length = 0.
+        date = 0.
+        origin = self.start
+        for point in self.points:
+            dx, dy = point[0] - origin[0], point[1] - origin[1]
+            length = math.hypot(dx, dy)
+            turn = normalize_angle(math.atan2(dy, dx) * 180. / math.pi - heading) if length > 0 else 0.
+            self.legs.append((origin, heading, turn, length, date))
+            date += (profile_duration(turn, max_angular_speed, angular_acceleration)
+                     + profile_duration(length, max_speed, acceleration))
+            self.dates.append(date)
+            self.length += length
+            heading = normalize_angle(heading + turn)
+            origin = point
+        self.duration = date
+
+    def state_at(self, t : float) -> tuple:
+        """
+        expected (x, y, heading, speed) of the robot t seconds after the
+        beginning of the trajectory
+        """
+        for (origin, heading, turn, length, departure), arrival in zip(self.legs, self.dates):
+            if t >= arrival:
+                continue
+            t -= departure
+            turn_duration = profile_duration(turn, self.max_angular_speed, self.angular_acceleration)
+            if t < turn_duration:
+                turned = profile_position(t, turn, self.max_angular_speed, self.angular_acceleration)
+                return origin[0], origin[1], normalize_angle(heading + turned), 0.
+            t -= turn_duration
+            theta = (heading + turn) * math.pi / 180.
+            done = profile_position(t, length, self.max_speed, self.acceleration)
+            return (origin[0] + done * math.cos(theta), origin[1] + done * math.sin(theta),
+                    normalize_angle(heading + turn),
+                    profile_speed(t, length, self.max_speed, self.acceleration))
+        if not self.legs:
+            return self.start[0], self.start[1], self.heading, 0.
+        x, y = self.points[-1]
+        origin, heading, turn, length, departure = self.legs[-1]
+        return x, y, normalize_angle(heading + turn), 0.
+
+
+def plan_trajectory(start, heading, waypoints, tolerance=COLLINEAR_TOLERANCE,
+                    corner_radius=CORNER_RADIUS, step_angle=ARC_STEP_ANGLE) -> Trajectory:
+    """
+    trajectory of the robot at start, with the given heading, through the
+    waypoints [(x0, y0), ...]
+    """
+    points = simplify(start, waypoints, tolerance)
+    points = fillet(start, points, corner_radius, step_angle)
+    return Trajectory(start, heading, points)
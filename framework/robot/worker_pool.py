@@ -0,0 +1,191 @@
+"""
+Pool of worker threads shared by the framework.
+The threads are started once; the functions submitted to the pool are executed
+by the first available worker, by order of priority then of submission. It
+replaces the threads created for each call of a function that blocks (moves of
+simulated actuators, ThreadedFunction...), whose number is not bounded.
+
+    pool = get_pool()
+    job = pool.submit(function, (arg1, arg2), priority = PRIORITY_HIGH)
+    job.cancel()    # if it has not started yet
+
+RESERVED_WORKERS workers only execute PRIORITY_HIGH jobs (the cancel hooks,
+see cancellation.py), so that long-running jobs of lower priority cannot
+occupy all the workers and delay them.
+"""
+
+from threading import Thread, Condition, Lock
+import heapq
+import time
+import traceback
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+DEFAULT_POOL_SIZE = 8
+#workers kept for the PRIORITY_HIGH jobs
+RESERVED_WORKERS = 2
+
+
+class Job:
+    """
+    A function call submitted to a WorkerPool
+    """
+    def __init__(self, function, args, priority):
+        self.function = function
+        self.args = args
+        self.priority = priority
+        self.submit_date = time.monotonic()
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        the job is not executed if it has not started yet
+        """
+        self.cancelled = True
+
+    def private_run(self):
+        try:
+            self.function(*self.args)
+        except Exception:
+            print("[-] Exception in worker pool job")
+            traceback.print_exc()
+
+
+class WorkerPool:
+    """
+    Fixed number of worker threads executing the submitted jobs.
+    The wait times are measured in real time, whatever the framework clock.
+    """
+    def __init__(self, size : int = DEFAULT_POOL_SIZE, name : str = "worker",
+                 reserved : int = RESERVED_WORKERS):
+        self.size = size
+        #the jobs of lower priority than PRIORITY_HIGH start only if more than
+        #reserved workers are free
+        self.reserved = min(reserved, size - 1)
+        self.jobs = []
+        self.counter = 0
+        self.condvar = Condition()
+        self.is_running = True
+        self.busy = 0
+
+        #metrics
+        self.submitted = 0
+        self.completed = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.
+        self.max_wait = 0.
+
+        self.threads = []
+        for i in range(size):
+            thread = Thread(target=self.private_run, name=name + "-" + str(i))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, function : callable, args : tuple = (), priority : int = PRIORITY_NORMAL) -> Job:
+        """
+        calls function(*args) in a worker thread
+        the jobs with the lowest priority value are executed first
+        """
+        job = Job(function, tuple(args), priority)
+        with self.condvar:
+            if not self.is_running:
+                raise Exception("Cannot submit a job to a stopped worker pool")
+            self.counter += 1
+            heapq.heappush(self.jobs, (priority, self.counter, job))
+            self.submitted += 1
+            self.max_queue_depth = max(self.max_queue_depth, len(self.jobs))
+            self.condvar.notify()
+        return job
+
+    def private_next_job(self) -> Job:
+        with self.condvar:
+            while True:
+                while self.jobs:
+                    priority, counter, job = self.jobs[0]
+                    if job.cancelled:
+                        heapq.heappop(self.jobs)
+                        continue
+                    if priority > PRIORITY_HIGH and self.busy >= self.size - self.reserved:
+                        break
+                    heapq.heappop(self.jobs)
+                    wait = time.monotonic() - job.submit_date
+                    self.total_wait += wait
+                    self.max_wait = max(self.max_wait, wait)
+                    self.busy += 1
+                    return job
+                if not self.is_running:
+                    return None
+                self.condvar.wait()
+
+    def private_run(self):
+        while True:
+            job = self.private_next_job()
+            if job is None:
+                return
+            job.private_run()
+            with self.condvar:
+                self.busy -= 1
+                self.completed += 1
+                self.condvar.notify_all()
+
+    def queue_depth(self) -> int:
+        with self.condvar:
+            return len(self.jobs)
+
+    def metrics(self) -> dict:
+        """
+        queue depth, number of busy workers and wait times (s) of the started jobs
+        """
+        with self.condvar:
+            started = self.completed + self.busy
+            return {'size': self.size,
+                    'queue_depth': len(self.jobs),
+                    'max_queue_depth': self.max_queue_depth,
+                    'busy': self.busy,
+                    'submitted': self.submitted,
+                    'completed': self.completed,
+                    'mean_wait': self.total_wait / started if started else 0.,
+                    'max_wait': self.max_wait}
+
+    def wait_idle(self, timeout : float = None) -> bool:
+        """
+        waits until all the submitted jobs are over
+        returns False on timeout
+        """
+        with self.condvar:
+            return self.condvar.wait_for(lambda: not self.jobs and self.busy == 0, timeout)
+
+    def shutdown(self, wait : bool = True):
+        """
+        the workers stop once the queued jobs are executed
+        """
+        with self.condvar:
+            self.is_running = False
+            self.condvar.notify_all()
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+
+default_pool = None
+default_pool_mutex = Lock()
+
+def get_pool() -> WorkerPool:
+    global default_pool
+    with default_pool_mutex:
+        if default_pool is None:
+            default_pool = WorkerPool()
+        return default_pool
+
+def set_pool(pool : WorkerPool):
+    """
+    replaces the pool used by the framework
+    """
+    global default_pool
+    default_pool = pool
+
+def submit(function : callable, args : tuple = (), priority : int = PRIORITY_NORMAL) -> Job:
+    return get_pool().submit(function, args, priority)
@@ -0,0 +1,91 @@
+"""
+Callback of an action coming after its timeout: the sequence must count the
+action once (in element_cancel), and wait for its other actions. Runs with a
+virtual clock in the thread and scheduler modes, in real time with asyncio
+(its timeouts use the time of the event loop).
+
+    python3 late_callback_test.py
+"""
+
+import os
+import sys
+
+#in the source tree, the modules are in the robot and action folders
+framework = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(framework, 'robot'), os.path.join(framework, 'action')]
+
+import clock
+virtual_clock = clock.VirtualClock()
+clock.set_clock(virtual_clock)
+
+import action
+from action import Sequence, Function
+from scheduler import Scheduler
+
+
+def delayed(name, delay, events):
+    """
+    action calling its callback delay seconds after its start
+    """
+    def start(callback):
+        def end():
+            events.append((name, clock.get_clock().time()))
+            callback()
+        clock.get_clock().call_later(delay, end)
+    return Function(start)
+
+def new_sequence(events):
+    """
+    the sequence [a (0.15 s, timeout 0.1 s), b (0.2 s), c (0.2 s)]
+    """
+    sequence = Sequence("late", lambda: events.append(("sequence", None)))
+    sequence.add_action(delayed("a", 0.15, events).wait(0.1))
+    sequence.add_action(delayed("b", 0.2, events).wait())
+    sequence.add_action(delayed("c", 0.2, events).wait())
+    return sequence.wait()
+
+def check(sequence, events):
+    names = [name for name, date in events]
+    assert names == ["a", "b", "c", "sequence"], events
+    assert sequence.nb_callbacks == 0, sequence.nb_callbacks
+
+
+def test_threads():
+    events = []
+    sequence = new_sequence(events)
+    sequence.exec()
+    virtual_clock.run()
+    check(sequence, events)
+
+def test_scheduler():
+    events = []
+    sequence = new_sequence(events)
+    scheduler = Scheduler()
+    scheduler.exec(sequence)
+    virtual_clock.run()
+    scheduler.stop()
+    scheduler.join()
+    check(sequence, events)
+
+def test_asyncio():
+    import asyncio
+    events = []
+    sequence = new_sequence(events)
+    clock.set_clock(clock.Clock())
+    try:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(sequence.exec_async())
+        #the sequence is over once c is, nothing more comes after
+        loop.run_until_complete(asyncio.sleep(0.1))
+        loop.close()
+    finally:
+        clock.set_clock(virtual_clock)
+    check(sequence, events)
+
+
+if __name__ == "__main__":
+    action.debug = False
+    for test in [test_threads, test_scheduler, test_asyncio]:
+        test()
+        print("[+]", test.__name__)
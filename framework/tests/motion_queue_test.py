@@ -0,0 +1,229 @@
+"""
+Motion queue of the robot (see Robot.moveTo), on the simulated robot with a
+virtual clock: no motor board is needed, and the test runs faster than real time.
+
+    python3 motion_queue_test.py
+"""
+
+import math
+import os
+import sys
+
+#in the source tree, the modules are in the robot folder
+sys.path[:0] = [os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'robot')]
+
+import clock
+virtual_clock = clock.VirtualClock()
+clock.set_clock(virtual_clock)
+
+from robot import Robot
+from simulation import SimulatedBackend
+import collision_detection
+import trajectory
+
+#distance (mm) at which a position is reached
+TOLERANCE = 5
+
+
+def new_robot():
+    return Robot(debug=False, backend=SimulatedBackend(x=500, y=500))
+
+def is_at(robot, x, y) -> bool:
+    pose = robot.get_pose(max_age=0)
+    return abs(pose.x - x) < TOLERANCE and abs(pose.y - y) < TOLERANCE
+
+def recorder(reached, robot):
+    """
+    returns a function giving the callback which appends (name, date, position) to reached
+    """
+    return lambda name: (lambda: reached.append((name, virtual_clock.time(),
+                                                 robot.get_pose(max_age=0).position())))
+
+
+def test_fifo_order():
+    robot = new_robot()
+    reached = []
+    callback = recorder(reached, robot)
+    start = virtual_clock.time()
+    robot.moveTo(1000, 500, callback=callback("a"))
+    robot.moveTo(1000, 1000, callback=callback("b"), erase=False)
+    robot.moveTo(500, 1000, 90, callback=callback("c"), erase=False)
+    virtual_clock.run()
+
+    assert [name for name, date, position in reached] == ["a", "b", "c"], reached
+    assert is_at(robot, 500, 1000)
+    #the next goal is sent at once: no delay is added to the speed profiles
+    expected = trajectory.Trajectory((500, 500), 0, [(1000, 500), (1000, 1000)]).duration
+    assert abs(reached[1][1] - start - expected) < 0.1, (reached[1][1] - start, expected)
+
+def test_erase():
+    robot = new_robot()
+    reached = []
+    callback = recorder(reached, robot)
+    robot.moveTo(1500, 500, callback=callback("forgotten"))
+    robot.moveTo(1500, 1500, callback=callback("forgotten too"), erase=False)
+    virtual_clock.advance(0.5)
+    robot.moveTo(500, 1000, callback=callback("new"))
+    virtual_clock.run()
+    assert [name for name, date, position in reached] == ["new"], reached
+    assert is_at(robot, 500, 1000)
+
+    robot.moveTo(1500, 1000, callback=callback("erased"))
+    robot.moveTo(1500, 1500, callback=callback("erased too"), erase=False)
+    robot.erase_moveTo_stack()
+    virtual_clock.run()
+    assert [name for name, date, position in reached] == ["new"], reached
+    assert not robot.motion_queue
+
+def test_stop_and_resume():
+    robot = new_robot()
+    reached = []
+    callback = recorder(reached, robot)
+    robot.moveTo(1500, 500, callback=callback("a"))
+    robot.moveTo(1500, 1000, callback=callback("b"), erase=False)
+    virtual_clock.advance(1.)
+    robot.stop_motion()
+    robot.moveTo(1000, 1000, callback=callback("c"), erase=False)
+    virtual_clock.advance(1.)
+    stopped = robot.get_pose(max_age=0)
+    virtual_clock.advance(5.)
+    #the robot stays where it stopped, the queue is kept
+    assert reached == [], reached
+    assert is_at(robot, stopped.x, stopped.y)
+    assert len(robot.motion_queue) == 3
+
+    robot.resume_motion()
+    virtual_clock.run()
+    assert [name for name, date, position in reached] == ["a", "b", "c"], reached
+    assert is_at(robot, 1000, 1000)
+
+def test_splice_detour():
+    robot = new_robot()
+    reached = []
+    callback = recorder(reached, robot)
+    robot.moveTo(1500, 500, callback=callback("goal"))
+    robot.moveTo(1500, 1000, callback=callback("next"), erase=False)
+    virtual_clock.advance(0.5)
+    robot.stop_motion()
+    robot.splice_detour([(1000, 800)])
+    assert robot.current_goal().x == 1000 and robot.current_goal().y == 800
+    #the detour point is reached before the goal
+    while not reached:
+        virtual_clock.advance(0.02)
+        if is_at(robot, 1000, 800):
+            break
+    assert reached == [], reached
+    virtual_clock.run()
+    assert [name for name, date, position in reached] == ["goal", "next"], reached
+    assert is_at(robot, 1500, 1000)
+
+def test_successive_detours():
+    robot = new_robot()
+    reached = []
+    callback = recorder(reached, robot)
+    robot.moveTo(1500, 500, callback=callback("goal"))
+    robot.moveTo(1500, 1000, callback=callback("next"), erase=False)
+    virtual_clock.advance(0.5)
+    robot.stop_motion()
+    robot.splice_detour([(1000, 800), (1200, 900)])
+    virtual_clock.advance(0.5)
+    #second detection: the points of the first detour are replaced
+    robot.stop_motion()
+    robot.splice_detour([(1100, 300)])
+    queue = [(goal.x, goal.y, goal.detour) for goal in robot.motion_queue]
+    assert queue == [(1100, 300, True), (1500, 500, False), (1500, 1000, False)], queue
+    goal = robot.current_goal(include_detour=False)
+    assert (goal.x, goal.y) == (1500, 500)
+    virtual_clock.run()
+    assert [name for name, date, position in reached] == ["goal", "next"], reached
+    assert is_at(robot, 1500, 1000)
+
+def test_successive_detections():
+    robot = new_robot()
+    reached = []
+    callback = recorder(reached, robot)
+    robot.moveTo(2500, 500, callback=callback("goal"))
+    policy = collision_detection.AvoidancePolicy(collision_detection.AVOIDANCE_REROUTE)
+    for i in range(3):
+        virtual_clock.advance(0.5)
+        policy.obstacle_detected(robot, False)
+        #a single detour, leading to the goal of moveTo
+        detours = [goal for goal in robot.motion_queue if goal.detour]
+        assert len(detours) == 1, [(goal.x, goal.y) for goal in robot.motion_queue]
+        assert len(robot.motion_queue) == 2
+        assert robot.current_goal(include_detour=False).callback is not None
+    virtual_clock.run()
+    assert [name for name, date, position in reached] == ["goal"], reached
+    assert is_at(robot, 2500, 500)
+
+def test_corner_radius():
+    robot = new_robot()
+    reached = []
+    callback = recorder(reached, robot)
+    corner = [(1500, 500), (1500, 1500)]
+    sharp = trajectory.plan_trajectory((500, 500), 0, corner)
+    path = robot.follow_path(corner, callback=callback("end"), corner_radius=200)
+    #the corner is replaced by chords of an arc of radius 200 around (1300, 700)
+    assert len(path.points) > len(sharp.points) and len(robot.motion_queue) == len(path.points)
+    for x, y in path.points[:-1]:
+        assert abs(math.hypot(x - 1300, y - 700) - 200) < 1 or (x, y) == (1300, 500), (x, y)
+    length = lambda path: sum(math.hypot(b[0] - a[0], b[1] - a[1]) for a, b
+                              in zip([(500, 500)] + path.points, path.points))
+    assert length(path) < length(sharp)
+    start = virtual_clock.time()
+    virtual_clock.run()
+    assert [name for name, date, position in reached] == ["end"], reached
+    assert is_at(robot, 1500, 1500)
+    assert abs(reached[0][1] - start - path.duration) < 0.1, (reached[0][1] - start, path.duration)
+
+def test_obstacle_edge():
+    robot = new_robot()
+    gpio = robot.backend.gpio
+    robot.start_collision_events(front_pin=1, rear_pin=2, gpio=gpio)
+    robot.moveTo(1500, 500)
+    virtual_clock.advance(0.5)
+    assert robot.direction == robot.motion.DIR_FORWARD
+    robot.get_pose()
+    #the edge stops the robot without reading the motor board
+    reads = []
+    for name in ["get_pos_X", "get_pos_Y", "get_heading", "getDirection"]:
+        setattr(robot.motion, name, (lambda read, name: lambda: reads.append(name) or read())(
+            getattr(robot.motion, name), name))
+    gpio.digital_write(1, 1)
+    assert robot.obstacle_stop and reads == [], reads
+    gpio.digital_write(1, 0)
+    assert not robot.obstacle_stop
+    virtual_clock.run()
+    assert is_at(robot, 1500, 500)
+    assert robot.direction is None
+    robot.stop_collision_sensors()
+
+def test_stale_callbacks():
+    robot = new_robot()
+    reached = []
+    callback = recorder(reached, robot)
+    robot.moveTo(1500, 500, callback=callback("a"))
+    robot.moveTo(1500, 1000, callback=callback("b"), erase=False)
+    virtual_clock.advance(0.5)
+    stale = robot.leg - 1
+    #callbacks of a goal which is not the current one anymore
+    robot.private_after_translation(stale)
+    robot.private_moveTo_callback(stale)
+    assert reached == [], reached
+    assert len(robot.motion_queue) == 2
+
+    #the callbacks of the goal interrupted by stop_motion are ignored too
+    leg = robot.leg
+    robot.stop_motion()
+    robot.private_moveTo_callback(leg)
+    assert reached == [] and len(robot.motion_queue) == 2
+    robot.resume_motion()
+    virtual_clock.run()
+    assert [name for name, date, position in reached] == ["a", "b"], reached
+
+
+if __name__ == "__main__":
+    for test in [test_fifo_order, test_erase, test_stop_and_resume, test_splice_detour,
+                 test_successive_detours, test_successive_detections, test_corner_radius, test_obstacle_edge, test_stale_callbacks]:
+        test()
+        print("[+]", test.__name__)
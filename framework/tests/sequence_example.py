@@ -1,5 +1,5 @@
 from ..local_robot.big_robot import *
-from threading import Thread
+import worker_pool
 import time
 
 from sys import argv
@@ -9,7 +9,7 @@ if __name__ == "__main__":
     def move(robot, x, y, t, callback=None):
         print "[!!] Moving from "+str(x)+" to "+str(y)+" during "+str(t)
 
-        thread = Thread(target=lambda: run(t,callback)).start()
+        worker_pool.submit(run, (t, callback))
 
     def run(t,c):
         time.sleep(t)
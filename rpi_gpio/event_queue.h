@@ -0,0 +1,60 @@
+#ifndef EVENT_QUEUE_H
+#define EVENT_QUEUE_H
+
+
+#include <atomic>
+#include <cstddef>
+
+
+// Bounded lock-free queue for a single producer thread and a single consumer
+// thread. When it is full, push drops the item and counts an overflow.
+template<typename T, size_t N>
+class RingBuffer
+{
+    static_assert(N && !(N & (N - 1)), "the capacity of a RingBuffer must be a power of 2");
+
+    public:
+        // producer only
+        bool push(const T& item)
+        {
+            size_t head = _head.load(std::memory_order_relaxed);
+            if(head - _tail.load(std::memory_order_acquire) == N)
+            {
+                _overflows.fetch_add(1, std::memory_order_relaxed);
+                return false;
+            }
+
+            _items[head & (N - 1)] = item;
+            _head.store(head + 1, std::memory_order_release);
+            return true;
+        }
+
+        // consumer only
+        bool pop(T& item)
+        {
+            size_t tail = _tail.load(std::memory_order_relaxed);
+            if(tail == _head.load(std::memory_order_acquire))
+                return false;
+
+            item = _items[tail & (N - 1)];
+            _tail.store(tail + 1, std::memory_order_release);
+            return true;
+        }
+
+        size_t size() const
+        {return _head.load(std::memory_order_acquire) - _tail.load(std::memory_order_acquire);}
+
+        size_t overflows() const
+        {return _overflows.load(std::memory_order_relaxed);}
+
+    private:
+        T _items[N];
+
+        // on different cache lines, so that the two threads do not share them
+        alignas(64) std::atomic<size_t> _head{0};
+        alignas(64) std::atomic<size_t> _tail{0};
+        std::atomic<size_t> _overflows{0};
+};
+
+
+#endif
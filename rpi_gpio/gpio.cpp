@@ -32,13 +32,22 @@ void GPIO::add_attached_on_gpio_up(const _callback& callback, bool one_shot)
 
 
 void GPIO::clean_on_gpio_change()
-{_attached_on_change.clear();}
+{
+    _attached_on_change.clear();
+    _attached_on_change_one_shot.clear();
+}
 
 void GPIO::clean_on_gpio_down()
-{_attached_on_down.clear();}
+{
+    _attached_on_down.clear();
+    _attached_on_down_one_shot.clear();
+}
 
 void GPIO::clean_on_gpio_up()
-{_attached_on_up.clear();}
+{
+    _attached_on_up.clear();
+    _attached_on_up_one_shot.clear();
+}
 
 void GPIO::clean_callbacks()
 {
@@ -73,6 +82,9 @@ void GPIO::remove_called_one_shot(std::vector<_callback>& callbacks, std::vector
             }
         ),
         callbacks.end());
+
+    // the one shot callbacks are removed, the remaining ones are not
+    one_shot_index.clear();
 }
 
 void GPIO::call_on_gpio_change()
@@ -102,6 +114,25 @@ void GPIO::call_on_gpio_up()
     remove_called_one_shot(_attached_on_up, _attached_on_up_one_shot);
 }
 
+std::vector<_callback> GPIO::take_callbacks(int value)
+{
+    std::vector<_callback> callbacks(_attached_on_change);
+    remove_called_one_shot(_attached_on_change, _attached_on_change_one_shot);
+
+    if(value)
+    {
+        callbacks.insert(callbacks.end(), _attached_on_up.begin(), _attached_on_up.end());
+        remove_called_one_shot(_attached_on_up, _attached_on_up_one_shot);
+    }
+    else
+    {
+        callbacks.insert(callbacks.end(), _attached_on_down.begin(), _attached_on_down.end());
+        remove_called_one_shot(_attached_on_down, _attached_on_down_one_shot);
+    }
+
+    return callbacks;
+}
+
 
 void GPIO::set_value(int val)
 {_value = val;}
@@ -111,3 +142,53 @@ int GPIO::get_id() const
 
 int GPIO::get_value() const
 {return _value;}
+
+
+GPIOCounter::GPIOCounter(int edges) :
+    _edges(edges)
+{reset();}
+
+void GPIOCounter::add_edge(int value, uint64_t timestamp)
+{
+    if(!(_edges & (value ? COUNT_RISING : COUNT_FALLING)))
+        return;
+
+    _count++;
+    if(_history_size)
+        _period = timestamp - _history[(_history_index + COUNTER_HISTORY - 1) % COUNTER_HISTORY];
+
+    _history[_history_index] = timestamp;
+    _history_index = (_history_index + 1) % COUNTER_HISTORY;
+    if(_history_size < COUNTER_HISTORY)
+        _history_size++;
+}
+
+void GPIOCounter::reset()
+{
+    _count = 0;
+    _period = 0;
+    _history_size = 0;
+    _history_index = 0;
+}
+
+uint64_t GPIOCounter::get_count() const
+{return _count;}
+
+uint64_t GPIOCounter::get_period() const
+{return _period;}
+
+double GPIOCounter::get_frequency(uint64_t now) const
+{
+    if(_history_size < 2)
+        return 0.;
+
+    uint64_t first = _history[(_history_index + COUNTER_HISTORY - _history_size) % COUNTER_HISTORY];
+    uint64_t last = _history[(_history_index + COUNTER_HISTORY - 1) % COUNTER_HISTORY];
+    double intervals = _history_size - 1;
+
+    // without edge for more than two mean periods, the signal is slowing down or stopped:
+    // the frequency decreases with the time elapsed since the first edge
+    if(now > last && (now - last) * intervals > 2 * (last - first))
+        return intervals * 1e9 / (now - first);
+    return intervals * 1e9 / (last - first);
+}
@@ -2,6 +2,7 @@
 #define GPIO_H
 
 
+#include <cstdint>
 #include <functional>
 #include <vector>
 
@@ -26,6 +27,10 @@ class GPIO
         void call_on_gpio_down();
         void call_on_gpio_up();
 
+        // Returns the callbacks to call for a new value of the gpio, and
+        // removes the one shot ones
+        std::vector<_callback> take_callbacks(int value);
+
         void set_value(int val);
 
         int get_id() const;
@@ -47,4 +52,37 @@ class GPIO
 };
 
 
+// edges counted by a GPIOCounter
+#define COUNT_RISING 1
+#define COUNT_FALLING 2
+#define COUNT_BOTH 3
+
+// number of edges on which the frequency is averaged
+#define COUNTER_HISTORY 16
+
+// Counts the edges of a pin and measures the time between them
+class GPIOCounter
+{
+    public:
+        GPIOCounter(int edges = COUNT_RISING);
+
+        void add_edge(int value, uint64_t timestamp);
+        void reset();
+
+        uint64_t get_count() const;
+        uint64_t get_period() const;
+        double get_frequency(uint64_t now) const;
+
+    private:
+        int _edges;
+        uint64_t _count;
+        uint64_t _period;
+
+        // timestamps of the last edges
+        uint64_t _history[COUNTER_HISTORY];
+        size_t _history_size;
+        size_t _history_index;
+};
+
+
 #endif
@@ -0,0 +1,383 @@
+#include <algorithm>
+#include <chrono>
+#include <cstring>
+#include <iostream>
+
+#include <fcntl.h>
+#include <poll.h>
+#include <sys/ioctl.h>
+#include <unistd.h>
+#include <linux/gpio.h>
+
+#include "wiring.h"
+#include "gpio_backend.h"
+
+
+#define POLLING_PERIOD_MS 1
+#define CONSUMER_LABEL "robot-framework"
+
+
+uint64_t monotonic_ns()
+{
+    return std::chrono::duration_cast<std::chrono::nanoseconds>(
+        std::chrono::steady_clock::now().time_since_epoch()).count();
+}
+
+uint64_t kernel_timestamp_to_monotonic(uint64_t timestamp)
+{
+    // the line events are timestamped with CLOCK_REALTIME before Linux 5.7,
+    // with CLOCK_MONOTONIC since: the clock is the one the timestamp is closest to
+    uint64_t now = monotonic_ns();
+    uint64_t realtime_now = std::chrono::duration_cast<std::chrono::nanoseconds>(
+        std::chrono::system_clock::now().time_since_epoch()).count();
+    if(realtime_now > now && timestamp > now + (realtime_now - now) / 2)
+    {
+        uint64_t offset = realtime_now - now;
+        timestamp = timestamp > offset ? timestamp - offset : 0;
+    }
+    // never in the future, so that the differences with now do not wrap around
+    return std::min(timestamp, now);
+}
+
+
+void GPIOBackend::set_debounce(int pin, uint64_t debounce_ns)
+{
+    std::lock_guard<std::mutex> lock(_mutex);
+    _pins[pin].debounce = debounce_ns;
+}
+
+void GPIOBackend::filter(std::vector<GPIOEvent>& events, const std::vector<GPIOEvent>& raw)
+{
+    std::lock_guard<std::mutex> lock(_mutex);
+
+    for(const GPIOEvent& event : raw)
+    {
+        std::map<int, PinState>::iterator it = _pins.find(event.pin);
+        if(it == _pins.end())
+            continue;
+
+        PinState& state = it->second;
+        if(state.debounce && state.last_edge && event.timestamp < state.last_edge + state.debounce)
+        {
+            state.bounced = true;
+            continue;
+        }
+        if(event.value == state.value)
+            continue;
+
+        state.value = event.value;
+        state.last_edge = event.timestamp;
+        events.push_back(event);
+    }
+}
+
+void GPIOBackend::check_bounced_pins(std::vector<GPIOEvent>& events)
+{
+    std::lock_guard<std::mutex> lock(_mutex);
+    uint64_t now = monotonic_ns();
+
+    for(std::map<int, PinState>::iterator it = _pins.begin(); it != _pins.end(); it++)
+    {
+        PinState& state = it->second;
+        if(!state.bounced || now < state.last_edge + state.debounce)
+            continue;
+
+        state.bounced = false;
+        int value = read(it->first);
+        if(value != state.value)
+        {
+            state.value = value;
+            state.last_edge = now;
+            events.push_back(GPIOEvent{it->first, value, now});
+        }
+    }
+}
+
+int GPIOBackend::debounce_timeout(int timeout_ms)
+{
+    std::lock_guard<std::mutex> lock(_mutex);
+    uint64_t now = monotonic_ns();
+
+    for(std::map<int, PinState>::iterator it = _pins.begin(); it != _pins.end(); it++)
+    {
+        const PinState& state = it->second;
+        if(!state.bounced)
+            continue;
+
+        uint64_t end = state.last_edge + state.debounce;
+        uint64_t remaining = end > now ? (end - now + 999999) / 1000000 : 0;
+        // clamped before the cast: a negative timeout would make poll wait forever
+        if(timeout_ms < 0 || remaining < (uint64_t)timeout_ms)
+            timeout_ms = (int)remaining;
+    }
+    return timeout_ms;
+}
+
+
+LineEventBackend::LineEventBackend(const char* chip) :
+    _chip_fd(open(chip, O_RDONLY | O_CLOEXEC))
+{
+    if(_chip_fd < 0)
+        std::cerr<<"[-] Unable to open "<<chip<<", GPIO pins are polled"<<std::endl;
+
+    if(pipe2(_wake_pipe, O_NONBLOCK | O_CLOEXEC) < 0)
+        _wake_pipe[0] = _wake_pipe[1] = -1;
+}
+
+LineEventBackend::~LineEventBackend()
+{
+    for(std::map<int, int>::iterator it = _line_fds.begin(); it != _line_fds.end(); it++)
+        close(it->second);
+    for(int fd : _to_close)
+        close(fd);
+    for(int fd : _wake_pipe)
+        if(fd >= 0)
+            close(fd);
+    if(_chip_fd >= 0)
+        close(_chip_fd);
+}
+
+const char* LineEventBackend::name() const
+{return _chip_fd >= 0 ? "line events" : "polling";}
+
+void LineEventBackend::watch(int pin)
+{
+    {
+        std::lock_guard<std::mutex> lock(_mutex);
+
+        if(_line_fds.count(pin) || std::count(_polled_pins.begin(), _polled_pins.end(), pin))
+            return;
+
+        _pins[pin].value = read(pin);
+
+        // Requesting the events of a line makes it an input: the outputs are polled
+        bool requested = false;
+        if(_chip_fd >= 0 && getAlt(pin) == 0)
+        {
+            gpioevent_request request;
+            memset(&request, 0, sizeof(request));
+            request.lineoffset = pin;
+            request.handleflags = GPIOHANDLE_REQUEST_INPUT;
+            request.eventflags = GPIOEVENT_REQUEST_BOTH_EDGES;
+            strncpy(request.consumer_label, CONSUMER_LABEL, sizeof(request.consumer_label) - 1);
+
+            if(ioctl(_chip_fd, GPIO_GET_LINEEVENT_IOCTL, &request) == 0)
+            {
+                fcntl(request.fd, F_SETFL, O_NONBLOCK);
+                _line_fds[pin] = request.fd;
+                requested = true;
+            }
+            else
+                std::cerr<<"[-] Unable to get the events of pin "<<pin<<", it is polled"<<std::endl;
+        }
+
+        if(!requested)
+            _polled_pins.push_back(pin);
+    }
+
+    wake_up();
+}
+
+void LineEventBackend::unwatch(int pin)
+{
+    {
+        std::lock_guard<std::mutex> lock(_mutex);
+
+        _pins.erase(pin);
+        _polled_pins.erase(std::remove(_polled_pins.begin(), _polled_pins.end(), pin), _polled_pins.end());
+
+        // closed by the thread waiting for the events, which may be polling it
+        std::map<int, int>::iterator it = _line_fds.find(pin);
+        if(it != _line_fds.end())
+        {
+            _to_close.push_back(it->second);
+            _line_fds.erase(it);
+        }
+    }
+
+    wake_up();
+}
+
+void LineEventBackend::wait_events(std::vector<GPIOEvent>& events, int timeout_ms)
+{
+    std::vector<pollfd> fds;
+    std::vector<int> pins;
+    bool polling;
+
+    timeout_ms = debounce_timeout(timeout_ms);
+    {
+        std::lock_guard<std::mutex> lock(_mutex);
+
+        for(int fd : _to_close)
+            close(fd);
+        _to_close.clear();
+
+        fds.push_back(pollfd{_wake_pipe[0], POLLIN, 0});
+        pins.push_back(-1);
+        for(std::map<int, int>::iterator it = _line_fds.begin(); it != _line_fds.end(); it++)
+        {
+            fds.push_back(pollfd{it->second, POLLIN, 0});
+            pins.push_back(it->first);
+        }
+        polling = !_polled_pins.empty();
+    }
+
+    if(polling)
+        timeout_ms = std::min(timeout_ms, POLLING_PERIOD_MS);
+
+    std::vector<GPIOEvent> raw;
+    if(poll(fds.data(), fds.size(), timeout_ms) > 0)
+    {
+        char buffer[64];
+        if(fds[0].revents & POLLIN)
+            while(::read(_wake_pipe[0], buffer, sizeof(buffer)) > 0);
+
+        for(size_t i = 1; i < fds.size(); i++)
+        {
+            if(!(fds[i].revents & POLLIN))
+                continue;
+
+            gpioevent_data data;
+            while(::read(fds[i].fd, &data, sizeof(data)) == sizeof(data))
+                raw.push_back(GPIOEvent{pins[i], data.id == GPIOEVENT_EVENT_RISING_EDGE,
+                                         kernel_timestamp_to_monotonic(data.timestamp)});
+        }
+    }
+
+    if(polling)
+    {
+        std::lock_guard<std::mutex> lock(_mutex);
+        uint64_t now = monotonic_ns();
+
+        for(int pin : _polled_pins)
+        {
+            int value = read(pin);
+            if(value != _pins[pin].value)
+                raw.push_back(GPIOEvent{pin, value, now});
+        }
+    }
+
+    filter(events, raw);
+    check_bounced_pins(events);
+}
+
+void LineEventBackend::wake_up()
+{
+    if(_wake_pipe[1] >= 0)
+    {
+        char c = 0;
+        if(write(_wake_pipe[1], &c, 1) < 0)
+            return; // the pipe is full: the thread is already woken up
+    }
+}
+
+int LineEventBackend::read(int pin)
+{return digitalRead(pin);}
+
+
+const char* SimulatedChip::name() const
+{return "simulated chip";}
+
+void SimulatedChip::watch(int pin)
+{
+    std::lock_guard<std::mutex> lock(_mutex);
+    if(!_pins.count(pin))
+        _pins[pin].value = read(pin);
+}
+
+void SimulatedChip::unwatch(int pin)
+{
+    std::lock_guard<std::mutex> lock(_mutex);
+    _pins.erase(pin);
+}
+
+void SimulatedChip::wait_events(std::vector<GPIOEvent>& events, int timeout_ms)
+{
+    std::vector<GPIOEvent> raw;
+    timeout_ms = debounce_timeout(timeout_ms);
+    {
+        std::unique_lock<std::mutex> lock(_mutex);
+        _condition.wait_for(lock, std::chrono::milliseconds(timeout_ms),
+                            [this]() {return !_queue.empty() || _woken_up;});
+        _woken_up = false;
+        raw.assign(_queue.begin(), _queue.end());
+        _queue.clear();
+    }
+
+    filter(events, raw);
+    check_bounced_pins(events);
+}
+
+void SimulatedChip::wake_up()
+{
+    std::lock_guard<std::mutex> lock(_mutex);
+    _woken_up = true;
+    _condition.notify_all();
+}
+
+void SimulatedChip::set_value(int pin, int value)
+{
+    std::lock_guard<std::mutex> lock(_mutex);
+
+    value = value ? 1 : 0;
+    int old_value = read(pin);
+    _values[pin] = value;
+    if(old_value != value && _pins.count(pin))
+    {
+        _queue.push_back(GPIOEvent{pin, value, monotonic_ns()});
+        _condition.notify_all();
+    }
+}
+
+int SimulatedChip::get_value(int pin)
+{
+    std::lock_guard<std::mutex> lock(_mutex);
+    return read(pin);
+}
+
+int SimulatedChip::read(int pin)
+{
+    std::map<int, int>::iterator it = _values.find(pin);
+    return it == _values.end() ? 0 : it->second;
+}
+
+
+#ifdef GPIO_SIMULATION
+
+SimulatedChip& simulated_chip()
+{
+    static SimulatedChip chip;
+    return chip;
+}
+
+int wiringPiSetupGpio()
+{return 0;}
+
+int wpiPinToGpio(int wpi)
+{return wpi;}
+
+int getAlt(int pin)
+{return 0;}
+
+void pinMode(int pin, int mode)
+{}
+
+void pullUpDnControl(int pin, int mode)
+{}
+
+int digitalRead(int pin)
+{return simulated_chip().get_value(pin);}
+
+void digitalWrite(int pin, int value)
+{simulated_chip().set_value(pin, value);}
+
+int analogRead(int pin)
+{return simulated_chip().get_value(pin);}
+
+void analogWrite(int pin, int value)
+{simulated_chip().set_value(pin, value);}
+
+void pwmWrite(int pin, int value)
+{simulated_chip().set_value(pin, value);}
+
+#endif
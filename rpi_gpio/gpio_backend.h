@@ -0,0 +1,129 @@
+#ifndef GPIO_BACKEND_H
+#define GPIO_BACKEND_H
+
+
+#include <condition_variable>
+#include <cstdint>
+#include <deque>
+#include <map>
+#include <mutex>
+#include <vector>
+
+
+struct GPIOEvent
+{
+    int pin;
+    int value;
+    uint64_t timestamp; // ns
+};
+
+
+// Source of the edges of the watched pins
+class GPIOBackend
+{
+    public:
+        virtual ~GPIOBackend() {}
+
+        virtual const char* name() const = 0;
+
+        virtual void watch(int pin) = 0;
+        virtual void unwatch(int pin) = 0;
+
+        // Waits at most timeout_ms for events and appends them to events
+        virtual void wait_events(std::vector<GPIOEvent>& events, int timeout_ms) = 0;
+
+        // Makes wait_events return as soon as possible
+        virtual void wake_up() = 0;
+
+        void set_debounce(int pin, uint64_t debounce_ns);
+
+    protected:
+        // Drops the bounces: an edge is kept if it changes the value of the pin
+        // and if it comes more than the debounce delay after the last kept edge.
+        // The value of a pin whose edges were dropped is checked again when its
+        // debounce delay is over.
+        void filter(std::vector<GPIOEvent>& events, const std::vector<GPIOEvent>& raw);
+        void check_bounced_pins(std::vector<GPIOEvent>& events);
+        int debounce_timeout(int timeout_ms);
+
+        virtual int read(int pin) = 0;
+
+        struct PinState
+        {
+            int value = -1;
+            uint64_t last_edge = 0;
+            uint64_t debounce = 0;
+            bool bounced = false;
+        };
+
+        std::mutex _mutex;
+        std::map<int, PinState> _pins;
+};
+
+
+// Linux GPIO character device (/dev/gpiochipN): the kernel timestamps the
+// edges, the thread sleeps in poll() until one happens.
+// The pins that cannot be requested as line events (or all of them if there
+// is no chip) are polled every millisecond with digitalRead.
+class LineEventBackend : public GPIOBackend
+{
+    public:
+        LineEventBackend(const char* chip = "/dev/gpiochip0");
+        ~LineEventBackend();
+
+        const char* name() const;
+
+        void watch(int pin);
+        void unwatch(int pin);
+        void wait_events(std::vector<GPIOEvent>& events, int timeout_ms);
+        void wake_up();
+
+    protected:
+        int read(int pin);
+
+    private:
+        int _chip_fd;
+        int _wake_pipe[2];
+
+        std::map<int, int> _line_fds;
+        std::vector<int> _polled_pins;
+        std::vector<int> _to_close;
+};
+
+
+// GPIO chip without hardware: the values of the pins are set with set_value
+class SimulatedChip : public GPIOBackend
+{
+    public:
+        const char* name() const;
+
+        void watch(int pin);
+        void unwatch(int pin);
+        void wait_events(std::vector<GPIOEvent>& events, int timeout_ms);
+        void wake_up();
+
+        void set_value(int pin, int value);
+        int get_value(int pin);
+
+    protected:
+        int read(int pin);
+
+    private:
+        std::map<int, int> _values;
+        std::deque<GPIOEvent> _queue;
+        std::condition_variable _condition;
+        bool _woken_up = false;
+};
+
+
+uint64_t monotonic_ns();
+// Converts the timestamp of a line event (CLOCK_REALTIME or CLOCK_MONOTONIC,
+// according to the kernel) to monotonic_ns
+uint64_t kernel_timestamp_to_monotonic(uint64_t timestamp);
+
+#ifdef GPIO_SIMULATION
+SimulatedChip& simulated_chip();
+#endif
+
+
+#endif
@@ -1,12 +1,22 @@
 #include <functional>
 #include <unistd.h>
+#include <sys/eventfd.h>
 #include <iostream>
 #include <thread>
+#include <atomic>
 #include <mutex>
 #include <map>
 
-#include "wiringPi.h"
+#include "wiring.h"
 #include "gpio.h"
+#include "gpio_backend.h"
+#include "event_queue.h"
+
+
+// the GPIO thread wakes up at least every WAIT_TIMEOUT_MS to check it must stop
+#define WAIT_TIMEOUT_MS 100
+#define MAX_PINS 64
+#define EVENT_QUEUE_SIZE 256
 
 
 typedef void (*c_fct_ptr)(void);
@@ -26,6 +36,10 @@ extern "C" {
     void analog_write(int pin, int val);
     void pwm_write(int pin, int val);
 
+    unsigned long long read_pins(const int* pins, int count);
+    void read_pins_values(const int* pins, int count, unsigned char* values);
+    void write_pins(const int* pins, int count, unsigned long long values);
+
     void assign_callback_on_gpio_change(int pin, c_fct_ptr callback, bool one_shot = false);
     void assign_callback_on_gpio_down(int pin, c_fct_ptr callback, bool one_shot = false);
     void assign_callback_on_gpio_up(int pin, c_fct_ptr callback, bool one_shot = false);
@@ -36,6 +50,26 @@ extern "C" {
     void remove_callbacks_on_gpio(int pin);
     void remove_all_callback();
 
+    void set_debounce(int pin, int debounce_us);
+    unsigned long long event_timestamp(int pin);
+    const char* backend_name();
+
+    int use_manual_dispatch();
+    int dispatch_events();
+    unsigned long long event_overflows();
+    unsigned long long dispatch_rounds_started();
+    unsigned long long dispatch_rounds_finished();
+
+    void enable_counter(int pin, int edges);
+    void disable_counter(int pin);
+    void reset_counter(int pin);
+    unsigned long long counter_count(int pin);
+    unsigned long long counter_period(int pin);
+    double counter_frequency(int pin);
+#ifdef GPIO_SIMULATION
+    void simulated_chip_set_value(int pin, int value);
+#endif
+
     void init();
     void join();
 
@@ -46,45 +80,124 @@ extern "C" {
 
 std::map<int, GPIO> gpios;
 
-bool is_running = false;
+// The GPIO thread only waits for the edges and pushes them in the event queue.
+// The callbacks are called by the dispatch thread (or by dispatch_events in
+// manual dispatch mode), without any lock held, so that a slow callback does
+// not delay the detection of the edges.
+std::atomic<bool> is_running(false);
 std::mutex main_mutex;
 std::thread main_thread;
+std::thread dispatch_thread;
+// The event queue has a single consumer: the dispatch thread, or the callers
+// of dispatch_events in manual dispatch mode, one at a time (dispatching).
+// manual_dispatch can only be set before the threads are started.
+std::atomic<bool> manual_dispatch(false);
+std::atomic<bool> dispatching(false);
+
+// A dispatch round takes the callbacks of an edge under main_mutex, then calls
+// them. A removed callback can still be called by the round in progress, so
+// its trampoline is only freed by the python side once all the rounds started
+// before the removal are finished (see encapsulate_callback.py). The rounds
+// are run by one thread at a time, so they finish in order.
+unsigned long long rounds_started = 0;              // under main_mutex
+std::atomic<unsigned long long> rounds_finished(0);
+
+RingBuffer<GPIOEvent, EVENT_QUEUE_SIZE> event_queue;
+int event_fd = eventfd(0, EFD_CLOEXEC);
+
+GPIOBackend* backend = nullptr;
+std::mutex backend_mutex;
 
+// timestamp (ns) of the last edge of each pin, readable from the callbacks
+std::atomic<unsigned long long> timestamps[MAX_PINS];
+
+// pins having callbacks: the edges of the other pins (counters) are not queued
+std::atomic<bool> dispatched_pins[MAX_PINS];
+
+// The counters are updated by the GPIO thread itself: counting the edges
+// does not involve any callback
+std::map<int, GPIOCounter> counters;
+std::mutex counters_mutex;
+
+
+GPIOBackend* get_backend()
+{
+    std::lock_guard<std::mutex> lock(backend_mutex);
+    if(!backend)
+    {
+#ifdef GPIO_SIMULATION
+        backend = &simulated_chip();
+#else
+        backend = new LineEventBackend();
+#endif
+    }
+    return backend;
+}
+
+
+// calls the callbacks of the queued events, in the consumer thread
+int dispatch_queue();
+
+void notify_dispatch()
+{
+    uint64_t one = 1;
+    if(write(event_fd, &one, sizeof(one)) < 0)
+        std::cerr<<"[-] Unable to wake up the GPIO dispatch thread"<<std::endl;
+}
 
 void run()
 {
-	std::cout<<"[+++] Starting GPIO thread"<<std::endl;
+	std::cout<<"[+++] Starting GPIO thread ("<<get_backend()->name()<<")"<<std::endl;
+
+	std::vector<GPIOEvent> events;
 
-	is_running = true;
 	while(is_running)
 	{
-        main_mutex.lock();
+        events.clear();
+        get_backend()->wait_events(events, WAIT_TIMEOUT_MS);
 
-        for(std::map<int, GPIO>::iterator it = gpios.begin(); it != gpios.end(); it++)
+        if(!events.empty())
         {
-            int current = digitalRead(it->first);
-            if(current != it->second.get_value())
+            std::lock_guard<std::mutex> lock(counters_mutex);
+            for(const GPIOEvent& event : events)
             {
-                it->second.set_value(current);
-                it->second.call_on_gpio_change();
-                if(current)
-                    it->second.call_on_gpio_up();
-                else
-                    it->second.call_on_gpio_down();
+                std::map<int, GPIOCounter>::iterator it = counters.find(event.pin);
+                if(it != counters.end())
+                    it->second.add_edge(event.value, event.timestamp);
             }
         }
 
-		main_mutex.unlock();
+        for(const GPIOEvent& event : events)
+            if(event.pin < 0 || event.pin >= MAX_PINS || dispatched_pins[event.pin])
+                event_queue.push(event);
 
-		usleep(1000);
+        if(!events.empty() && !manual_dispatch)
+            notify_dispatch();
 	}
 }
 
+void dispatch_run()
+{
+    uint64_t counter;
+
+    while(is_running)
+    {
+        if(read(event_fd, &counter, sizeof(counter)) < 0)
+            continue;
+        dispatch_queue();
+    }
+}
+
 
 int create_thread()
 {
 	if(!main_thread.joinable())
+	{
+		is_running = true;
 		main_thread = std::thread(run);
+		if(!manual_dispatch)
+			dispatch_thread = std::thread(dispatch_run);
+	}
 	return main_thread.joinable();
 }
 
@@ -132,13 +245,42 @@ void pwm_write(int pin, int val)
 {return pwmWrite(pin, val);}
 
 
+// bit i of the result is the value of pins[i] (count <= 64)
+unsigned long long read_pins(const int* pins, int count)
+{
+    unsigned long long values = 0;
+    for(int i = 0; i < count && i < 64; i++)
+        if(digitalRead(pins[i]))
+            values |= 1ULL << i;
+    return values;
+}
+
+void read_pins_values(const int* pins, int count, unsigned char* values)
+{
+    for(int i = 0; i < count; i++)
+        values[i] = digitalRead(pins[i]) ? 1 : 0;
+}
+
+// pins[i] takes the value of bit i of values (count <= 64)
+void write_pins(const int* pins, int count, unsigned long long values)
+{
+    for(int i = 0; i < count && i < 64; i++)
+        digitalWrite(pins[i], (values >> i) & 1);
+}
+
+
 void assign_callback_on_gpio_change(int pin, c_fct_ptr callback, bool one_shot)
 {
     main_mutex.lock();
     create_thread_if_not_running();
 
     if(!gpios.count(pin))
+    {
         gpios[pin] = GPIO(pin, digitalRead(pin));
+        get_backend()->watch(pin);
+        if(pin >= 0 && pin < MAX_PINS)
+            dispatched_pins[pin] = true;
+    }
 
     gpios[pin].add_attached_on_gpio_change(_callback(callback), one_shot);
 
@@ -151,7 +293,12 @@ void assign_callback_on_gpio_down(int pin, c_fct_ptr callback, bool one_shot)
     create_thread_if_not_running();
 
     if(!gpios.count(pin))
+    {
         gpios[pin] = GPIO(pin, digitalRead(pin));
+        get_backend()->watch(pin);
+        if(pin >= 0 && pin < MAX_PINS)
+            dispatched_pins[pin] = true;
+    }
 
     gpios[pin].add_attached_on_gpio_down(_callback(callback), one_shot);
 
@@ -164,7 +311,12 @@ void assign_callback_on_gpio_up(int pin, c_fct_ptr callback, bool one_shot)
     create_thread_if_not_running();
 
     if(!gpios.count(pin))
+    {
         gpios[pin] = GPIO(pin, digitalRead(pin));
+        get_backend()->watch(pin);
+        if(pin >= 0 && pin < MAX_PINS)
+            dispatched_pins[pin] = true;
+    }
 
     gpios[pin].add_attached_on_gpio_up(_callback(callback), one_shot);
 
@@ -173,7 +325,7 @@ void assign_callback_on_gpio_up(int pin, c_fct_ptr callback, bool one_shot)
 
 void remove_callbacks_on_gpio_change(int pin)
 {
-    main_mutex.lock();
+    std::lock_guard<std::mutex> lock(main_mutex);
 
     if(!gpios.count(pin))
     {
@@ -182,12 +334,11 @@ void remove_callbacks_on_gpio_change(int pin)
     }
 
     gpios[pin].clean_on_gpio_change();
-    main_mutex.unlock();
 }
 
 void remove_callbacks_on_gpio_down(int pin)
 {
-    main_mutex.lock();
+    std::lock_guard<std::mutex> lock(main_mutex);
 
     if(!gpios.count(pin))
     {
@@ -196,12 +347,11 @@ void remove_callbacks_on_gpio_down(int pin)
     }
 
     gpios[pin].clean_on_gpio_down();
-    main_mutex.unlock();
 }
 
 void remove_callbacks_on_gpio_up(int pin)
 {
-    main_mutex.lock();
+    std::lock_guard<std::mutex> lock(main_mutex);
 
     if(!gpios.count(pin))
     {
@@ -210,12 +360,11 @@ void remove_callbacks_on_gpio_up(int pin)
     }
 
     gpios[pin].clean_on_gpio_up();
-    main_mutex.unlock();
 }
 
 void remove_callbacks_on_gpio(int pin)
 {
-    main_mutex.lock();
+    std::lock_guard<std::mutex> lock(main_mutex);
 
     if(!gpios.count(pin))
     {
@@ -224,16 +373,171 @@ void remove_callbacks_on_gpio(int pin)
     }
 
     gpios[pin].clean_callbacks();
-    main_mutex.unlock();
 }
 
 void remove_all_callback()
 {
     main_mutex.lock();
+    for(std::map<int, GPIO>::iterator it = gpios.begin(); it != gpios.end(); it++)
+    {
+        if(it->first >= 0 && it->first < MAX_PINS)
+            dispatched_pins[it->first] = false;
+
+        std::lock_guard<std::mutex> lock(counters_mutex);
+        if(!counters.count(it->first))
+            get_backend()->unwatch(it->first);
+    }
     gpios.clear();
     main_mutex.unlock();
 }
 
+void set_debounce(int pin, int debounce_us)
+{get_backend()->set_debounce(pin, (uint64_t)debounce_us * 1000);}
+
+unsigned long long event_timestamp(int pin)
+{
+    if(pin < 0 || pin >= MAX_PINS)
+        return 0;
+    return timestamps[pin];
+}
+
+const char* backend_name()
+{return get_backend()->name();}
+
+int use_manual_dispatch()
+{
+    std::lock_guard<std::mutex> lock(main_mutex);
+    if(main_thread.joinable())
+    {
+        std::cerr<<"[-] Unable to use manual dispatch: the GPIO thread is already running"<<std::endl;
+        return -1;
+    }
+    manual_dispatch = true;
+    return 0;
+}
+
+int dispatch_events()
+{
+    if(!manual_dispatch)
+    {
+        std::cerr<<"[-] dispatch_events is only available in manual dispatch mode"<<std::endl;
+        return -1;
+    }
+    if(dispatching.exchange(true))
+    {
+        std::cerr<<"[-] dispatch_events is already running in another thread"<<std::endl;
+        return -1;
+    }
+    int dispatched = dispatch_queue();
+    dispatching = false;
+    return dispatched;
+}
+
+int dispatch_queue()
+{
+    int dispatched = 0;
+    GPIOEvent event;
+    std::vector<_callback> callbacks;
+    unsigned long long round;
+
+    while(event_queue.pop(event))
+    {
+        {
+            std::lock_guard<std::mutex> lock(main_mutex);
+
+            std::map<int, GPIO>::iterator it = gpios.find(event.pin);
+            if(it == gpios.end())
+                continue;
+
+            it->second.set_value(event.value);
+            callbacks = it->second.take_callbacks(event.value);
+            round = ++rounds_started;
+        }
+
+        if(event.pin >= 0 && event.pin < MAX_PINS)
+            timestamps[event.pin] = event.timestamp;
+
+        for(const _callback& callback : callbacks)
+            if(callback)
+                callback();
+        rounds_finished = round;
+        dispatched++;
+    }
+
+    return dispatched;
+}
+
+unsigned long long event_overflows()
+{return event_queue.overflows();}
+
+unsigned long long dispatch_rounds_started()
+{
+    std::lock_guard<std::mutex> lock(main_mutex);
+    return rounds_started;
+}
+
+unsigned long long dispatch_rounds_finished()
+{return rounds_finished;}
+
+
+void enable_counter(int pin, int edges)
+{
+    main_mutex.lock();
+    create_thread_if_not_running();
+    main_mutex.unlock();
+
+    {
+        std::lock_guard<std::mutex> lock(counters_mutex);
+        counters[pin] = GPIOCounter(edges);
+    }
+    get_backend()->watch(pin);
+}
+
+void disable_counter(int pin)
+{
+    std::lock_guard<std::mutex> lock(main_mutex);
+    {
+        std::lock_guard<std::mutex> counters_lock(counters_mutex);
+        counters.erase(pin);
+    }
+    if(!gpios.count(pin))
+        get_backend()->unwatch(pin);
+}
+
+void reset_counter(int pin)
+{
+    std::lock_guard<std::mutex> lock(counters_mutex);
+    std::map<int, GPIOCounter>::iterator it = counters.find(pin);
+    if(it != counters.end())
+        it->second.reset();
+}
+
+unsigned long long counter_count(int pin)
+{
+    std::lock_guard<std::mutex> lock(counters_mutex);
+    std::map<int, GPIOCounter>::iterator it = counters.find(pin);
+    return it == counters.end() ? 0 : it->second.get_count();
+}
+
+unsigned long long counter_period(int pin)
+{
+    std::lock_guard<std::mutex> lock(counters_mutex);
+    std::map<int, GPIOCounter>::iterator it = counters.find(pin);
+    return it == counters.end() ? 0 : it->second.get_period();
+}
+
+double counter_frequency(int pin)
+{
+    std::lock_guard<std::mutex> lock(counters_mutex);
+    std::map<int, GPIOCounter>::iterator it = counters.find(pin);
+    return it == counters.end() ? 0. : it->second.get_frequency(monotonic_ns());
+}
+
+#ifdef GPIO_SIMULATION
+void simulated_chip_set_value(int pin, int value)
+{simulated_chip().set_value(pin, value);}
+#endif
+
 void init()
 {
     wiringPiSetupGpio();
@@ -243,7 +547,11 @@ void join()
 {
 	std::cout<<"[...] Stopping GPIO thread"<<std::endl;
 	is_running = false;
+	get_backend()->wake_up();
 	if(main_thread.joinable())
 		main_thread.join();
+	notify_dispatch();
+	if(dispatch_thread.joinable())
+		dispatch_thread.join();
 	std::cout<<"[+++] GPIO thread joined"<<std::endl;
 }
@@ -2,7 +2,9 @@
 
 
 import ctypes
-from encapsulate_callback import encapsulate_callback
+from array import array
+from threading import Lock
+from encapsulate_callback import register_callback, Dispatcher
 
 lib_gpio = ctypes.cdll.LoadLibrary(LIBNAME)
 
@@ -15,6 +17,14 @@ lib_gpio.analog_read.restype    = ctypes.c_int
 lib_gpio.analog_write.restype = None
 lib_gpio.pwm_write.restype = None
 
+lib_gpio.read_pins.restype = ctypes.c_ulonglong
+lib_gpio.read_pins.argtypes = [ctypes.POINTER(ctypes.c_int), ctypes.c_int]
+lib_gpio.read_pins_values.restype = None
+lib_gpio.read_pins_values.argtypes = [ctypes.POINTER(ctypes.c_int), ctypes.c_int,
+                                      ctypes.POINTER(ctypes.c_ubyte)]
+lib_gpio.write_pins.restype = None
+lib_gpio.write_pins.argtypes = [ctypes.POINTER(ctypes.c_int), ctypes.c_int, ctypes.c_ulonglong]
+
 lib_gpio.assign_callback_on_gpio_change.restype = None
 lib_gpio.assign_callback_on_gpio_down.restype = None
 lib_gpio.assign_callback_on_gpio_up.restype = None
@@ -25,6 +35,23 @@ lib_gpio.remove_callbacks_on_gpio_up.restype = None
 lib_gpio.remove_callbacks_on_gpio.restype = None
 lib_gpio.remove_all_callback.restype = None
 
+lib_gpio.set_debounce.restype = None
+lib_gpio.event_timestamp.restype = ctypes.c_ulonglong
+lib_gpio.backend_name.restype = ctypes.c_char_p
+
+lib_gpio.use_manual_dispatch.restype = ctypes.c_int
+lib_gpio.dispatch_events.restype = ctypes.c_int
+lib_gpio.event_overflows.restype = ctypes.c_ulonglong
+lib_gpio.dispatch_rounds_started.restype = ctypes.c_ulonglong
+lib_gpio.dispatch_rounds_finished.restype = ctypes.c_ulonglong
+
+lib_gpio.enable_counter.restype = None
+lib_gpio.disable_counter.restype = None
+lib_gpio.reset_counter.restype = None
+lib_gpio.counter_count.restype = ctypes.c_ulonglong
+lib_gpio.counter_period.restype = ctypes.c_ulonglong
+lib_gpio.counter_frequency.restype = ctypes.c_double
+
 lib_gpio.init.restype = None
 lib_gpio.join.restype = None
 
@@ -38,6 +65,11 @@ PULL_DOWN = 1
 PULL_UP = 2
 pull_up_down_modes = [NO_PULL_UP_DOWN, PULL_DOWN, PULL_UP]
 
+COUNT_RISING = 1
+COUNT_FALLING = 2
+COUNT_BOTH = 3
+counter_modes = [COUNT_RISING, COUNT_FALLING, COUNT_BOTH]
+
 
 def gpio_index_of_wpi_pin(index):
     assert (isinstance(index, int))
@@ -83,50 +115,216 @@ def pwm_write(id, val):
     lib_gpio.pwm_write(ctypes.c_int(id), ctypes.c_int(val))
 
 
-def assign_callback_on_gpio_change(id, callback, one_shot = False):
+class PinSet:
+    """
+    A set of pins (BCM indexes, see gpio_index_of_wpi_pin) read or written
+    in a single native call. The pins are checked and converted once, here.
+    Values are packed in an integer: bit i is the value of pins[i].
+    """
+    def __init__(self, pins):
+        self.pins = list(pins)
+        assert (all(isinstance(id, int) for id in self.pins))
+        assert (len(self.pins) <= 64)
+
+        self.count = len(self.pins)
+        self.c_pins = (ctypes.c_int * self.count)(*self.pins)
+        self.values = array('B', bytes(self.count))
+        self.c_values = (ctypes.c_ubyte * self.count).from_buffer(self.values)
+
+    def read(self):
+        return lib_gpio.read_pins(self.c_pins, self.count)
+
+    def read_values(self):
+        """
+        returns an array of the values of the pins (the same array is reused by every call)
+        """
+        lib_gpio.read_pins_values(self.c_pins, self.count, self.c_values)
+        return self.values
+
+    def write(self, values):
+        lib_gpio.write_pins(self.c_pins, self.count, values)
+
+    def bit(self, id):
+        """
+        mask of the bit of the pin in the packed values
+        """
+        return 1 << self.pins.index(id)
+
+def digital_read_pins(ids):
+    return PinSet(ids).read()
+
+def digital_write_pins(ids, values):
+    PinSet(ids).write(values)
+
+
+# handles of the callbacks given to the C code, by pin and kind of edge, so
+# that they are released when the C code removes them
+callback_handles = {}
+callback_handles_mutex = Lock()
+#a removed callback may still be called by the dispatch round in progress: it
+#is freed once the round has returned
+dispatcher = Dispatcher(lib_gpio.dispatch_rounds_started, lib_gpio.dispatch_rounds_finished)
+
+def private_assign(assign, id, kind, callback, one_shot):
     assert (isinstance(id, int))
     assert (callable(callback))
     assert (isinstance(one_shot, bool))
 
-    lib_gpio.assign_callback_on_gpio_change(ctypes.c_int(id), encapsulate_callback(callback), ctypes.c_bool(one_shot))
+    handle = register_callback(callback, one_shot, dispatcher)
+    with callback_handles_mutex:
+        handles = [h for h in callback_handles.get((id, kind), []) if not h.released]
+        handles.append(handle)
+        callback_handles[(id, kind)] = handles
+    assign(ctypes.c_int(id), handle.trampoline, ctypes.c_bool(one_shot))
+    return handle
 
-def assign_callback_on_gpio_down(id, callback, one_shot = False):
-    assert (isinstance(id, int))
-    assert (callable(callback))
-    assert (isinstance(one_shot, bool))
+def private_release(keys):
+    with callback_handles_mutex:
+        for key in keys:
+            for handle in callback_handles.pop(key, []):
+                handle.release()
 
-    lib_gpio.assign_callback_on_gpio_down(ctypes.c_int(id), encapsulate_callback(callback), ctypes.c_bool(one_shot))
+def assign_callback_on_gpio_change(id, callback, one_shot = False):
+    """
+    returns the encapsulate_callback.CallbackHandle of the callback
+    """
+    return private_assign(lib_gpio.assign_callback_on_gpio_change, id, 'change', callback, one_shot)
 
-def assign_callback_on_gpio_up(id, callback, one_shot = False):
-    assert (isinstance(id, int))
-    assert (callable(callback))
-    assert (isinstance(one_shot, bool))
+def assign_callback_on_gpio_down(id, callback, one_shot = False):
+    return private_assign(lib_gpio.assign_callback_on_gpio_down, id, 'down', callback, one_shot)
 
-    lib_gpio.assign_callback_on_gpio_up(ctypes.c_int(id), encapsulate_callback(callback), ctypes.c_bool(one_shot))
+def assign_callback_on_gpio_up(id, callback, one_shot = False):
+    return private_assign(lib_gpio.assign_callback_on_gpio_up, id, 'up', callback, one_shot)
 
 
 def remove_callbacks_on_gpio_change(id):
     assert (isinstance(id, int))
 
     lib_gpio.remove_callbacks_on_gpio_change(ctypes.c_int(id))
+    private_release([(id, 'change')])
 
 def remove_callbacks_on_gpio_down(id):
     assert (isinstance(id, int))
 
     lib_gpio.remove_callbacks_on_gpio_down(ctypes.c_int(id))
+    private_release([(id, 'down')])
 
 def remove_callbacks_on_gpio_up(id):
     assert (isinstance(id, int))
 
     lib_gpio.remove_callbacks_on_gpio_up(ctypes.c_int(id))
+    private_release([(id, 'up')])
 
 def remove_callbacks_on_gpio(id):
     assert (isinstance(id, int))
 
     lib_gpio.remove_callbacks_on_gpio(ctypes.c_int(id))
+    private_release([(id, 'change'), (id, 'down'), (id, 'up')])
 
 def remove_all_callback():
-    lib_gpio.remove_all_callback(ctypes.c_int(id))
+    lib_gpio.remove_all_callback()
+    with callback_handles_mutex:
+        keys = list(callback_handles)
+    private_release(keys)
+
+
+def set_debounce(id, microseconds):
+    """
+    the edges of the pin closer than microseconds to the previous one are ignored
+    """
+    assert (isinstance(id, int))
+    assert (isinstance(microseconds, int))
+
+    lib_gpio.set_debounce(ctypes.c_int(id), ctypes.c_int(microseconds))
+
+def event_timestamp(id):
+    """
+    timestamp in ns (CLOCK_MONOTONIC) of the last edge of the pin, given by the
+    kernel when the pin is watched with line events
+    """
+    assert (isinstance(id, int))
+    return int(lib_gpio.event_timestamp(ctypes.c_int(id)))
+
+def backend_name():
+    """
+    "line events", "polling" or "simulated chip"
+    """
+    return lib_gpio.backend_name().decode()
+
+def use_manual_dispatch():
+    """
+    the callbacks are not called by the dispatch thread anymore, but by
+    dispatch_events; must be called before assigning the first callback or
+    enabling the first counter (the GPIO thread must not be running)
+    """
+    if lib_gpio.use_manual_dispatch() < 0:
+        raise Exception("Cannot use manual dispatch: the GPIO thread is already running")
+
+def dispatch_events():
+    """
+    calls the callbacks of the edges received since the last call, in the
+    calling thread; returns the number of edges
+    only in manual dispatch mode, and from one thread at a time (the event
+    queue has a single consumer): returns -1 otherwise
+    """
+    return int(lib_gpio.dispatch_events())
+
+def event_overflows():
+    """
+    number of edges lost because the event queue was full
+    """
+    return int(lib_gpio.event_overflows())
+
+def simulated_chip_set_value(id, val):
+    """
+    only with the library built by make sim: sets the value of a pin of the
+    simulated GPIO chip
+    """
+    assert (isinstance(id, int))
+    assert (isinstance(val, int))
+
+    lib_gpio.simulated_chip_set_value(ctypes.c_int(id), ctypes.c_int(val))
+
+
+def enable_counter(id, edges = COUNT_RISING):
+    """
+    the edges of the pin are counted natively, without any python callback
+    """
+    assert (isinstance(id, int))
+    assert (edges in counter_modes)
+
+    lib_gpio.enable_counter(ctypes.c_int(id), ctypes.c_int(edges))
+
+def disable_counter(id):
+    assert (isinstance(id, int))
+
+    lib_gpio.disable_counter(ctypes.c_int(id))
+
+def reset_counter(id):
+    assert (isinstance(id, int))
+
+    lib_gpio.reset_counter(ctypes.c_int(id))
+
+def counter_count(id):
+    """
+    number of edges counted since enable_counter or reset_counter
+    """
+    assert (isinstance(id, int))
+    return int(lib_gpio.counter_count(ctypes.c_int(id)))
+
+def counter_period(id):
+    """
+    time in seconds between the last two counted edges
+    """
+    assert (isinstance(id, int))
+    return lib_gpio.counter_period(ctypes.c_int(id)) / 1e9
+
+def counter_frequency(id):
+    """
+    frequency in Hz of the counted edges, averaged on the last ones
+    """
+    assert (isinstance(id, int))
+    return float(lib_gpio.counter_frequency(ctypes.c_int(id)))
 
 
 def init():
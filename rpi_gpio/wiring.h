@@ -0,0 +1,29 @@
+#ifndef WIRING_H
+#define WIRING_H
+
+
+#ifdef GPIO_SIMULATION
+
+// Without wiringPi, the wiringPi functions used by the library act on the
+// simulated GPIO chip (see gpio_backend.cpp)
+int wiringPiSetupGpio();
+int wpiPinToGpio(int wpi);
+int getAlt(int pin);
+
+void pinMode(int pin, int mode);
+void pullUpDnControl(int pin, int mode);
+
+int digitalRead(int pin);
+void digitalWrite(int pin, int value);
+int analogRead(int pin);
+void analogWrite(int pin, int value);
+void pwmWrite(int pin, int value);
+
+#else
+
+#include "wiringPi.h"
+
+#endif
+
+
+#endif